@@ -0,0 +1,233 @@
+"""
+Pure-Python client for the ADB host protocol.
+
+Talks directly to the adb server (localhost:5037 by default) instead of spawning the `adb`
+binary for every command. Supported services: host:devices, host:transport, shell (v2
+with exit codes, falling back to v1), exec (binary stdout, like exec-out), sync pull and
+port forwarding.
+
+Every request is a 4-hex-digit length followed by the service name; the server answers
+OKAY, or FAIL followed by a length-prefixed message.
+"""
+import socket
+import struct
+
+# shell,v2 packet ids
+SHELL_STDOUT = 1
+SHELL_STDERR = 2
+SHELL_EXIT = 3
+
+SYNC_CHUNK = 64 * 1024
+
+
+class AdbClientError(Exception):
+    """Raised when the adb server cannot be reached or refuses a request."""
+
+
+class AdbClient:
+    """A connection factory for the adb server. Each request opens its own short-lived socket."""
+
+    def __init__(self, host="127.0.0.1", port=5037, timeout=10):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._shell_v2 = {}
+
+    def _connect(self):
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        except OSError as e:
+            raise AdbClientError(f"Cannot connect to adb server at {self.host}:{self.port}: {e}")
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    @staticmethod
+    def _read_exactly(sock, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise AdbClientError("adb server closed the connection")
+            data += chunk
+        return bytes(data)
+
+    @staticmethod
+    def _read_all(sock):
+        chunks = []
+        while True:
+            chunk = sock.recv(SYNC_CHUNK)
+            if not chunk:
+                return b"".join(chunks)
+            chunks.append(chunk)
+
+    def _read_string(self, sock):
+        length = int(self._read_exactly(sock, 4), 16)
+        return self._read_exactly(sock, length).decode("utf-8", errors="replace")
+
+    def _send(self, sock, request):
+        payload = request.encode("utf-8")
+        sock.sendall(b"%04x" % len(payload) + payload)
+        status = self._read_exactly(sock, 4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            raise AdbClientError(f"{request}: {self._read_string(sock)}")
+        raise AdbClientError(f"{request}: unexpected status {status!r}")
+
+    def _transport(self, serial):
+        """Open a socket switched to the device transport."""
+        sock = self._connect()
+        try:
+            self._send(sock, f"host:transport:{serial}")
+        except (OSError, AdbClientError):
+            sock.close()
+            raise
+        return sock
+
+    def _open(self, serial, service):
+        """Open a socket switched to the device transport and connected to `service`."""
+        sock = self._transport(serial)
+        try:
+            self._send(sock, service)
+        except (OSError, AdbClientError):
+            sock.close()
+            raise
+        return sock
+
+    def devices(self):
+        """Return [(serial, state), ...] as reported by `adb devices`."""
+        sock = self._connect()
+        try:
+            self._send(sock, "host:devices")
+            listing = self._read_string(sock)
+        except OSError as e:
+            raise AdbClientError(f"host:devices failed: {e}")
+        finally:
+            sock.close()
+        devices = []
+        for line in listing.splitlines():
+            parts = line.split()
+            if len(parts) >= 2:
+                devices.append((parts[0], parts[1]))
+        return devices
+
+    def get_state(self, serial):
+        """Return the device state ("device", "offline", ...), or None if the device is not connected."""
+        for device, state in self.devices():
+            if device == serial:
+                return state
+        return None
+
+    def features(self, serial):
+        """Return the set of adb features supported by both the device and the server."""
+        sock = self._connect()
+        try:
+            self._send(sock, f"host-serial:{serial}:features")
+            return set(self._read_string(sock).split(","))
+        except OSError as e:
+            raise AdbClientError(f"features failed: {e}")
+        finally:
+            sock.close()
+
+    def shell(self, serial, command):
+        """Run a shell command and return (returncode, output) with stdout and stderr combined."""
+        if serial not in self._shell_v2:
+            # Devices before Android 7 have no shell protocol v2; a failed query is not cached
+            self._shell_v2[serial] = "shell_v2" in self.features(serial)
+        if self._shell_v2[serial]:
+            sock = self._open(serial, f"shell,v2,raw:{command}")
+            try:
+                return self._read_shell_v2(sock)
+            except OSError as e:
+                raise AdbClientError(f"shell failed: {e}")
+            finally:
+                sock.close()
+        sentinel = "__APPAGENT_RC__"
+        sock = self._open(serial, f"shell:{command}; echo; echo {sentinel}$?")
+        try:
+            output = self._read_all(sock).decode("utf-8", errors="replace")
+        except OSError as e:
+            raise AdbClientError(f"shell failed: {e}")
+        finally:
+            sock.close()
+        output, _, returncode = output.rpartition(sentinel)
+        return int(returncode.strip() or 1), output.strip()
+
+    def _read_shell_v2(self, sock):
+        output = bytearray()
+        while True:
+            try:
+                packet_id, length = struct.unpack("<BI", self._read_exactly(sock, 5))
+            except AdbClientError:
+                raise AdbClientError("shell exited without a status")
+            data = self._read_exactly(sock, length) if length else b""
+            if packet_id in (SHELL_STDOUT, SHELL_STDERR):
+                output += data
+            elif packet_id == SHELL_EXIT:
+                returncode = data[0] if data else 0
+                return returncode, output.decode("utf-8", errors="replace").strip()
+
+    def exec_out(self, serial, command):
+        """Run a command with the exec service and return its raw stdout bytes."""
+        sock = self._open(serial, f"exec:{command}")
+        try:
+            return self._read_all(sock)
+        except OSError as e:
+            raise AdbClientError(f"exec failed: {e}")
+        finally:
+            sock.close()
+
+    def pull(self, serial, remote_path, local_path=None):
+        """Read a device file with the sync service. Returns its bytes and writes them to local_path if given."""
+        sock = self._open(serial, "sync:")
+        try:
+            path = remote_path.encode("utf-8")
+            sock.sendall(b"RECV" + struct.pack("<I", len(path)) + path)
+            chunks = []
+            while True:
+                response = self._read_exactly(sock, 8)
+                kind, length = response[:4], struct.unpack("<I", response[4:])[0]
+                if kind == b"DATA":
+                    chunks.append(self._read_exactly(sock, length))
+                elif kind == b"DONE":
+                    break
+                elif kind == b"FAIL":
+                    raise AdbClientError(f"pull {remote_path}: {self._read_exactly(sock, length).decode('utf-8')}")
+                else:
+                    raise AdbClientError(f"pull {remote_path}: unexpected sync response {kind!r}")
+            sock.sendall(b"QUIT" + struct.pack("<I", 0))
+        except OSError as e:
+            raise AdbClientError(f"pull failed: {e}")
+        finally:
+            sock.close()
+        data = b"".join(chunks)
+        if local_path is not None:
+            with open(local_path, "wb") as f:
+                f.write(data)
+        return data
+
+    def forward(self, serial, local, remote):
+        """Set up port forwarding (e.g. "tcp:0", "tcp:9008"). Returns the local port actually bound."""
+        sock = self._connect()
+        try:
+            self._send(sock, f"host-serial:{serial}:forward:{local};{remote}")
+            status = self._read_exactly(sock, 4)
+            if status == b"FAIL":
+                raise AdbClientError(f"forward failed: {self._read_string(sock)}")
+            if local == "tcp:0":
+                return int(self._read_string(sock))
+            return int(local.split(":")[1])
+        except OSError as e:
+            raise AdbClientError(f"forward failed: {e}")
+        finally:
+            sock.close()
+
+    def remove_forward(self, serial, local):
+        """Remove a port forward set up with forward() (e.g. "tcp:27183")."""
+        sock = self._connect()
+        try:
+            self._send(sock, f"host-serial:{serial}:killforward:{local}")
+        except OSError as e:
+            raise AdbClientError(f"killforward failed: {e}")
+        finally:
+            sock.close()
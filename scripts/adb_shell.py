@@ -0,0 +1,151 @@
+"""
+Persistent ADB shell sessions.
+
+Instead of starting a new `adb` client process for every command, a session keeps
+one `adb -s <serial> shell` process open and writes commands to its stdin. Every
+command is followed by a sentinel line carrying the exit status, so responses can
+be framed without a PTY.
+"""
+import queue
+import subprocess
+import sys
+import threading
+import uuid
+
+from logging_controller import get_logger
+
+try:
+    logger = get_logger()
+except Exception as e:
+    print(f"ERROR: Failed to load logger configuration: {e}")
+    sys.exit(1)
+
+
+class AdbShellError(Exception):
+    """Raised when a persistent shell session dies or stops responding."""
+
+
+class AdbShellResultLost(AdbShellError):
+    """
+    Raised when a command was written to the session but its result never arrived (timeout or the shell
+    exited). The command may already have run on the device, so it must not be retried.
+    """
+
+
+class AdbShellSession:
+    """A single long-lived `adb shell` process with framed command/response handling."""
+
+    def __init__(self, device, timeout=10):
+        self.device = device
+        self.timeout = timeout
+        self.process = None
+        self._lines = queue.Queue()
+        self._lock = threading.Lock()
+        self._sentinel = f"__APPAGENT_{uuid.uuid4().hex}__"
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """Spawn the adb shell process and its stdout reader thread."""
+        try:
+            self.process = subprocess.Popen(["adb", "-s", self.device, "shell"], stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
+        except OSError as e:
+            self.process = None
+            raise AdbShellError(f"Failed to start adb shell for {self.device}: {e}")
+        self._lines = queue.Queue()
+        reader = threading.Thread(target=self._read_stdout, args=(self.process, self._lines), daemon=True)
+        reader.start()
+        # Route stderr of every following command into stdout so it is framed as well
+        self._write("exec 2>&1")
+
+    @staticmethod
+    def _read_stdout(process, lines):
+        for line in process.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    def _write(self, text):
+        try:
+            self.process.stdin.write(text + "\n")
+            self.process.stdin.flush()
+        except (OSError, ValueError) as e:
+            raise AdbShellError(f"adb shell for {self.device} is not writable: {e}")
+
+    def run(self, command, timeout=None):
+        """
+        Run a command on the device shell.
+
+        Returns:
+            (returncode, output) where output has surrounding whitespace stripped.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            if not self.alive:
+                self.start()
+            self._write(f"{command}; __rc=$?; echo; echo {self._sentinel} $__rc")
+            output = []
+            while True:
+                try:
+                    line = self._lines.get(timeout=timeout)
+                except queue.Empty:
+                    self.close()
+                    raise AdbShellResultLost(f"Timed out after {timeout}s waiting for: {command}")
+                if line is None:
+                    self.close()
+                    raise AdbShellResultLost(f"adb shell for {self.device} exited while running: {command}")
+                if line.startswith(self._sentinel):
+                    returncode = int(line.split()[-1])
+                    return returncode, "".join(output).strip()
+                output.append(line)
+
+    def close(self):
+        """Terminate the shell process."""
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except Exception:
+            pass
+        try:
+            self.process.terminate()
+            self.process.wait(timeout=2)
+        except Exception:
+            try:
+                self.process.kill()
+            except Exception:
+                pass
+        self.process = None
+
+
+class AdbShellPool:
+    """
+    A small pool of persistent shell sessions for one device.
+    Concurrent callers each get their own session, so a slow command does not block the others.
+    """
+
+    def __init__(self, device, size=1, timeout=10):
+        self.device = device
+        self.sessions = [AdbShellSession(device, timeout) for _ in range(max(1, size))]
+        self._idle = queue.Queue()
+        for session in self.sessions:
+            self._idle.put(session)
+
+    def run(self, command, timeout=None):
+        """Run a shell command and return its output, or "ERROR" on a non-zero exit status."""
+        session = self._idle.get()
+        try:
+            returncode, output = session.run(command, timeout)
+        finally:
+            self._idle.put(session)
+        if returncode == 0:
+            return output
+        logger.error(f"Command execution failed: adb -s {self.device} shell {command}")
+        logger.error(output)
+        return "ERROR"
+
+    def close(self):
+        for session in self.sessions:
+            session.close()
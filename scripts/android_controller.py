@@ -1,11 +1,20 @@
 """
 Android-specific device controller implementation using ADB.
 """
+import base64
 import os
+import re
 import subprocess
 import sys
+import time
+import xml.etree.ElementTree as ET
 
+from adb_client import AdbClient, AdbClientError
+from adb_shell import AdbShellPool, AdbShellError, AdbShellResultLost
 from config import load_config
+from frame import Frame
+from hierarchy_server import AndroidHierarchyServer
+from ui_hierarchy import UIHierarchy
 from logging_controller import get_logger
 
 configs = load_config()
@@ -16,6 +25,15 @@ except Exception as e:
     print(f"ERROR: Failed to load logger configuration: {e}")
     sys.exit(1)
 
+# ADBKeyboard (https://github.com/senzhk/ADBKeyBoard), used by ANDROID_TEXT_INPUT "ime"
+ADB_KEYBOARD_IME = "com.android.adbkeyboard/.AdbIME"
+IME_CLEAR_COMMAND = "am broadcast -a ADB_CLEAR_TEXT"
+
+
+def ime_text_command(input_str):
+    """Broadcast that makes ADBKeyboard commit input_str (any Unicode text) to the focused field."""
+    return "am broadcast -a ADB_INPUT_B64 --es msg " + base64.b64encode(input_str.encode("utf-8")).decode("ascii")
+
 
 def execute_adb(adb_command):
     """Execute an ADB command and return the result."""
@@ -27,12 +45,57 @@ def execute_adb(adb_command):
     return "ERROR"
 
 
+def execute_adb_binary(adb_args):
+    """Execute an ADB command given as an argument list and return its raw stdout bytes, or None on failure."""
+    result = subprocess.run(adb_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode == 0:
+        return result.stdout
+    logger.error(f"Command execution failed: {' '.join(adb_args)}")
+    logger.error(result.stderr.decode("utf-8", errors="replace"))
+    return None
+
+
+def create_adb_client():
+    """Return an AdbClient for the configured adb server when ADB_TRANSPORT is "native", else None."""
+    if configs.get("ADB_TRANSPORT", "subprocess").lower() != "native":
+        return None
+    return AdbClient(configs.get("ADB_SERVER_HOST", "127.0.0.1"), configs.get("ADB_SERVER_PORT", 5037))
+
+
+def get_device_state(device, client=None):
+    """Return the adb state of a device ("device", "offline", "unauthorized", ...) or None if it is not connected."""
+    if client is not None:
+        try:
+            return client.get_state(device)
+        except AdbClientError:
+            return None
+    # Polled while a device is gone, so failures are expected and not logged
+    result = subprocess.run(["adb", "-s", device, "get-state"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def reconnect_device(device):
+    """Ask adb to bring a device back: `adb connect` for network devices, `adb reconnect offline` for USB ones."""
+    if ":" in device:
+        command = ["adb", "connect", device]
+    else:
+        command = ["adb", "reconnect", "offline"]
+    subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30)
+
+
 class AndroidController:
     """Android device controller using ADB commands."""
     
     @staticmethod
     def list_all_devices():
         """List all connected Android devices."""
+        client = create_adb_client()
+        if client is not None:
+            try:
+                return [serial for serial, state in client.devices() if state == "device"]
+            except AdbClientError as e:
+                logger.warning(f"adb server query failed, falling back to adb subprocess: {e}")
         adb_command = "adb devices"
         device_list = []
         result = execute_adb(adb_command)
@@ -47,97 +110,359 @@ class AndroidController:
         self.device = device
         self.screenshot_dir = configs["ANDROID_SCREENSHOT_DIR"]
         self.xml_dir = configs["ANDROID_XML_DIR"]
+        self.capture_mode = configs.get("SCREENSHOT_CAPTURE_MODE", "pull").lower()
+        self.xml_capture_mode = configs.get("XML_CAPTURE_MODE", "pull").lower()
+        self.hierarchy_server = None
+        if configs.get("HIERARCHY_BACKEND", "uiautomator").lower() == "server":
+            self.hierarchy_server = AndroidHierarchyServer(self, configs.get("HIERARCHY_SERVER_PORT", 9008),
+                                                           configs.get("HIERARCHY_SERVER_START_COMMAND"))
+        self.adb_client = create_adb_client()
+        self.shell_pool = None
+        if configs.get("ADB_PERSISTENT_SHELL", False):
+            self.shell_pool = AdbShellPool(device, size=configs.get("ADB_SHELL_POOL_SIZE", 1),
+                                           timeout=configs.get("ADB_SHELL_TIMEOUT", 10))
+        self.text_input = configs.get("ANDROID_TEXT_INPUT", "input").lower()
+        self._previous_ime = None
+        self._ime_ready = False
         self.width, self.height = self.get_device_size()
         self.backslash = "\\"
-    
+
+    def __del__(self):
+        """Cleanup: close persistent shell sessions. Device I/O (restoring the keyboard) is left to close()."""
+        if getattr(self, "shell_pool", None) is not None:
+            self.shell_pool.close()
+
+    def close(self):
+        """Restore the keyboard replaced by ADBKeyboard, close persistent shell sessions and the hierarchy server."""
+        if getattr(self, "_previous_ime", None):
+            try:
+                self.shell(f"ime set {self._previous_ime}")
+            except Exception as e:
+                logger.debug(f"Failed to restore input method {self._previous_ime}: {e}")
+            self._previous_ime = None
+            self._ime_ready = False
+        if getattr(self, "shell_pool", None) is not None:
+            self.shell_pool.close()
+            self.shell_pool = None
+        if getattr(self, "hierarchy_server", None) is not None:
+            self.hierarchy_server.close()
+
+    def get_state(self):
+        """Return the adb state of this device, or None if it is not connected."""
+        return get_device_state(self.device, self.adb_client)
+
+    def reconnect(self):
+        """Try to bring the device back after it dropped off adb."""
+        reconnect_device(self.device)
+
+    def reset_connections(self):
+        """
+        Drop per-connection state after the device reconnected: shell sessions are restarted on next use and
+        the hierarchy server is forwarded again. Cached device properties are kept.
+        """
+        if self.shell_pool is not None:
+            for session in self.shell_pool.sessions:
+                session.close()
+        if self.hierarchy_server is not None:
+            self.hierarchy_server.close()
+            self.hierarchy_server.reset()
+
+    def shell(self, command):
+        """
+        Run a command on the device shell.
+        Uses the persistent shell session when enabled, then the native adb client, and falls back to a
+        one-off adb process otherwise. A command that reached the session but timed out is not run again
+        (a tap or text input would be repeated); it returns "ERROR".
+        """
+        if self.shell_pool is not None:
+            try:
+                return self.shell_pool.run(command)
+            except AdbShellResultLost as e:
+                logger.error(f"Persistent adb shell lost the result of a command: {e}")
+                return "ERROR"
+            except AdbShellError as e:
+                logger.warning(f"Persistent adb shell failed, falling back to adb subprocess: {e}")
+        if self.adb_client is not None:
+            try:
+                returncode, output = self.adb_client.shell(self.device, command)
+                if returncode == 0:
+                    return output
+                logger.error(f"Command execution failed: {command}")
+                logger.error(output)
+                return "ERROR"
+            except AdbClientError as e:
+                logger.warning(f"adb server request failed, falling back to adb subprocess: {e}")
+        return execute_adb(f"adb -s {self.device} shell {command}")
+
+    def exec_out(self, command):
+        """Run a device command over `adb exec-out` and return its raw stdout bytes, or None on failure."""
+        if self.adb_client is not None:
+            try:
+                return self.adb_client.exec_out(self.device, command)
+            except AdbClientError as e:
+                logger.warning(f"adb server request failed, falling back to adb subprocess: {e}")
+        return execute_adb_binary(["adb", "-s", self.device, "exec-out"] + command.split())
+
+    def pull(self, remote_path, local_path):
+        """Copy a file from the device to local_path. Returns local_path, or "ERROR" on failure."""
+        if self.adb_client is not None:
+            try:
+                self.adb_client.pull(self.device, remote_path, local_path)
+                return local_path
+            except AdbClientError as e:
+                logger.warning(f"adb server request failed, falling back to adb subprocess: {e}")
+        result = execute_adb(f"adb -s {self.device} pull {remote_path} {local_path}")
+        return local_path if result != "ERROR" else result
+
+    def forward(self, device_port):
+        """Forward a free local TCP port to device_port and return the local port, or None on failure."""
+        if self.adb_client is not None:
+            try:
+                return self.adb_client.forward(self.device, "tcp:0", f"tcp:{device_port}")
+            except AdbClientError as e:
+                logger.warning(f"adb server request failed, falling back to adb subprocess: {e}")
+        result = execute_adb(f"adb -s {self.device} forward tcp:0 tcp:{device_port}")
+        if result == "ERROR" or not result.strip().isdigit():
+            return None
+        return int(result.strip())
+
+    def remove_forward(self, local_port):
+        """Remove the forward of local_port set up by forward()."""
+        if self.adb_client is not None:
+            try:
+                self.adb_client.remove_forward(self.device, f"tcp:{local_port}")
+                return
+            except AdbClientError as e:
+                logger.warning(f"adb server request failed, falling back to adb subprocess: {e}")
+        execute_adb(f"adb -s {self.device} forward --remove tcp:{local_port}")
+
     def get_device_size(self):
-        """Get Android device screen dimensions."""
-        adb_command = f"adb -s {self.device} shell wm size"
-        result = execute_adb(adb_command)
+        """Get Android device screen dimensions (cached after the first successful query)."""
+        if getattr(self, "width", 0) and getattr(self, "height", 0):
+            return self.width, self.height
+        result = self.shell("wm size")
         if result != "ERROR":
             return map(int, result.split(": ")[1].split("x"))
         return 0, 0
-    
+
+    def get_bbox_space_size(self):
+        """Element bounds are in screenshot pixels, so they need no scaling."""
+        return None
+
     def get_screenshot(self, prefix, save_dir):
         """Capture and pull screenshot from Android device."""
-        cap_command = f"adb -s {self.device} shell screencap -p " \
-                      f"{os.path.join(self.screenshot_dir, prefix + '.png').replace(self.backslash, '/')}"
-        pull_command = f"adb -s {self.device} pull " \
-                       f"{os.path.join(self.screenshot_dir, prefix + '.png').replace(self.backslash, '/')} " \
-                       f"{os.path.join(save_dir, prefix + '.png')}"
-        result = execute_adb(cap_command)
+        remote_path = os.path.join(self.screenshot_dir, prefix + '.png').replace(self.backslash, '/')
+        result = self.shell(f"screencap -p {remote_path}")
         if result != "ERROR":
-            result = execute_adb(pull_command)
-            if result != "ERROR":
-                return os.path.join(save_dir, prefix + ".png")
-            return result
+            return self.pull(remote_path, os.path.join(save_dir, prefix + ".png"))
         return result
     
+    def get_frame(self, prefix, save_dir):
+        """
+        Capture a screenshot as an in-memory Frame.
+        In "exec-out" mode the PNG is streamed straight from screencap, skipping the device storage and adb pull;
+        "raw" mode streams the uncompressed framebuffer instead, so no PNG is encoded or decoded at all.
+        The copy in save_dir is then written in the background (or not at all if SAVE_SCREENSHOTS is off).
+        """
+        try:
+            if self.capture_mode == "pull":
+                path = self.get_screenshot(prefix, save_dir)
+                if path == "ERROR":
+                    return path
+                return Frame.from_path(path)
+            if self.capture_mode == "raw":
+                data = self.exec_out("screencap")
+                if not data:
+                    return "ERROR"
+                frame = Frame.from_raw(data)
+            else:
+                data = self.exec_out("screencap -p")
+                if not data:
+                    return "ERROR"
+                frame = Frame.from_png(data)
+        except ValueError as e:
+            logger.error(f"Failed to decode screenshot: {e}")
+            return "ERROR"
+        if configs.get("SAVE_SCREENSHOTS", True):
+            frame.save_async(os.path.join(save_dir, prefix + ".png"))
+        return frame
+
+    def get_window_state(self):
+        """Return the focused window and app as reported by the window manager, or None on failure."""
+        # Filter on the device: the full window dump is hundreds of kilobytes
+        result = self.shell("dumpsys window | grep -E 'mCurrentFocus|mFocusedApp'")
+        if result == "ERROR":
+            return None
+        return "\n".join(re.findall(r"(?:mCurrentFocus|mFocusedApp)=.*", result))
+
     def get_xml(self, prefix, save_dir):
-        """Get UI hierarchy XML dump from Android device."""
-        dump_command = f"adb -s {self.device} shell uiautomator dump " \
-                       f"{os.path.join(self.xml_dir, prefix + '.xml').replace(self.backslash, '/')}"
-        pull_command = f"adb -s {self.device} pull " \
-                       f"{os.path.join(self.xml_dir, prefix + '.xml').replace(self.backslash, '/')} " \
-                       f"{os.path.join(save_dir, prefix + '.xml')}"
-        result = execute_adb(dump_command)
+        """
+        Get UI hierarchy XML dump from Android device.
+        With HIERARCHY_BACKEND "server" the hierarchy comes from the on-device hierarchy server whenever it is
+        reachable, falling back to uiautomator otherwise.
+        In "exec-out" mode the dump is streamed into memory and returned as a parsed UIHierarchy, which
+        traverse_tree and collect_interactive_elements accept in place of a path; the copy in save_dir is
+        written in the background (or not at all if SAVE_XML is off). Otherwise the path of the pulled file
+        is returned.
+        """
+        if self.hierarchy_server is not None:
+            hierarchy = self.hierarchy_server.dump()
+            if hierarchy is not None:
+                if configs.get("SAVE_XML", True):
+                    hierarchy.save_async(os.path.join(save_dir, prefix + ".xml"))
+                return hierarchy
+        if self.xml_capture_mode == "exec-out":
+            data = self.exec_out("uiautomator dump /dev/tty")
+            if not data:
+                return "ERROR"
+            try:
+                hierarchy = UIHierarchy.from_bytes(data)
+            except ET.ParseError as e:
+                logger.error(f"Failed to parse UI hierarchy dump: {e}")
+                return "ERROR"
+            if configs.get("SAVE_XML", True):
+                hierarchy.save_async(os.path.join(save_dir, prefix + ".xml"))
+            return hierarchy
+        remote_path = os.path.join(self.xml_dir, prefix + '.xml').replace(self.backslash, '/')
+        result = self.shell(f"uiautomator dump {remote_path}")
         if result != "ERROR":
-            result = execute_adb(pull_command)
-            if result != "ERROR":
-                return os.path.join(save_dir, prefix + ".xml")
-            return result
+            return self.pull(remote_path, os.path.join(save_dir, prefix + ".xml"))
         return result
     
     def back(self):
         """Send Android back button event."""
-        adb_command = f"adb -s {self.device} shell input keyevent KEYCODE_BACK"
-        ret = execute_adb(adb_command)
+        adb_command = "input keyevent KEYCODE_BACK"
+        ret = self.shell(adb_command)
         return ret
     
     def tap(self, x, y):
         """Tap at coordinates (x, y) on Android device."""
-        adb_command = f"adb -s {self.device} shell input tap {x} {y}"
-        ret = execute_adb(adb_command)
+        adb_command = f"input tap {x} {y}"
+        ret = self.shell(adb_command)
         return ret
 
-    def clear_text_field(self):
+    def send_keys(self, keycodes):
+        """Send a sequence of key events (e.g. ["KEYCODE_DEL", "KEYCODE_DEL"]) in one `input keyevent` call."""
+        if not keycodes:
+            return ""
+        return self.shell("input keyevent " + " ".join(keycodes))
+
+    def input_batch(self, commands):
         """
-        Clears text from focused input field by repeatedly sending BACKSPACE.
-        Works on all Android OEMs, keyboards, and field types.
+        Run several `input` sub-commands (e.g. ["keyevent KEYCODE_DEL", "text hello"]) in one shell invocation.
+        Stops at the first failing command.
         """
-        # Move cursor to start, then to end (forces correct cursor position)
-        adb_command = f"adb -s {self.device} shell input keyevent KEYCODE_MOVE_HOME"
-        ret = execute_adb(adb_command)
-        adb_command = f"adb -s {self.device} shell input keyevent KEYCODE_MOVE_END"
-        ret = execute_adb(adb_command)
+        return self.shell(" && ".join(f"input {command}" for command in commands))
 
-        # Press DEL 20 times (enough for any text field)
-        adb_command = f"adb -s {self.device} shell input keyevent KEYCODE_DEL"
-        for _ in range(20):
-            ret = execute_adb(adb_command)
-        return ret
+    def perform_gestures(self, gestures):
+        """
+        Perform several gestures in one shell invocation:
+        ("tap", x, y), ("long_press", x, y, duration_ms) or ("swipe", (x1, y1), (x2, y2), duration_ms).
+        """
+        commands = []
+        for gesture in gestures:
+            if gesture[0] == "tap":
+                commands.append(f"tap {gesture[1]} {gesture[2]}")
+            elif gesture[0] == "long_press":
+                _, x, y, duration = gesture
+                commands.append(f"swipe {x} {y} {x} {y} {duration}")
+            elif gesture[0] == "swipe":
+                _, (start_x, start_y), (end_x, end_y), duration = gesture
+                commands.append(f"swipe {start_x} {start_y} {end_x} {end_y} {duration}")
+            else:
+                logger.error(f"Unknown gesture {gesture[0]}")
+                return "ERROR"
+        return self.input_batch(commands)
+
+    def _clear_commands(self, mode=None):
+        """`input` sub-commands that clear the focused text field."""
+        mode = mode or configs.get("CLEAR_TEXT_MODE", "delete")
+        if mode == "select_all":
+            # keycombination needs Android 13 or newer
+            return ["keycombination KEYCODE_CTRL_LEFT KEYCODE_A", "keyevent KEYCODE_DEL"]
+        # Move cursor to start, then to end (forces correct cursor position), then delete backwards
+        delete_count = configs.get("CLEAR_TEXT_DELETE_COUNT", 20)
+        return ["keyevent KEYCODE_MOVE_HOME KEYCODE_MOVE_END " + " ".join(["KEYCODE_DEL"] * delete_count)]
+
+    def _use_ime(self):
+        """
+        True if text goes through ADBKeyboard broadcasts. The first call makes ADBKeyboard the active input
+        method (the previous one is restored by close()); if it is not installed, `input text` is used instead.
+        """
+        if self.text_input != "ime":
+            return False
+        if self._ime_ready:
+            return True
+        current = self.shell("settings get secure default_input_method").strip()
+        if current != ADB_KEYBOARD_IME:
+            ret = self.shell(f"ime enable {ADB_KEYBOARD_IME} && ime set {ADB_KEYBOARD_IME}")
+            if ret == "ERROR" or "selected" not in ret:
+                logger.warning(f"ADBKeyboard is not available, falling back to input text: {ret}")
+                self.text_input = "input"
+                return False
+            if current != "ERROR":
+                self._previous_ime = current
+        self._ime_ready = True
+        return True
+
+    def needs_keyboard_dismissal(self):
+        """ADBKeyboard has no on-screen keyboard to close; the system keyboard may cover the screen."""
+        return not self._use_ime()
+
+    def _log_text_latency(self, backend, input_str, start_time):
+        logger.debug(f"Text input via {backend}: {len(input_str)} characters in "
+                     f"{(time.perf_counter() - start_time) * 1000:.1f} ms")
+
+    def clear_text_field(self):
+        """
+        Clears text from focused input field in a single shell invocation.
+        By default BACKSPACE is sent CLEAR_TEXT_DELETE_COUNT times, which works on all Android OEMs, keyboards
+        and field types; CLEAR_TEXT_MODE "select_all" selects the whole text and deletes it instead.
+        With ANDROID_TEXT_INPUT "ime" ADBKeyboard clears the whole field.
+        """
+        if self._use_ime():
+            return self.shell(IME_CLEAR_COMMAND)
+        return self.input_batch(self._clear_commands())
 
     def text_replace(self, input_str):
-        """Input text on Android device."""
-        input_str = input_str.replace(" ", "%s")
-        input_str = input_str.replace("'", "")
-        self.clear_text_field()
-        adb_command = f"adb -s {self.device} shell input text {input_str}"
-        ret = execute_adb(adb_command)
+        """Replace the text of the focused field on Android device (clear and type in one shell invocation)."""
+        start_time = time.perf_counter()
+        if self._use_ime():
+            ret = self.shell(f"{IME_CLEAR_COMMAND} && {ime_text_command(input_str)}")
+            self._log_text_latency("ime", input_str, start_time)
+            return ret
+        escaped = input_str.replace(" ", "%s")
+        escaped = escaped.replace("'", "")
+        mode = configs.get("CLEAR_TEXT_MODE", "delete")
+        ret = self.input_batch(self._clear_commands(mode) + [f"text {escaped}"])
+        if ret == "ERROR" and mode == "select_all":
+            logger.warning("Select-all clear failed, falling back to deleting characters")
+            ret = self.input_batch(self._clear_commands("delete") + [f"text {escaped}"])
+        self._log_text_latency("input text", input_str, start_time)
         return ret
     
     def text(self, input_str):
-        """Input text on Android device."""
-        input_str = input_str.replace(" ", "%s")
-        input_str = input_str.replace("'", "")
-        adb_command = f"adb -s {self.device} shell input text {input_str}"
-        ret = execute_adb(adb_command)
+        """
+        Input text on Android device.
+        With ANDROID_TEXT_INPUT "ime" the whole string (including non-ASCII characters and apostrophes) is
+        committed by one ADBKeyboard broadcast; otherwise `input text` types it, without apostrophes.
+        """
+        start_time = time.perf_counter()
+        if self._use_ime():
+            ret = self.shell(ime_text_command(input_str))
+            self._log_text_latency("ime", input_str, start_time)
+            return ret
+        escaped = input_str.replace(" ", "%s")
+        escaped = escaped.replace("'", "")
+        adb_command = f"input text {escaped}"
+        ret = self.shell(adb_command)
+        self._log_text_latency("input text", input_str, start_time)
         return ret
     
     def long_press(self, x, y, duration=1000):
         """Long press at coordinates (x, y) on Android device."""
-        adb_command = f"adb -s {self.device} shell input swipe {x} {y} {x} {y} {duration}"
-        ret = execute_adb(adb_command)
+        adb_command = f"input swipe {x} {y} {x} {y} {duration}"
+        ret = self.shell(adb_command)
         return ret
     
     def swipe(self, x, y, direction, dist="medium", quick=False):
@@ -158,14 +483,14 @@ class AndroidController:
         else:
             return "ERROR"
         duration = 200 if quick else 400
-        adb_command = f"adb -s {self.device} shell input swipe {x} {y} {x+offset[0]} {y+offset[1]} {duration}"
-        ret = execute_adb(adb_command)
+        adb_command = f"input swipe {x} {y} {x+offset[0]} {y+offset[1]} {duration}"
+        ret = self.shell(adb_command)
         return ret
     
     def swipe_precise(self, start, end, duration=400):
         """Precise swipe from start to end coordinates on Android device."""
         start_x, start_y = start
         end_x, end_y = end
-        adb_command = f"adb -s {self.device} shell input swipe {start_x} {start_y} {end_x} {end_y} {duration}"
-        ret = execute_adb(adb_command)
+        adb_command = f"input swipe {start_x} {start_y} {end_x} {end_y} {duration}"
+        ret = self.shell(adb_command)
         return ret
@@ -0,0 +1,176 @@
+"""
+Asyncio front end for DeviceController.
+
+Every DeviceController call blocks on device I/O (adb or the Appium HTTP API). AsyncDeviceController
+runs those calls on a per-device worker thread and exposes them as coroutines with the same names,
+arguments and return values, so several device sessions, model requests and image work can overlap
+in one event loop:
+
+    async with await AsyncDeviceController.create(device) as controller:
+        observation = await controller.capture_observation(prefix, save_dir)
+        await controller.tap(x, y, timeout=5)
+
+Each call takes an optional `timeout` in seconds (default ASYNC_CALL_TIMEOUT, 0 for none); a call that
+times out logs an error and raises asyncio.TimeoutError, since no single failure value fits every method
+(get_device_size returns a tuple). Cancelling the awaiting task returns control immediately; the device
+call itself cannot be interrupted and finishes on the worker thread, which keeps calls to one device in
+order.
+"""
+import asyncio
+import functools
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from config import load_config
+from device_controller import DeviceController
+from logging_controller import get_logger
+
+configs = load_config()
+
+try:
+    logger = get_logger()
+except Exception as e:
+    print(f"ERROR: Failed to load logger configuration: {e}")
+    sys.exit(1)
+
+
+class AsyncDeviceController:
+    """Awaitable DeviceController; one worker thread per device serialises its calls."""
+
+    def __init__(self, device, platform=None, controller=None, executor=None):
+        """
+        Connects synchronously; use `await AsyncDeviceController.create(...)` to connect without
+        blocking the event loop.
+        """
+        self._executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"async-{device}")
+        self.controller = controller if controller is not None else DeviceController(device, platform)
+        self.device = device
+        self.platform = self.controller.platform
+        self.default_timeout = configs.get("ASYNC_CALL_TIMEOUT", 60)
+
+    @classmethod
+    async def create(cls, device, platform=None):
+        """Connect to the device on the worker thread."""
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"async-{device}")
+        loop = asyncio.get_running_loop()
+        controller = await loop.run_in_executor(executor, DeviceController, device, platform)
+        return cls(device, platform, controller=controller, executor=executor)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def __getattr__(self, name):
+        # Plain attributes (last_settle, health_monitor, frame_source, ...) come from the wrapped controller;
+        # methods must be wrapped below, a synchronous call here would block the event loop
+        if name == "controller":
+            raise AttributeError(name)
+        value = getattr(self.controller, name)
+        if callable(value):
+            raise AttributeError(f"{type(self).__name__} has no coroutine {name}; use run({name!r}, ...)")
+        return value
+
+    async def run(self, method, *args, timeout=None, **kwargs):
+        """
+        Call a DeviceController method by name on the worker thread and return its result.
+        Raises asyncio.TimeoutError if it did not finish within timeout seconds.
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        call = functools.partial(getattr(self.controller, method), *args, **kwargs)
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(self._executor, call), timeout or None)
+        except asyncio.TimeoutError:
+            logger.error(f"{method} on {self.device} timed out after {timeout} s")
+            raise
+
+    async def close(self):
+        """Release the device once pending calls have finished."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.controller.close)
+        self._executor.shutdown(wait=False)
+
+    async def get_device_size(self, timeout=None):
+        """Get device screen dimensions (width, height)."""
+        return await self.run("get_device_size", timeout=timeout)
+
+    async def get_bbox_space_size(self, timeout=None):
+        """(width, height) of the element bounds' coordinate space when it is not screenshot pixels, else None."""
+        return await self.run("get_bbox_space_size", timeout=timeout)
+
+    async def get_screenshot(self, prefix, save_dir, timeout=None):
+        """Capture and save a screenshot."""
+        return await self.run("get_screenshot", prefix, save_dir, timeout=timeout)
+
+    async def get_frame(self, prefix, save_dir, timeout=None):
+        """Capture a screenshot as an in-memory Frame (or "ERROR")."""
+        return await self.run("get_frame", prefix, save_dir, timeout=timeout)
+
+    async def get_xml(self, prefix, save_dir, timeout=None):
+        """Get UI hierarchy XML dump."""
+        return await self.run("get_xml", prefix, save_dir, timeout=timeout)
+
+    async def capture_observation(self, prefix, save_dir, include_xml=True, timeout=None):
+        """Capture the screenshot and (optionally) the UI hierarchy concurrently."""
+        return await self.run("capture_observation", prefix, save_dir, include_xml, timeout=timeout)
+
+    async def wait_for_settle(self, timeout=None):
+        """Wait for the UI to stop changing after an action (see DeviceController.wait_for_settle)."""
+        return await self.run("wait_for_settle", timeout=timeout)
+
+    async def wait_for_device(self, timeout=None):
+        """Wait up to timeout seconds for a dropped device to come back (see DeviceController.wait_for_device)."""
+        try:
+            return await self.run("wait_for_device", timeout, timeout=timeout + 5 if timeout else 0) is True
+        except asyncio.TimeoutError:
+            return False
+
+    async def tap(self, x, y, timeout=None):
+        """Tap at coordinates (x, y)."""
+        return await self.run("tap", x, y, timeout=timeout)
+
+    async def text(self, input_str, timeout=None):
+        """Input text string."""
+        return await self.run("text", input_str, timeout=timeout)
+
+    async def text_replace(self, input_str, timeout=None):
+        """Replace the text of the focused field with input_str."""
+        return await self.run("text_replace", input_str, timeout=timeout)
+
+    async def send_keys(self, keys, timeout=None):
+        """Send a sequence of platform key codes in a single device call."""
+        return await self.run("send_keys", keys, timeout=timeout)
+
+    async def input_batch(self, commands, timeout=None):
+        """Run several Android `input` sub-commands in a single shell invocation."""
+        return await self.run("input_batch", commands, timeout=timeout)
+
+    async def perform_gestures(self, gestures, timeout=None):
+        """Perform several gestures in a single device call."""
+        return await self.run("perform_gestures", gestures, timeout=timeout)
+
+    async def needs_keyboard_dismissal(self, timeout=None):
+        """Whether an on-screen keyboard may be left covering the screen after text input."""
+        return await self.run("needs_keyboard_dismissal", timeout=timeout)
+
+    async def clear_text_field(self, timeout=None):
+        """Clear the focused text field."""
+        return await self.run("clear_text_field", timeout=timeout)
+
+    async def long_press(self, x, y, duration=1000, timeout=None):
+        """Long press at coordinates (x, y) for duration milliseconds."""
+        return await self.run("long_press", x, y, duration, timeout=timeout)
+
+    async def swipe(self, x, y, direction, dist="medium", quick=False, timeout=None):
+        """Swipe from (x, y) in direction."""
+        return await self.run("swipe", x, y, direction, dist, quick, timeout=timeout)
+
+    async def swipe_precise(self, start, end, duration=400, timeout=None):
+        """Precise swipe from start coordinates to end coordinates."""
+        return await self.run("swipe_precise", start, end, duration, timeout=timeout)
+
+    async def back(self, timeout=None):
+        """Send back button event."""
+        return await self.run("back", timeout=timeout)
@@ -0,0 +1,782 @@
+"""
+Micro-benchmarks for the device and image pipelines.
+
+Usage:
+    python scripts/benchmark.py adb-shell --device <serial> --iterations 50
+    python scripts/benchmark.py capture --device <serial> --rounds 20
+    python scripts/benchmark.py stream [--device <serial>] --iterations 50
+    python scripts/benchmark.py hierarchy [--device <serial>] [--xml <dump.xml>] --iterations 20
+    python scripts/benchmark.py adb-client [--device <serial>] --iterations 50
+    python scripts/benchmark.py scheduler --devices 4 --tasks 20
+    python scripts/benchmark.py replay [--dir <recorded task or demo>] --rounds 20
+    python scripts/benchmark.py ios-session [--server <appium url> --udid <udid>] --iterations 5
+    python scripts/benchmark.py ios-capture [--server <appium url> --udid <udid>] --iterations 20
+    python scripts/benchmark.py ios-actions [--server <appium url> --udid <udid>] --iterations 20
+    python scripts/benchmark.py ios-source [--server <appium url> --udid <udid>] [--depth 50] --iterations 10
+    python scripts/benchmark.py async-devices --devices 4 --rounds 5
+    python scripts/benchmark.py text-input --device <serial> --length 200 --iterations 10
+    python scripts/benchmark.py grid --iterations 50
+    python scripts/benchmark.py image-pipeline --rounds 20 [--width 1080 --height 2400]
+    python scripts/benchmark.py encode-cache [--dir <demo or task dir>] --steps 10
+    python scripts/benchmark.py similarity --iterations 20
+    python scripts/benchmark.py crop-diff --iterations 20
+    python scripts/benchmark.py image-budget --iterations 20
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from logging_controller import print_with_color
+
+
+def measure(fn, iterations):
+    """Call fn `iterations` times and return the per-call latencies in milliseconds."""
+    samples = []
+    for _ in range(iterations):
+        start_time = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start_time) * 1000)
+    return samples
+
+
+def report(name, samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print_with_color(f"{name:<32} mean {statistics.mean(samples):8.2f} ms   median {statistics.median(samples):8.2f} ms"
+                     f"   p95 {p95:8.2f} ms   (n={len(samples)})", "yellow")
+
+
+def bench_adb_shell(args):
+    """Compare one adb process per command with a persistent adb shell session."""
+    from adb_shell import AdbShellPool
+    from android_controller import execute_adb
+
+    command = args.command
+    report("adb subprocess", measure(lambda: execute_adb(f"adb -s {args.device} shell {command}"), args.iterations))
+    pool = AdbShellPool(args.device)
+    try:
+        pool.run(command)  # Start the session outside the measurement
+        report("persistent adb shell", measure(lambda: pool.run(command), args.iterations))
+    finally:
+        pool.close()
+
+
+def bench_capture(args):
+    """Compare screenshot rounds per minute for the pull, exec-out and raw capture modes."""
+    from android_controller import AndroidController
+    from frame import wait_for_background_writes
+    from utils import draw_grid, encode_image
+
+    controller = AndroidController(args.device)
+    with tempfile.TemporaryDirectory() as save_dir:
+        for mode in ("pull", "exec-out", "raw"):
+            controller.capture_mode = mode
+
+            def one_round():
+                frame = controller.get_frame("bench", save_dir)
+                grid_path = os.path.join(save_dir, "bench_grid.png")
+                draw_grid(frame, grid_path)
+                encode_image(frame.annotated or grid_path)  # grid_path is still being written in the background
+
+            samples = measure(one_round, args.rounds)
+            report(f"capture round ({mode})", samples)
+            print_with_color(f"{'':<32} {60000 / statistics.mean(samples):.1f} rounds per minute", "yellow")
+        wait_for_background_writes()
+    controller.close()
+
+
+def bench_stream(args):
+    """Measure how long reading the latest frame from a screen stream takes (a local fake stream without --device)."""
+    from frame_source import StreamFrameSource, open_android_stream, open_tcp_stream
+    from stand_ins import FakeMjpegProducer
+
+    producer = None
+    if args.device:
+        source = StreamFrameSource(lambda: open_android_stream(args.device))
+    else:
+        producer = FakeMjpegProducer(fps=args.fps).start()
+        host, port = producer.address
+        source = StreamFrameSource(lambda: open_tcp_stream(host, port))
+    source.start()
+    try:
+        if source.latest(timeout=10) is None:
+            print_with_color("No frame received from the stream", "red")
+            return
+        with tempfile.TemporaryDirectory() as save_dir:
+            report("latest frame", measure(lambda: source.latest(timeout=0), args.iterations))
+            report("frame newer than now", measure(lambda: source.latest(timeout=1, newer_than=time.monotonic()),
+                                                   args.iterations))
+            report("get_frame (background save)", measure(lambda: source.get_frame("bench", save_dir),
+                                                          args.iterations))
+        print_with_color(f"{source.frames_decoded} frames decoded", "yellow")
+    finally:
+        source.stop()
+        if producer is not None:
+            producer.stop()
+
+
+def bench_hierarchy(args):
+    """Compare UI hierarchy acquisition through a hierarchy server (a local stand-in) with uiautomator dump."""
+    from hierarchy_server import HierarchyServerClient
+    from stand_ins import FakeHierarchyServer
+
+    if args.xml:
+        with open(args.xml, "rb") as f:
+            xml = f.read()
+    else:
+        nodes = "".join(f'<node index="{i}" class="android.widget.Button" resource-id="app:id/b{i}" clickable="true" '
+                        f'focusable="true" bounds="[0,{i * 40}][1080,{i * 40 + 40}]"/>' for i in range(300))
+        xml = f'<hierarchy rotation="0">{nodes}</hierarchy>'.encode("utf-8")
+    with FakeHierarchyServer([xml, xml.replace(b"b0", b"c0")]) as server:
+        client = HierarchyServerClient(*server.address)
+
+        def changed_dump():
+            server.advance()
+            client.dump()
+
+        report("hierarchy server (changed UI)", measure(changed_dump, args.iterations))
+        report("hierarchy server (unchanged UI)", measure(client.dump, args.iterations))
+        client.close()
+    if args.device:
+        from android_controller import AndroidController
+
+        controller = AndroidController(args.device)
+        controller.xml_capture_mode = "exec-out"
+        with tempfile.TemporaryDirectory() as save_dir:
+            report("uiautomator dump (exec-out)", measure(lambda: controller.get_xml("bench", save_dir),
+                                                          args.iterations))
+        controller.close()
+
+
+def bench_adb_client(args):
+    """Compare spawning the adb binary with the native adb server client for shell and exec-out commands."""
+    from adb_client import AdbClient
+    from android_controller import execute_adb, execute_adb_binary
+
+    command = args.command
+    if args.device:
+        client = AdbClient()
+        report("adb subprocess shell", measure(lambda: execute_adb(f"adb -s {args.device} shell {command}"),
+                                               args.iterations))
+        report("native client shell", measure(lambda: client.shell(args.device, command), args.iterations))
+        report("adb subprocess exec-out screencap",
+               measure(lambda: execute_adb_binary(["adb", "-s", args.device, "exec-out", "screencap"]),
+                       args.iterations))
+        report("native client exec screencap",
+               measure(lambda: client.exec_out(args.device, "screencap"), args.iterations))
+        return
+
+    from stand_ins import FakeAdbServer
+
+    serial = "emulator-5554"
+    with FakeAdbServer(devices=[serial], responder=lambda _: (0, b"ok")) as server:
+        client = AdbClient(*server.address)
+        report("native client shell (stand-in)", measure(lambda: client.shell(serial, command), args.iterations))
+        report("native client exec (stand-in)", measure(lambda: client.exec_out(serial, command), args.iterations))
+        if shutil.which("adb"):
+            port = server.address[1]
+            report("adb subprocess shell (stand-in)",
+                   measure(lambda: execute_adb(f"adb -P {port} -s {serial} shell {command}"), args.iterations))
+        else:
+            print_with_color("adb not found on PATH; skipping the subprocess comparison", "yellow")
+
+
+def bench_scheduler(args):
+    """Run simulated tasks on fake devices through the scheduler with a shared LLM rate limit."""
+    from rate_limiter import RateLimiter
+    from scheduler import Scheduler, Task
+
+    limiter = RateLimiter(args.rpm, burst=args.devices) if args.rpm else None
+
+    def fake_runner(task, device, task_dir):
+        for _ in range(args.rounds):
+            if limiter is not None:
+                limiter.acquire()
+            time.sleep(random.uniform(0.5, 1.5) * args.round_time)  # model latency plus device actions
+        return 0
+
+    devices = [f"fake-device-{i + 1}" for i in range(args.devices)]
+    tasks = [Task(i + 1, "FakeApp", f"simulated task {i + 1}") for i in range(args.tasks)]
+    with tempfile.TemporaryDirectory() as work_dir:
+        metrics = Scheduler(devices, fake_runner, work_dir).run(tasks)
+    print_with_color(metrics.summary(), "yellow")
+
+
+def bench_replay(args):
+    """Profile the per-round pipeline (capture, parse, label, encode, act) against the replay platform."""
+    from device_controller import DeviceController
+    from frame import wait_for_background_writes
+    from utils import collect_interactive_elements, draw_bbox_multi, encode_image
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        if args.dir:
+            recording_dir = args.dir
+        else:
+            from stand_ins import write_synthetic_recording
+
+            recording_dir = write_synthetic_recording(os.path.join(work_dir, "recording"))
+        controller = DeviceController(recording_dir, platform="replay")
+        stages = {"capture": [], "parse": [], "label": [], "encode": [], "act": [], "round": []}
+
+        def timed(stage, fn, *fn_args):
+            start_time = time.perf_counter()
+            result = fn(*fn_args)
+            stages[stage].append((time.perf_counter() - start_time) * 1000)
+            return result
+
+        for round_count in range(1, args.rounds + 1):
+            start_time = time.perf_counter()
+            observation = timed("capture", controller.capture_observation, f"replay_{round_count}", work_dir)
+            elem_list = timed("parse", collect_interactive_elements, observation.xml) if observation.xml != "ERROR" \
+                else []
+            labeled_path = os.path.join(work_dir, f"replay_{round_count}_labeled.png")
+            timed("label", draw_bbox_multi, observation.frame, labeled_path, elem_list)
+            # labeled_path is written in the background; the in-memory labeled image is what the executor sends
+            timed("encode", encode_image, getattr(observation.frame, "annotated", None) or labeled_path)
+            if elem_list:
+                (x1, y1), (x2, y2) = elem_list[0].bbox
+                timed("act", controller.tap, (x1 + x2) // 2, (y1 + y2) // 2)
+            else:
+                timed("act", controller.back)
+            stages["round"].append((time.perf_counter() - start_time) * 1000)
+        controller.close()
+        wait_for_background_writes()
+    for stage, samples in stages.items():
+        report(f"replay {stage}", samples)
+
+
+def bench_ios_session(args):
+    """Compare creating a new iOS Appium session with reattaching to a stored one."""
+    import ios_controller
+
+    server = None
+    if not args.server:
+        from stand_ins import FakeAppiumServer
+
+        server = FakeAppiumServer(latency=args.latency).start()
+    with tempfile.TemporaryDirectory() as work_dir:
+        session_file = os.path.join(work_dir, "sessions.json")
+        ios_controller.configs.update(APPIUM_SERVER=args.server or server.url, IOS_SESSION_FILE=session_file)
+        try:
+            def new_session():
+                ios_controller.configs["IOS_PERSISTENT_SESSION"] = False
+                controller = ios_controller.IOSController(args.udid)
+                del controller  # Quits the session
+
+            def reattach():
+                ios_controller.configs["IOS_PERSISTENT_SESSION"] = True
+                ios_controller.IOSController(args.udid).keep_alive.stop()
+
+            report("new session", measure(new_session, args.iterations))
+            reattach()  # Store a session outside the measurement
+            report("reattach stored session", measure(reattach, args.iterations))
+        finally:
+            if server is not None:
+                server.stop()
+
+
+def bench_ios_capture(args):
+    """Compare iOS screenshots saved to disk and reloaded, decoded in memory, and read from an MJPEG stream."""
+    import ios_controller
+    from frame import Frame, wait_for_background_writes
+    from frame_source import StreamFrameSource, open_http_stream
+    from stand_ins import FakeAppiumServer, FakeMjpegProducer
+
+    server = producer = None
+    if not args.server:
+        server = FakeAppiumServer(latency=args.latency).start()
+    mjpeg_url = args.mjpeg_url
+    if not mjpeg_url:
+        producer = FakeMjpegProducer(width=1170, height=2532, fps=args.fps, multipart=True).start()
+        mjpeg_url = "http://%s:%d" % producer.address
+    ios_controller.configs.update(APPIUM_SERVER=args.server or server.url, IOS_PERSISTENT_SESSION=False)
+    controller = ios_controller.IOSController(args.udid)
+    source = StreamFrameSource(lambda: open_http_stream(mjpeg_url)).start()
+    try:
+        with tempfile.TemporaryDirectory() as save_dir:
+            report("save_screenshot + reload", measure(
+                lambda: Frame.from_path(controller.get_screenshot("bench", save_dir)), args.iterations))
+            report("in-memory PNG", measure(lambda: controller.get_frame("bench", save_dir), args.iterations))
+            if source.latest(timeout=10) is None:
+                print_with_color("No frame received from the MJPEG stream", "red")
+            else:
+                report("MJPEG stream get_frame", measure(lambda: source.get_frame("bench", save_dir),
+                                                         args.iterations))
+            wait_for_background_writes()  # Screenshots are saved in the background; let them land before cleanup
+    finally:
+        source.stop()
+        del controller
+        for stand_in in (server, producer):
+            if stand_in is not None:
+                stand_in.stop()
+
+
+def bench_ios_actions(args):
+    """Compare iOS gestures sent one per request with one batched W3C action chain, and per-key with one-call typing."""
+    import ios_controller
+
+    server = None
+    if not args.server:
+        from stand_ins import FakeAppiumServer
+
+        server = FakeAppiumServer(latency=args.latency).start()
+    ios_controller.configs.update(APPIUM_SERVER=args.server or server.url, IOS_PERSISTENT_SESSION=False)
+    controller = ios_controller.IOSController(args.udid)
+    x, y = controller.width // 2, controller.height // 2
+    gestures = [("tap", x, y), ("swipe", (x, y + 200), (x, y - 200), 300), ("long_press", x, y, 500)]
+    try:
+        def separate():
+            controller.tap(x, y)
+            controller.swipe_precise((x, y + 200), (x, y - 200), 300)
+            controller.long_press(x, y, 500)
+
+        report("gestures, one request each", measure(separate, args.iterations))
+        report("gestures, batched W3C actions", measure(lambda: controller.perform_gestures(gestures),
+                                                        args.iterations))
+        text = args.text
+        report("text, one request per key", measure(
+            lambda: [controller.send_keys([char]) for char in text], args.iterations))
+        report("text, single send_keys", measure(lambda: controller.text(text), args.iterations))
+    finally:
+        del controller
+        if server is not None:
+            server.stop()
+
+
+def bench_ios_source(args):
+    """Compare the full iOS page_source with filtered `mobile: source` JSON and XML converted for labelling."""
+    import ios_controller
+    from utils import traverse_tree
+
+    server = None
+    if not args.server:
+        from stand_ins import FakeAppiumServer
+
+        server = FakeAppiumServer(latency=args.latency, node_latency=args.node_latency,
+                                  attribute_latency=args.attribute_latency).start()
+    ios_controller.configs.update(APPIUM_SERVER=args.server or server.url, IOS_PERSISTENT_SESSION=False,
+                                  IOS_SNAPSHOT_MAX_DEPTH=args.depth, SAVE_XML=False)
+    controller = ios_controller.IOSController(args.udid)
+    try:
+        with tempfile.TemporaryDirectory() as save_dir:
+            print_with_color(f"page_source size: {len(controller.driver.page_source) / 1024:.1f} KiB", "yellow")
+            report("page_source", measure(lambda: controller.driver.page_source, args.iterations))
+            for source_format in ("xml", "json"):
+                ios_controller.configs["IOS_SOURCE_FORMAT"] = source_format
+                report(f"mobile: source {source_format} + convert", measure(
+                    lambda: controller.get_xml("bench", save_dir), args.iterations))
+            clickable_list = []
+            traverse_tree(controller.get_xml("bench", save_dir), clickable_list, "clickable", True)
+            print_with_color(f"{len(clickable_list)} clickable elements", "yellow")
+    finally:
+        del controller
+        if server is not None:
+            server.stop()
+
+
+def bench_async_devices(args):
+    """Compare replay device sessions run one after another with the same sessions sharing one event loop."""
+    import asyncio
+
+    from async_device_controller import AsyncDeviceController
+    from device_controller import DeviceController
+    from stand_ins import write_synthetic_recording
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        recordings = [write_synthetic_recording(os.path.join(work_dir, f"recording_{index}"))
+                      for index in range(args.devices)]
+
+        def blocking_session(recording_dir):
+            controller = DeviceController(recording_dir, platform="replay")
+            for round_count in range(args.rounds):
+                controller.capture_observation(f"sync_{round_count}", work_dir)
+                time.sleep(args.model_latency)  # The model request
+                controller.tap(100, 100)
+            controller.close()
+
+        async def async_session(recording_dir):
+            async with await AsyncDeviceController.create(recording_dir, platform="replay") as controller:
+                for round_count in range(args.rounds):
+                    await controller.capture_observation(f"async_{round_count}", work_dir)
+                    await asyncio.sleep(args.model_latency)
+                    await controller.tap(100, 100)
+
+        async def all_sessions():
+            await asyncio.gather(*(async_session(recording_dir) for recording_dir in recordings))
+
+        report(f"{args.devices} sessions, blocking", measure(
+            lambda: [blocking_session(recording_dir) for recording_dir in recordings], 1))
+        report(f"{args.devices} sessions, one event loop", measure(lambda: asyncio.run(all_sessions()), 1))
+
+
+def bench_text_input(args):
+    """Compare `input text` with ADBKeyboard broadcasts for replacing the text of the focused field."""
+    from android_controller import AndroidController
+
+    text = ("Flat 4B, 221 Baker Street " * (args.length // 26 + 1))[:args.length]
+    controller = AndroidController(args.device)
+    print_with_color("Focus a text field on the device before the measurements start", "yellow")
+    try:
+        controller.text_input = "input"
+        report(f"input text ({len(text)} chars)", measure(lambda: controller.text_replace(text), args.iterations))
+        controller.text_input = "ime"
+        if not controller._use_ime():
+            print_with_color("ADBKeyboard is not installed; skipping the IME comparison", "yellow")
+            return
+        report(f"ADBKeyboard broadcast ({len(text)} chars)",
+               measure(lambda: controller.text_replace(text), args.iterations))
+        unicode_text = ("नमस्ते café 東京 " * (args.length // 15 + 1))[:args.length]
+        report(f"ADBKeyboard broadcast, Unicode ({len(unicode_text)} chars)",
+               measure(lambda: controller.text_replace(unicode_text), args.iterations))
+    finally:
+        controller.close()
+
+
+GRID_RESOLUTIONS = {"phone": (1080, 2400), "iphone": (1170, 2532), "tablet": (1600, 2560), "ipad": (2048, 2732)}
+
+
+def bench_grid(args):
+    """Compare drawing the grid cell by cell every round with blending the cached overlay."""
+    import numpy as np
+
+    from frame import Frame
+    from utils import blend_overlay, configs, draw_grid, grid_overlay, grid_shape, render_grid_overlay
+
+    skips = configs.get("SKIP_LEFT_COLS", 0), configs.get("SKIP_RIGHT_COLS", 0)
+    with tempfile.TemporaryDirectory() as work_dir:
+        output_path = os.path.join(work_dir, "grid.png")
+        for name, (width, height) in GRID_RESOLUTIONS.items():
+            image = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+            rows, cols = grid_shape(width, height, configs.get("GRID_SIZE", 40))
+            label = f"{name} {width}x{height} ({rows}x{cols})"
+            report(f"{label} render every round", measure(
+                lambda: blend_overlay(image.copy(), render_grid_overlay(width, height, rows, cols, *skips)),
+                args.iterations))
+            grid_overlay(width, height, rows, cols, *skips)  # Build the cached overlay outside the measurement
+            report(f"{label} cached blend", measure(
+                lambda: blend_overlay(image.copy(), grid_overlay(width, height, rows, cols, *skips)),
+                args.iterations))
+            frame = Frame(image)
+            report(f"{label} draw_grid + PNG", measure(
+                lambda: draw_grid(frame, output_path) and frame.annotated.wait_saved(), args.iterations))
+
+
+def bench_image_pipeline(args):
+    """Compare per-round CPU time and peak memory of the path-based and in-memory Frame image pipelines."""
+    import tracemalloc
+
+    import cv2
+    import numpy as np
+
+    from frame import Frame
+    from utils import calculate_image_similarity, draw_grid, encode_image
+
+    rng = np.random.default_rng(0)
+    base = np.full((args.height, args.width, 3), 240, dtype=np.uint8)
+    for row in range(0, args.height, 160):
+        cv2.rectangle(base, (40, row + 20), (args.width - 40, row + 140), (60, 90, 180), -1)
+    screens = [np.roll(base, int(offset), axis=0) for offset in rng.integers(0, args.height, args.rounds)]
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        def path_round(index, previous):
+            screenshot = os.path.join(work_dir, f"path_{index}.png")
+            cv2.imwrite(screenshot, screens[index])  # What the capture used to leave on disk
+            image = os.path.join(work_dir, f"path_{index}_grid.png")
+            draw_grid(screenshot, image)
+            calculate_image_similarity(previous, image)
+            encode_image(image)
+            return image
+
+        def frame_round(index, previous):
+            frame = Frame(screens[index].copy())
+            frame.save_async(os.path.join(work_dir, f"frame_{index}.png"))
+            draw_grid(frame, os.path.join(work_dir, f"frame_{index}_grid.png"))
+            calculate_image_similarity(previous, frame.annotated)
+            encode_image(frame.annotated)
+            frame.annotated.wait_saved()  # Count the background writes too
+            frame.wait_saved()
+            return frame.annotated
+
+        for name, run_round in (("paths", path_round), ("frames", frame_round)):
+            cpu_samples = []
+            previous = None
+            tracemalloc.start()
+            for index in range(args.rounds):
+                start_cpu = time.process_time()
+                previous = run_round(index, previous)
+                cpu_samples.append((time.process_time() - start_cpu) * 1000)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            report(f"{name} round CPU time", cpu_samples)
+            print_with_color(f"{name} peak traced memory: {peak / 2 ** 20:.1f} MiB", "yellow")
+
+
+def bench_encode_cache(args):
+    """Encode before/after screenshot pairs as self exploration does, without and with the encode cache."""
+    import cv2
+    import numpy as np
+
+    import utils
+    from encode_cache import EncodeCache
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        if args.dir:
+            paths = sorted(os.path.join(args.dir, name) for name in os.listdir(args.dir) if name.endswith(".png"))
+        else:
+            paths = []
+            for step in range(args.steps + 1):
+                image = np.full((2400, 1080, 3), 240, dtype=np.uint8)
+                cv2.rectangle(image, (40, 100 + step * 150), (1040, 220 + step * 150), (60, 90, 180), -1)
+                paths.append(os.path.join(work_dir, f"step_{step}.png"))
+                cv2.imwrite(paths[-1], image)
+        # Each step sends (before, after); the after image is the next step's before
+        pairs = [image for before, after in zip(paths, paths[1:]) for image in (before, after)]
+
+        for name, cache in (("uncached", EncodeCache(0)), ("memory cache", EncodeCache(64)),
+                            ("disk cache (cold memory)", EncodeCache(0, os.path.join(work_dir, "cache")))):
+            utils.encode_cache = cache
+            if cache.disk_dir:
+                for path in paths:
+                    utils.encode_image(path)  # Fill the disk tier, as a previous run would have
+            report(f"encode_image, {name}", [measure(lambda: utils.encode_image(path), 1)[0] for path in pairs])
+            print_with_color(f"{name}: {cache.stats()}", "yellow")
+
+
+def bench_similarity(args):
+    """Compare calculate_image_similarity on screenshot files with the hash-prefiltered in-memory Frame path."""
+    import cv2
+    import numpy as np
+
+    from frame import Frame
+    from utils import calculate_image_similarity
+
+    screen = np.full((2400, 1080, 3), 240, dtype=np.uint8)
+    for row in range(0, 2400, 160):
+        cv2.rectangle(screen, (40, row + 20), (1040, row + 140), (60, 90, 180), -1)
+        cv2.putText(screen, f"Item {row // 160}", (80, row + 100), 0, 2, (255, 255, 255), 3)
+    scrolled = np.roll(screen, 700, axis=0)
+    navigated = np.full_like(screen, 30)
+    ticked = screen.copy()
+    cv2.rectangle(ticked, (960, 60), (1000, 100), (0, 160, 0), -1)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        paths = {}
+        for name, image in (("screen", screen), ("scrolled", scrolled), ("navigated", navigated), ("ticked", ticked)):
+            paths[name] = os.path.join(work_dir, f"{name}.png")
+            cv2.imwrite(paths[name], image)
+        previous = Frame(screen)
+        calculate_image_similarity(previous, Frame(screen))  # The previous round already computed its features
+        for name, image in (("scrolled", scrolled), ("navigated", navigated), ("ticked (SSIM)", ticked)):
+            path = paths[name.split()[0]]
+            report(f"{name}, files", measure(lambda: calculate_image_similarity(paths["screen"], path),
+                                             args.iterations))
+            report(f"{name}, frames", measure(lambda: calculate_image_similarity(previous, Frame(image)),
+                                              args.iterations))
+            print_with_color(f"{name} score: files {calculate_image_similarity(paths['screen'], path):.4f}, "
+                             f"frames {calculate_image_similarity(previous, Frame(image)):.4f}", "yellow")
+
+
+def bench_crop_diff(args):
+    """Compare the image payload of the whole grid screenshot with the crop-to-diff crop and thumbnail."""
+    import cv2
+    import numpy as np
+
+    from diff_regions import grid_crop_images
+    from frame import Frame, wait_for_background_writes
+    from utils import draw_grid, encode_image
+
+    screen = np.full((2400, 1080, 3), 240, dtype=np.uint8)
+    for row in range(200, 2400, 160):
+        cv2.rectangle(screen, (40, row + 20), (1040, row + 140), (60, 90, 180), -1)
+        cv2.putText(screen, f"Item {row // 160}", (80, row + 100), 0, 2, (255, 255, 255), 3)
+    ticked = screen.copy()
+    cv2.rectangle(ticked, (960, 1000), (1010, 1050), (0, 160, 0), -1)
+    dropdown = screen.copy()
+    cv2.rectangle(dropdown, (540, 700), (1040, 1300), (250, 250, 250), -1)
+    for row in range(720, 1300, 90):
+        cv2.putText(dropdown, f"Option {row}", (570, row + 50), 0, 1.5, (30, 30, 30), 2)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, changed in (("checkbox", ticked), ("dropdown", dropdown)):
+            previous, current = Frame(screen), Frame(changed)
+            rows, cols = draw_grid(current, os.path.join(work_dir, f"{name}_grid.png"))
+
+            def whole():
+                return [encode_image(Frame(current.annotated.image))]
+
+            def cropped():
+                frame = Frame(changed)
+                frame.annotated = Frame(current.annotated.image)
+                return [encode_image(image) for image in grid_crop_images(Frame(screen), frame, rows, cols)]
+
+            report(f"{name}, whole grid image", measure(whole, args.iterations))
+            report(f"{name}, crop and thumbnail", measure(cropped, args.iterations))
+            crop = grid_crop_images(previous, current, rows, cols)
+            print_with_color(f"{name}: whole {len(whole()[0]) / 1024:.0f} KiB base64 "
+                             f"({current.width}x{current.height}), crop {crop[0].width}x{crop[0].height} and thumbnail "
+                             f"{crop[1].width}x{crop[1].height}: {sum(map(len, cropped())) / 1024:.0f} KiB", "yellow")
+        wait_for_background_writes()
+
+
+def bench_image_budget(args):
+    """Compare the fixed 800 px / q75 model images with the per-provider image budget: tokens, bytes, encode time."""
+    import cv2
+    import numpy as np
+
+    from frame import Frame, wait_for_background_writes
+    from image_budget import GeminiImageBudgeter, OpenAIImageBudgeter
+    from utils import draw_grid, encode_image
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for width, height in GRID_RESOLUTIONS.values():
+            pixels = np.full((height, width, 3), 240, dtype=np.uint8)
+            for row in range(0, height, 160):
+                cv2.rectangle(pixels, (40, row + 20), (width - 40, row + 140), (60, 90, 180), -1)
+                cv2.putText(pixels, f"Item {row // 160}", (80, row + 100), 0, 2, (255, 255, 255), 3)
+            screen = Frame(pixels)
+            draw_grid(screen, os.path.join(work_dir, f"{width}x{height}_grid.png"))
+            for kind, image, label_px in (("grid", screen.annotated.image, screen.annotated.grid_label_px),
+                                          ("plain", pixels, None)):
+                for budgeter in (OpenAIImageBudgeter(args.openai_model), GeminiImageBudgeter()):
+                    name = f"{type(budgeter).__name__[:-len('ImageBudgeter')]} {kind} {width}x{height}"
+                    max_width, quality, tokens = budgeter.plan(width, height, label_px)
+                    fixed_tokens = budgeter.tokens_at(width, height, 800)
+                    report(f"{name}, fixed 800 px q75", measure(lambda: encode_image(Frame(image)), args.iterations))
+                    report(f"{name}, budget {max_width} px q{quality}",
+                           measure(lambda: encode_image(Frame(image), max_width, quality), args.iterations))
+                    print_with_color(f"{name}: {fixed_tokens} -> {tokens} image tokens, "
+                                     f"{len(encode_image(Frame(image))) / 1024:.0f} -> "
+                                     f"{len(encode_image(Frame(image), max_width, quality)) / 1024:.0f} KiB", "yellow")
+        wait_for_background_writes()
+
+
+if __name__ == "__main__":
+    arg_desc = "AppAgent - Benchmarks"
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=arg_desc)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    adb_shell_parser = subparsers.add_parser("adb-shell", help=bench_adb_shell.__doc__)
+    adb_shell_parser.add_argument("--device", required=True)
+    adb_shell_parser.add_argument("--iterations", type=int, default=50)
+    adb_shell_parser.add_argument("--command", default="input keyevent KEYCODE_UNKNOWN")
+    adb_shell_parser.set_defaults(func=bench_adb_shell)
+
+    capture_parser = subparsers.add_parser("capture", help=bench_capture.__doc__)
+    capture_parser.add_argument("--device", required=True)
+    capture_parser.add_argument("--rounds", type=int, default=20)
+    capture_parser.set_defaults(func=bench_capture)
+
+    stream_parser = subparsers.add_parser("stream", help=bench_stream.__doc__)
+    stream_parser.add_argument("--device")
+    stream_parser.add_argument("--iterations", type=int, default=50)
+    stream_parser.add_argument("--fps", type=int, default=30)
+    stream_parser.set_defaults(func=bench_stream)
+
+    hierarchy_parser = subparsers.add_parser("hierarchy", help=bench_hierarchy.__doc__)
+    hierarchy_parser.add_argument("--device")
+    hierarchy_parser.add_argument("--xml", help="A uiautomator dump to serve from the stand-in server")
+    hierarchy_parser.add_argument("--iterations", type=int, default=20)
+    hierarchy_parser.set_defaults(func=bench_hierarchy)
+
+    adb_client_parser = subparsers.add_parser("adb-client", help=bench_adb_client.__doc__)
+    adb_client_parser.add_argument("--device")
+    adb_client_parser.add_argument("--iterations", type=int, default=50)
+    adb_client_parser.add_argument("--command", default="input keyevent KEYCODE_UNKNOWN")
+    adb_client_parser.set_defaults(func=bench_adb_client)
+
+    scheduler_parser = subparsers.add_parser("scheduler", help=bench_scheduler.__doc__)
+    scheduler_parser.add_argument("--devices", type=int, default=4)
+    scheduler_parser.add_argument("--tasks", type=int, default=20)
+    scheduler_parser.add_argument("--rounds", type=int, default=5, help="Model requests per simulated task")
+    scheduler_parser.add_argument("--round_time", type=float, default=0.05, help="Mean seconds per simulated round")
+    scheduler_parser.add_argument("--rpm", type=float, default=0, help="Shared LLM requests per minute (0 = unlimited)")
+    scheduler_parser.set_defaults(func=bench_scheduler)
+
+    replay_parser = subparsers.add_parser("replay", help=bench_replay.__doc__)
+    replay_parser.add_argument("--dir", help="Recorded task directory or demonstration (default: a synthetic one)")
+    replay_parser.add_argument("--rounds", type=int, default=20)
+    replay_parser.set_defaults(func=bench_replay)
+
+    ios_session_parser = subparsers.add_parser("ios-session", help=bench_ios_session.__doc__)
+    ios_session_parser.add_argument("--server", help="Appium server URL (default: a local stand-in)")
+    ios_session_parser.add_argument("--udid", default="00000000-0000000000000000")
+    ios_session_parser.add_argument("--latency", type=float, default=0.0, help="Stand-in seconds per request")
+    ios_session_parser.add_argument("--iterations", type=int, default=5)
+    ios_session_parser.set_defaults(func=bench_ios_session)
+
+    ios_capture_parser = subparsers.add_parser("ios-capture", help=bench_ios_capture.__doc__)
+    ios_capture_parser.add_argument("--server", help="Appium server URL (default: a local stand-in)")
+    ios_capture_parser.add_argument("--mjpeg_url", help="WebDriverAgent MJPEG URL (default: a local stand-in)")
+    ios_capture_parser.add_argument("--udid", default="00000000-0000000000000000")
+    ios_capture_parser.add_argument("--latency", type=float, default=0.0, help="Stand-in seconds per request")
+    ios_capture_parser.add_argument("--fps", type=int, default=15)
+    ios_capture_parser.add_argument("--iterations", type=int, default=20)
+    ios_capture_parser.set_defaults(func=bench_ios_capture)
+
+    ios_actions_parser = subparsers.add_parser("ios-actions", help=bench_ios_actions.__doc__)
+    ios_actions_parser.add_argument("--server", help="Appium server URL (default: a local stand-in)")
+    ios_actions_parser.add_argument("--udid", default="00000000-0000000000000000")
+    ios_actions_parser.add_argument("--latency", type=float, default=0.02, help="Stand-in seconds per request")
+    ios_actions_parser.add_argument("--text", default="hello world")
+    ios_actions_parser.add_argument("--iterations", type=int, default=20)
+    ios_actions_parser.set_defaults(func=bench_ios_actions)
+
+    ios_source_parser = subparsers.add_parser("ios-source", help=bench_ios_source.__doc__)
+    ios_source_parser.add_argument("--server", help="Appium server URL (default: a local stand-in)")
+    ios_source_parser.add_argument("--udid", default="00000000-0000000000000000")
+    ios_source_parser.add_argument("--depth", type=int, default=50, help="snapshotMaxDepth")
+    ios_source_parser.add_argument("--latency", type=float, default=0.0, help="Stand-in seconds per request")
+    ios_source_parser.add_argument("--node_latency", type=float, default=0.0005,
+                                   help="Stand-in seconds per snapshot node")
+    ios_source_parser.add_argument("--attribute_latency", type=float, default=0.002,
+                                   help="Stand-in seconds per node for each visible/accessible attribute")
+    ios_source_parser.add_argument("--iterations", type=int, default=10)
+    ios_source_parser.set_defaults(func=bench_ios_source)
+
+    async_devices_parser = subparsers.add_parser("async-devices", help=bench_async_devices.__doc__)
+    async_devices_parser.add_argument("--devices", type=int, default=4)
+    async_devices_parser.add_argument("--rounds", type=int, default=5)
+    async_devices_parser.add_argument("--model_latency", type=float, default=0.5,
+                                      help="Simulated seconds per model request")
+    async_devices_parser.set_defaults(func=bench_async_devices)
+
+    text_input_parser = subparsers.add_parser("text-input", help=bench_text_input.__doc__)
+    text_input_parser.add_argument("--device", required=True)
+    text_input_parser.add_argument("--length", type=int, default=200, help="Characters per text field")
+    text_input_parser.add_argument("--iterations", type=int, default=10)
+    text_input_parser.set_defaults(func=bench_text_input)
+
+    grid_parser = subparsers.add_parser("grid", help=bench_grid.__doc__)
+    grid_parser.add_argument("--iterations", type=int, default=50)
+    grid_parser.set_defaults(func=bench_grid)
+
+    image_pipeline_parser = subparsers.add_parser("image-pipeline", help=bench_image_pipeline.__doc__)
+    image_pipeline_parser.add_argument("--rounds", type=int, default=20)
+    image_pipeline_parser.add_argument("--width", type=int, default=1080)
+    image_pipeline_parser.add_argument("--height", type=int, default=2400)
+    image_pipeline_parser.set_defaults(func=bench_image_pipeline)
+
+    encode_cache_parser = subparsers.add_parser("encode-cache", help=bench_encode_cache.__doc__)
+    encode_cache_parser.add_argument("--dir", help="Directory of screenshots to encode (default: synthetic ones)")
+    encode_cache_parser.add_argument("--steps", type=int, default=10)
+    encode_cache_parser.set_defaults(func=bench_encode_cache)
+
+    similarity_parser = subparsers.add_parser("similarity", help=bench_similarity.__doc__)
+    similarity_parser.add_argument("--iterations", type=int, default=20)
+    similarity_parser.set_defaults(func=bench_similarity)
+
+    crop_diff_parser = subparsers.add_parser("crop-diff", help=bench_crop_diff.__doc__)
+    crop_diff_parser.add_argument("--iterations", type=int, default=20)
+    crop_diff_parser.set_defaults(func=bench_crop_diff)
+
+    image_budget_parser = subparsers.add_parser("image-budget", help=bench_image_budget.__doc__)
+    image_budget_parser.add_argument("--openai_model", default="gpt-5")
+    image_budget_parser.add_argument("--iterations", type=int, default=20)
+    image_budget_parser.set_defaults(func=bench_image_budget)
+
+    args = parser.parse_args()
+    args.func(args)
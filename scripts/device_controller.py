@@ -2,10 +2,25 @@
 Generic device controller that provides a unified interface
 for controlling both Android and iOS devices.
 """
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from config import load_config
+from device_health import DeviceHealthMonitor, monitored_externally
+from frame_source import CaptureFrameSource, StreamFrameSource, open_android_stream, open_http_stream
+from logging_controller import get_logger
+from settle import SettleDetector, SettleResult, frame_signature, signature_distance
 
 configs = load_config()
 
+try:
+    logger = get_logger()
+except Exception as e:
+    print(f"ERROR: Failed to load logger configuration: {e}")
+    sys.exit(1)
+
 # Platform detection and controller imports
 def _detect_platform(device):
     """Detect if device is Android or iOS based on device identifier."""
@@ -25,11 +40,27 @@ def list_all_devices():
     if platform == "ios":
         from ios_controller import IOSController
         return IOSController.list_all_devices()
+    elif platform in ("replay", "sim"):
+        from replay_controller import ReplayController
+        return ReplayController.list_all_devices()
     else:
         from android_controller import AndroidController
         return AndroidController.list_all_devices()
 
 
+class Observation:
+    """A screenshot and UI hierarchy captured together, with per-part timings in milliseconds."""
+
+    def __init__(self, frame, xml, timings):
+        self.frame = frame
+        self.xml = xml
+        self.timings = timings
+
+    @property
+    def ok(self):
+        return self.frame != "ERROR" and self.xml != "ERROR"
+
+
 class DeviceController:
     """
     Generic device controller that delegates to platform-specific implementations.
@@ -40,7 +71,7 @@ class DeviceController:
         
         Args:
             device: Device identifier (Android serial or iOS UDID)
-            platform: Platform type ("android" or "ios"). If None, auto-detects.
+            platform: Platform type ("android", "ios" or "replay"). If None, auto-detects.
         """
         if platform is None:
             platform = _detect_platform(device)
@@ -50,49 +81,223 @@ class DeviceController:
         if platform == "ios":
             from ios_controller import IOSController
             self.controller = IOSController(device)
+        elif platform in ("replay", "sim"):
+            from replay_controller import ReplayController
+            self.controller = ReplayController(device)
         else:
             from android_controller import AndroidController
             self.controller = AndroidController(device)
         
         self.device = device
         self.platform = platform
+        self.last_action_time = None
+        self.last_settle = None
+        self.frame_source = self._create_frame_source()
+        self._capture_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix=f"capture-{device}")
+        self.health_monitor = None
+        if configs.get("DEVICE_HEALTH_MONITOR", True) and hasattr(self.controller, "get_state") \
+                and not monitored_externally():
+            self.health_monitor = DeviceHealthMonitor(device, self.controller.get_state, self.controller.reconnect,
+                                                      interval=configs.get("HEALTH_CHECK_INTERVAL", 2.0),
+                                                      backoff_max=configs.get("RECONNECT_BACKOFF_MAX", 30.0))
+            self.health_monitor.add_listener(self._on_availability_changed)
+            self.health_monitor.start()
+
+    def _create_frame_source(self):
+        """Pick the frame source configured by FRAME_SOURCE ("capture" or "stream")."""
+        if configs.get("FRAME_SOURCE", "capture").lower() == "stream":
+            if self.platform == "android":
+                return StreamFrameSource(lambda: open_android_stream(self.device)).start()
+            if self.platform == "ios":
+                url = configs.get("IOS_MJPEG_URL", "http://127.0.0.1:9100")
+                return StreamFrameSource(lambda: open_http_stream(url)).start()
+        return CaptureFrameSource(self.controller)
+
+    def _acted(self, ret):
+        """Remember when the last action finished, so the next frame is taken after it."""
+        self.last_action_time = time.monotonic()
+        return ret
+
+    def _on_availability_changed(self, device, available):
+        if available and hasattr(self.controller, "reset_connections"):
+            self.controller.reset_connections()
+
+    def wait_for_device(self, timeout=None):
+        """
+        After a failed device call, wait for the device to be usable again.
+        Returns True if it is (or came back within timeout), False if it did not or no health monitor runs.
+        """
+        if self.health_monitor is None:
+            return False
+        if self.health_monitor.check():
+            return True
+        logger.warning(f"Waiting up to {timeout} s for device {self.device} to reconnect...")
+        return self.health_monitor.wait_until_available(timeout)
+
+    def close(self):
+        """Stop the frame source and release platform resources."""
+        if self.health_monitor is not None:
+            self.health_monitor.stop()
+        self._capture_pool.shutdown(wait=False)
+        self.frame_source.stop()
+        if hasattr(self.controller, "close"):
+            self.controller.close()
     
+    def _probe_frame(self):
+        """Small grayscale thumbnail of the current screen for settle detection, or None."""
+        try:
+            if isinstance(self.frame_source, StreamFrameSource):
+                frame = self.frame_source.latest(timeout=0)
+                image = frame.image if frame is not None else None
+            else:
+                image = self.controller.get_probe_image()
+            if image is None:
+                return None
+            return frame_signature(image, configs.get("SETTLE_PROBE_WIDTH", 64))
+        except Exception as e:
+            logger.error(f"Settle probe failed: {e}")
+            return None
+
+    def wait_for_settle(self):
+        """
+        Wait for the UI to stop changing after an action, as configured by SETTLE_MODE:
+        "frame" compares low-resolution screen thumbnails, "window" the focused window, and "fixed"
+        sleeps REQUEST_INTERVAL. Falls back to the fixed sleep if the probe cannot be read.
+        On Android "frame" needs FRAME_SOURCE "stream"; without it the window is probed instead, since every
+        frame probe would pull a full-resolution framebuffer over adb.
+        Returns a SettleResult, also kept as last_settle for the next observation's timings.
+        """
+        mode = configs.get("SETTLE_MODE", "frame").lower()
+        if mode == "frame" and self.platform == "android" and not isinstance(self.frame_source, StreamFrameSource):
+            mode = "window"
+        settings = {"timeout": configs.get("SETTLE_TIMEOUT", 3.0), "interval": configs.get("SETTLE_INTERVAL", 0.15),
+                    "stable_probes": configs.get("SETTLE_STABLE_PROBES", 2),
+                    "min_delay": configs.get("SETTLE_MIN_DELAY", 0.1)}
+        start_time = time.monotonic()
+        result = None
+        if mode == "frame":
+            threshold = configs.get("SETTLE_DIFF_THRESHOLD", 1.0)
+            detector = SettleDetector(self._probe_frame, lambda a, b: signature_distance(a, b) <= threshold, **settings)
+        elif mode == "window":
+            detector = SettleDetector(self.controller.get_window_state, **settings)
+        else:
+            detector = None
+        if detector is not None:
+            result = detector.wait()
+            if not result.settled and result.elapsed_ms < detector.timeout * 1000:
+                logger.warning("Settle probe failed, falling back to a fixed wait")
+                result = None
+        if result is None:
+            time.sleep(configs["REQUEST_INTERVAL"])
+            result = SettleResult(mode == "fixed", (time.monotonic() - start_time) * 1000, 0)
+        self.last_settle = result
+        return result
+
     def get_device_size(self):
         """Get device screen dimensions (width, height)."""
         return self.controller.get_device_size()
+
+    def get_bbox_space_size(self):
+        """(width, height) of the element bounds' coordinate space when it is not screenshot pixels, else None."""
+        return self.controller.get_bbox_space_size()
     
     def get_screenshot(self, prefix, save_dir):
         """Capture and save a screenshot."""
+        if isinstance(self.frame_source, StreamFrameSource):
+            frame = self.get_frame(prefix, save_dir)
+            if frame == "ERROR":
+                return frame
+            return frame.wait_saved() or frame.save(os.path.join(save_dir, prefix + ".png"))
         return self.controller.get_screenshot(prefix, save_dir)
+
+    def get_frame(self, prefix, save_dir):
+        """Capture a screenshot as an in-memory Frame (or "ERROR")."""
+        return self.frame_source.get_frame(prefix, save_dir, newer_than=self.last_action_time)
     
     def get_xml(self, prefix, save_dir):
         """Get UI hierarchy XML dump."""
         return self.controller.get_xml(prefix, save_dir)
+
+    def capture_observation(self, prefix, save_dir, include_xml=True):
+        """
+        Capture the screenshot and (optionally) the UI hierarchy concurrently.
+        The round then waits for the slower of the two device calls rather than their sum.
+        """
+        timings = {}
+
+        def timed(name, capture):
+            start_time = time.perf_counter()
+            try:
+                return capture(prefix, save_dir)
+            finally:
+                timings[name] = (time.perf_counter() - start_time) * 1000
+
+        start_time = time.perf_counter()
+        frame_future = self._capture_pool.submit(timed, "screenshot", self.get_frame)
+        xml_future = self._capture_pool.submit(timed, "xml", self.get_xml) if include_xml else None
+        frame = frame_future.result()
+        xml = xml_future.result() if xml_future is not None else None
+        timings["total"] = (time.perf_counter() - start_time) * 1000
+        if self.last_settle is not None:
+            timings["settle"] = self.last_settle.elapsed_ms
+            self.last_settle = None
+        return Observation(frame, xml, timings)
     
     def tap(self, x, y):
         """Tap at coordinates (x, y)."""
-        return self.controller.tap(x, y)
+        return self._acted(self.controller.tap(x, y))
     
     def text(self, input_str):
         """Input text string."""
-        return self.controller.text(input_str)
+        return self._acted(self.controller.text(input_str))
     
     def text_replace(self, input_str):
-        """Input text string."""
-        return self.controller.text_replace(input_str)
+        """Replace the text of the focused field with input_str."""
+        return self._acted(self.controller.text_replace(input_str))
+
+    def send_keys(self, keys):
+        """Send a sequence of platform key codes in a single device call."""
+        return self._acted(self.controller.send_keys(keys))
+
+    def input_batch(self, commands):
+        """Run several Android `input` sub-commands in a single shell invocation."""
+        if not hasattr(self.controller, "input_batch"):
+            logger.error(f"input_batch is not supported on {self.platform}")
+            return "ERROR"
+        return self._acted(self.controller.input_batch(commands))
+
+    def perform_gestures(self, gestures):
+        """
+        Perform several gestures in a single device call, e.g.
+        [("tap", x, y), ("swipe", (x1, y1), (x2, y2), 400), ("long_press", x, y, 1000)].
+        """
+        if not hasattr(self.controller, "perform_gestures"):
+            logger.error(f"perform_gestures is not supported on {self.platform}")
+            return "ERROR"
+        return self._acted(self.controller.perform_gestures(gestures))
+
+    def needs_keyboard_dismissal(self):
+        """Whether an on-screen keyboard may be left covering the screen after text input."""
+        if hasattr(self.controller, "needs_keyboard_dismissal"):
+            return self.controller.needs_keyboard_dismissal()
+        return True
+
+    def clear_text_field(self):
+        """Clear the focused text field."""
+        return self._acted(self.controller.clear_text_field())
 
     def long_press(self, x, y, duration=1000):
         """Long press at coordinates (x, y) for duration milliseconds."""
-        return self.controller.long_press(x, y, duration)
+        return self._acted(self.controller.long_press(x, y, duration))
     
     def swipe(self, x, y, direction, dist="medium", quick=False):
         """Swipe from (x, y) in direction."""
-        return self.controller.swipe(x, y, direction, dist, quick)
+        return self._acted(self.controller.swipe(x, y, direction, dist, quick))
     
     def swipe_precise(self, start, end, duration=400):
         """Precise swipe from start coordinates to end coordinates."""
-        return self.controller.swipe_precise(start, end, duration)
+        return self._acted(self.controller.swipe_precise(start, end, duration))
     
     def back(self):
         """Send back button event."""
-        return self.controller.back()
+        return self._acted(self.controller.back())
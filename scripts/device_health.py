@@ -0,0 +1,118 @@
+"""
+Background device health monitoring.
+
+A DeviceHealthMonitor polls a device's connection state. When the device disconnects or goes
+offline it tries to reconnect with exponential backoff, and it tells its listeners (the device
+controller, a scheduler) whenever the device becomes unavailable or available again, so work
+can pause and resume instead of being thrown away.
+"""
+import os
+import sys
+import threading
+
+from logging_controller import get_logger
+
+try:
+    logger = get_logger()
+except Exception as e:
+    print(f"ERROR: Failed to load logger configuration: {e}")
+    sys.exit(1)
+
+# Set by the scheduler for the executors it starts: it already monitors their devices
+EXTERNAL_MONITOR_ENV = "APPAGENT_EXTERNAL_HEALTH_MONITOR"
+
+
+def monitored_externally():
+    """True when another process (the scheduler) monitors this process's device."""
+    return os.environ.get(EXTERNAL_MONITOR_ENV) == "1"
+
+
+class DeviceHealthMonitor:
+    """Polls a device on a background thread and publishes availability changes."""
+
+    def __init__(self, device, get_state, reconnect=None, interval=2.0, backoff_initial=1.0, backoff_max=30.0):
+        """
+        Args:
+            get_state: Callable returning the device state ("device" when usable, anything else otherwise).
+            reconnect: Optional callable that tries to bring the device back (e.g. adb reconnect).
+            interval: Seconds between checks while the device is healthy.
+            backoff_initial, backoff_max: Bounds of the exponential delay between reconnect attempts.
+        """
+        self.device = device
+        self.get_state = get_state
+        self.reconnect = reconnect
+        self.interval = interval
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.state = None
+        self.disconnects = 0
+        self._listeners = []
+        self._available = threading.Event()
+        self._available.set()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def available(self):
+        return self._available.is_set()
+
+    def add_listener(self, callback):
+        """Register callback(device, available), called from the monitor thread on every change."""
+        self._listeners.append(callback)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name=f"health-{self.device}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def wait_until_available(self, timeout=None):
+        """Block until the device is available. Returns False if timeout passed first."""
+        return self._available.wait(timeout)
+
+    def check(self):
+        """Check the device once and publish a change of availability. Returns True if it is usable."""
+        try:
+            self.state = self.get_state()
+        except Exception as e:
+            logger.debug(f"Health check of {self.device} failed: {e}")
+            self.state = None
+        healthy = self.state == "device"
+        if healthy != self.available:
+            self._publish(healthy)
+        return healthy
+
+    def _publish(self, available):
+        if available:
+            logger.info(f"Device {self.device} is available again")
+            self._available.set()
+        else:
+            self.disconnects += 1
+            logger.warning(f"Device {self.device} is unavailable (state: {self.state or 'disconnected'})")
+            self._available.clear()
+        for callback in self._listeners:
+            try:
+                callback(self.device, available)
+            except Exception as e:
+                logger.error(f"Device availability listener failed: {e}")
+
+    def _run(self):
+        backoff = self.backoff_initial
+        while not self._stopped.is_set():
+            if self.check():
+                backoff = self.backoff_initial
+                self._stopped.wait(self.interval)
+                continue
+            if self.reconnect is not None:
+                try:
+                    self.reconnect()
+                except Exception as e:
+                    logger.debug(f"Reconnecting {self.device} failed: {e}")
+            self._stopped.wait(backoff)
+            backoff = min(backoff * 2, self.backoff_max)
@@ -0,0 +1,91 @@
+"""
+Changed regions between consecutive screenshots.
+
+Many rounds change only a small part of the screen (a dropdown opens, a checkbox ticks, a field fills).
+changed_regions finds the bounding boxes of what changed between two frames on their memoized
+low-resolution grayscale, and grid_crop_images uses them for the crop-to-diff mode: instead of the whole
+grid image the model gets a crop of the grid image around the change, aligned to grid cells so the cell
+labels (and area_to_xy) stay those of the full screen, plus a low-resolution thumbnail of the whole screen.
+"""
+import cv2
+import numpy as np
+
+from config import load_config
+from frame import Frame, downscale
+
+configs = load_config()
+
+# Width of the grayscale images compared by changed_regions
+DIFF_WIDTH = 360
+
+
+def changed_regions(previous, current, threshold=None, ignore_top=None, min_pixels=4):
+    """
+    Bounding boxes ((x1, y1), (x2, y2)) in pixels of current of the areas that differ from previous,
+    largest first. The top `ignore_top` fraction of the screen (the status bar clock) is ignored.
+    """
+    threshold = configs.get("DIFF_THRESHOLD", 24) if threshold is None else threshold
+    ignore_top = configs.get("DIFF_IGNORE_TOP", 0.04) if ignore_top is None else ignore_top
+    before, after = previous.gray(DIFF_WIDTH), current.gray(DIFF_WIDTH)
+    if before.shape != after.shape:
+        return [((0, 0), (current.width, current.height))]
+    changed = cv2.absdiff(before, after) > threshold
+    changed[:int(changed.shape[0] * ignore_top)] = False
+    changed = cv2.dilate(changed.astype(np.uint8), np.ones((5, 5), np.uint8))
+    count, _, stats, _ = cv2.connectedComponentsWithStats(changed, connectivity=8)
+    scale = current.width / after.shape[1]
+    regions = []
+    for x, y, w, h, pixels in sorted(stats[1:].tolist(), key=lambda stat: -stat[4]):
+        if pixels < min_pixels:
+            continue
+        regions.append(((int(x * scale), int(y * scale)),
+                        (min(current.width, int((x + w) * scale)), min(current.height, int((y + h) * scale)))))
+    return regions
+
+
+def _cell_span(start, end, min_cells, limit):
+    """Grow [start, end) to at least min_cells cells and shift it inside [0, limit)."""
+    if end - start < min_cells:
+        grow = min_cells - (end - start)
+        start, end = start - grow // 2, end + grow - grow // 2
+    if start < 0:
+        start, end = 0, end - start
+    if end > limit:
+        start, end = max(0, start - (end - limit)), limit
+    return start, end
+
+
+def grid_crop_box(regions, width, height, rows, cols, padding_cells=1, min_cells=6):
+    """
+    The union of regions grown by padding_cells, at least min_cells cells in each direction and snapped
+    to the cell boundaries of the rows x cols grid drawn over a width x height image.
+    """
+    unit_width, unit_height = max(1, width // cols), max(1, height // rows)
+    left, right = _cell_span(min(region[0][0] for region in regions) // unit_width - padding_cells,
+                             -(-max(region[1][0] for region in regions) // unit_width) + padding_cells,
+                             min_cells, cols)
+    top, bottom = _cell_span(min(region[0][1] for region in regions) // unit_height - padding_cells,
+                             -(-max(region[1][1] for region in regions) // unit_height) + padding_cells,
+                             min_cells, rows)
+    return (left * unit_width, top * unit_height), (min(width, right * unit_width), min(height, bottom * unit_height))
+
+
+def grid_crop_images(previous, current, rows, cols):
+    """
+    For the crop-to-diff mode: (full-resolution crop of current.annotated around the change, low-resolution
+    thumbnail of current.annotated), or None when the whole screen should be sent (no previous frame, no change, or a
+    change covering more than CROP_MAX_AREA of the screen).
+    """
+    annotated = current.annotated
+    if previous is None or annotated is None or not isinstance(previous, Frame):
+        return None
+    regions = changed_regions(previous, current)
+    if not regions:
+        return None
+    (x1, y1), (x2, y2) = grid_crop_box(regions, annotated.width, annotated.height, rows, cols)
+    if (x2 - x1) * (y2 - y1) > configs.get("CROP_MAX_AREA", 0.4) * annotated.width * annotated.height:
+        return None
+    crop = Frame(np.ascontiguousarray(annotated.image[y1:y2, x1:x2]))
+    crop.grid_label_px = annotated.grid_label_px  # Full-resolution crop: same label size as the grid image
+    thumbnail = Frame(downscale(annotated.image, configs.get("CROP_THUMBNAIL_WIDTH", 360)))
+    return crop, thumbnail
@@ -0,0 +1,95 @@
+"""
+Cache of encoded model image payloads.
+
+encode_image resizes and JPEG-encodes a screenshot for every model request, and the same image is often
+sent more than once: a retried round, and in self exploration and document generation every "after"
+image is the next step's "before". EncodeCache keeps the base64 payloads in a bounded LRU keyed by a
+hash of the image content, max_width and quality, optionally backed by a directory on disk so payloads
+survive across runs.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+def content_hash(data):
+    """Hash of the image bytes (SHA-1 is the fastest hashlib digest for this)."""
+    return hashlib.sha1(data, usedforsecurity=False).hexdigest()
+
+
+class EncodeCache:
+    """Bounded LRU of base64 payloads with hit/miss counters and an optional on-disk tier."""
+
+    def __init__(self, max_entries=64, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def key(data, max_width, quality):
+        return f"{content_hash(data)}_{max_width}_{quality}"
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + ".b64")
+
+    def get(self, key):
+        """Return the cached payload for key, or None."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), "r", encoding="ascii") as f:
+                    payload = f.read()
+            except OSError:
+                payload = None
+            if payload:
+                with self._lock:
+                    self.disk_hits += 1
+                self._remember(key, payload)
+                return payload
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, payload):
+        self._remember(key, payload)
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), "w", encoding="ascii") as f:
+                    f.write(payload)
+            except OSError:
+                pass
+
+    def _remember(self, key, payload):
+        with self._lock:
+            self._entries[key] = payload
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_encode(self, data, max_width, quality, encode):
+        """Return the payload for the image content `data`, calling encode() only on a miss."""
+        if not self.max_entries and not self.disk_dir:
+            return encode()
+        key = self.key(data, max_width, quality)
+        payload = self.get(key)
+        if payload is None:
+            payload = encode()
+            if payload:
+                self.put(key, payload)
+        return payload
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses, "entries": len(self._entries),
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0}
@@ -0,0 +1,163 @@
+"""
+In-memory screenshot frames.
+
+A Frame holds the decoded pixels of one screenshot (BGR, as used by OpenCV) so a
+round can work on it without reloading the image from disk. Encoded PNG bytes and
+other derived products (the downscaled grayscale used for similarity, the base64 JPEG
+sent to the model) are produced lazily and memoized, the grid or label annotation of a
+screenshot is kept as its `annotated` frame, and persisting a frame to the task
+directory can happen in the background.
+
+Frames can also wrap the raw framebuffer written by `screencap` (without `-p`):
+the pixels are then a zero-copy view over the captured bytes, so no PNG is ever
+encoded on the device or decoded on the host.
+"""
+import base64
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# A single writer keeps background saves (screenshots, XML dumps) ordered and off the round's critical path
+background_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="background-writer")
+
+
+def wait_for_background_writes():
+    """Block until every save queued on the background writer so far has finished."""
+    background_writer.submit(lambda: None).result()
+
+# screencap pixel formats (android.graphics.PixelFormat) and the channel order of their first three bytes
+RAW_PIXEL_FORMATS = {1: "RGB", 2: "RGB", 5: "BGR"}  # RGBA_8888, RGBX_8888, BGRA_8888
+
+
+def parse_raw_screencap(data):
+    """
+    Parse the output of `screencap` without `-p`.
+
+    The header is width, height and pixel format as little-endian uint32, followed by a
+    color space field on Android 10 and newer. Returns (width, height, pixel_format, pixels)
+    where pixels is a read-only (height, width, 4) view over `data`.
+    """
+    if len(data) < 12:
+        raise ValueError("Raw screencap output is too short")
+    width, height, pixel_format = np.frombuffer(data, dtype="<u4", count=3)
+    width, height, pixel_format = int(width), int(height), int(pixel_format)
+    if pixel_format not in RAW_PIXEL_FORMATS:
+        raise ValueError(f"Unsupported raw screencap pixel format {pixel_format}")
+    header_size = len(data) - width * height * 4
+    if header_size not in (12, 16):
+        raise ValueError(f"Unexpected raw screencap size {len(data)} for {width}x{height}")
+    pixels = np.frombuffer(data, dtype=np.uint8, count=width * height * 4, offset=header_size)
+    return width, height, pixel_format, pixels.reshape(height, width, 4)
+
+
+def downscale(image, max_width):
+    """Resize to at most max_width pixels wide, keeping the aspect ratio."""
+    height, width = image.shape[:2]
+    if width <= max_width:
+        return image
+    return cv2.resize(image, (max_width, int(height * max_width / width)), interpolation=cv2.INTER_AREA)
+
+
+class Frame:
+    """A decoded screenshot plus lazily computed, memoized encodings and derived images."""
+
+    def __init__(self, image, png_bytes=None, path=None, timestamp=None):
+        self.image = image
+        self._png_bytes = png_bytes
+        self.path = path
+        self.timestamp = time.monotonic() if timestamp is None else timestamp
+        self.annotated = None
+        self.grid_label_px = None  # Height of the cell numbers when this is a grid image
+        self._derived = {}
+        self._save_future = None
+
+    @classmethod
+    def from_png(cls, data, path=None):
+        """Decode PNG (or any OpenCV-readable) bytes into a frame."""
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Screenshot bytes could not be decoded")
+        return cls(image, png_bytes=data, path=path)
+
+    @classmethod
+    def from_raw(cls, data, path=None):
+        """Wrap raw `screencap` output without copying or decoding the pixels."""
+        _, _, pixel_format, pixels = parse_raw_screencap(data)
+        if RAW_PIXEL_FORMATS[pixel_format] == "RGB":
+            image = pixels[..., 2::-1]
+        else:
+            image = pixels[..., :3]
+        return cls(image, path=path)
+
+    @classmethod
+    def from_path(cls, path):
+        """Load a frame from an image file on disk."""
+        image = cv2.imread(path)
+        if image is None:
+            raise ValueError(f"Screenshot could not be read from {path}")
+        return cls(image, path=path)
+
+    @property
+    def width(self):
+        return self.image.shape[1]
+
+    @property
+    def height(self):
+        return self.image.shape[0]
+
+    @property
+    def rgb(self):
+        """RGB view of the pixels (no copy), e.g. for PIL."""
+        return self.image[..., ::-1]
+
+    @property
+    def png_bytes(self):
+        """PNG encoding of the frame, computed on first access."""
+        if self._png_bytes is None:
+            ok, buffer = cv2.imencode(".png", np.ascontiguousarray(self.image))
+            if not ok:
+                raise ValueError("Failed to encode frame as PNG")
+            self._png_bytes = buffer.tobytes()
+        return self._png_bytes
+
+    def derived(self, key, compute):
+        """Return compute() the first time `key` is asked for, and the memoized result afterwards."""
+        if key not in self._derived:
+            self._derived[key] = compute()
+        return self._derived[key]
+
+    def gray(self, max_width=800):
+        """Grayscale copy at most max_width pixels wide (memoized)."""
+        return self.derived(("gray", max_width),
+                            lambda: cv2.cvtColor(downscale(self.image, max_width), cv2.COLOR_BGR2GRAY))
+
+    def jpeg_base64(self, max_width=800, quality=75):
+        """Base64 JPEG at most max_width pixels wide, as sent to the models (memoized)."""
+        def encode():
+            ok, buffer = cv2.imencode(".jpg", downscale(self.image, max_width), [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ok:
+                raise ValueError("Failed to encode frame as JPEG")
+            return base64.b64encode(buffer.tobytes()).decode("utf-8")
+        return self.derived(("jpeg", max_width, quality), encode)
+
+    def save(self, path):
+        """Write the frame to disk as PNG and remember the path."""
+        with open(path, "wb") as f:
+            f.write(self.png_bytes)
+        self.path = path
+        return path
+
+    def save_async(self, path):
+        """Write the frame to disk on the background writer thread."""
+        self.path = path
+        self._save_future = background_writer.submit(self.save, path)
+        return self._save_future
+
+    def wait_saved(self, timeout=None):
+        """Block until a pending background save has finished. Returns the saved path."""
+        if self._save_future is not None:
+            self._save_future.result(timeout)
+        return self.path if self.path and os.path.exists(self.path) else None
@@ -0,0 +1,227 @@
+"""
+Frame sources for DeviceController.
+
+A frame source decides how screenshots are observed:
+- CaptureFrameSource asks the platform controller for a fresh screenshot on every call.
+- StreamFrameSource keeps a continuous MJPEG screen stream open, decodes it on a background
+  thread and always exposes the latest frame, so reading the screen is near-instant.
+
+Android streams come from `screenrecord` (H.264) transcoded to MJPEG by ffmpeg; iOS streams
+come from WebDriverAgent's MJPEG server (open_http_stream). Any other MJPEG producer reachable
+over TCP can be used with open_tcp_stream.
+"""
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from abc import abstractmethod
+
+import cv2
+import numpy as np
+
+from config import load_config
+from frame import Frame
+from logging_controller import get_logger
+
+configs = load_config()
+
+try:
+    logger = get_logger()
+except Exception as e:
+    print(f"ERROR: Failed to load logger configuration: {e}")
+    sys.exit(1)
+
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+
+
+class ProcessStream:
+    """Readable stdout of the last process in a pipeline; closing it terminates the whole pipeline."""
+
+    def __init__(self, processes):
+        self.processes = processes
+        self.stdout = processes[-1].stdout
+
+    def read1(self, size):
+        return self.stdout.read1(size)
+
+    def close(self):
+        for process in self.processes:
+            try:
+                process.kill()
+            except Exception:
+                pass
+        for process in self.processes:
+            try:
+                process.wait(timeout=2)
+            except Exception:
+                pass
+
+
+def open_android_stream(device, bit_rate=None, max_fps=None):
+    """
+    Open a continuous MJPEG stream of an Android screen.
+    `screenrecord` writes raw H.264 over exec-out and ffmpeg transcodes it to MJPEG on stdout.
+    screenrecord stops after its time limit; StreamFrameSource reopens the stream when it ends.
+    """
+    bit_rate = bit_rate or configs.get("STREAM_BIT_RATE", 4000000)
+    max_fps = max_fps or configs.get("STREAM_MAX_FPS", 15)
+    record = subprocess.Popen(["adb", "-s", device, "exec-out", "screenrecord", "--output-format=h264",
+                               f"--bit-rate={bit_rate}", "-"],
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    transcode = subprocess.Popen(["ffmpeg", "-loglevel", "error", "-f", "h264", "-i", "-", "-r", str(max_fps),
+                                  "-f", "mjpeg", "-q:v", "3", "-"],
+                                 stdin=record.stdout, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    record.stdout.close()  # Let screenrecord receive SIGPIPE if ffmpeg exits
+    return ProcessStream([record, transcode])
+
+
+def open_tcp_stream(host, port, timeout=5):
+    """Open an MJPEG stream served over a TCP socket (multipart HTTP responses also work)."""
+    sock = socket.create_connection((host, port), timeout=timeout)
+    sock.settimeout(None)
+    return sock.makefile("rb")
+
+
+def open_http_stream(url, timeout=5):
+    """Open a multipart MJPEG stream served over HTTP, such as WebDriverAgent's mjpegServerPort."""
+    return urllib.request.urlopen(url, timeout=timeout)
+
+
+class FrameSource:
+    """Produces Frames for a device."""
+
+    def start(self):
+        return self
+
+    def stop(self):
+        pass
+
+    @abstractmethod
+    def get_frame(self, prefix, save_dir, newer_than=None):
+        """Return a Frame (or "ERROR"), persisting it under save_dir as `<prefix>.png` if enabled."""
+        pass
+
+
+class CaptureFrameSource(FrameSource):
+    """Capture a new screenshot from the platform controller on every call."""
+
+    def __init__(self, controller):
+        self.controller = controller
+
+    def get_frame(self, prefix, save_dir, newer_than=None):
+        return self.controller.get_frame(prefix, save_dir)
+
+
+class StreamFrameSource(FrameSource):
+    """Decode a continuous MJPEG stream in the background and serve the latest frame."""
+
+    def __init__(self, open_stream, wait_timeout=None, reconnect_delay=1.0, chunk_size=65536):
+        """
+        Args:
+            open_stream: Callable returning a binary stream with read1() and close().
+            wait_timeout: Seconds get_frame waits for a frame newer than requested before using the latest one.
+            reconnect_delay: Seconds to wait before reopening a stream that ended or failed.
+        """
+        self.open_stream = open_stream
+        self.wait_timeout = configs.get("STREAM_FRAME_TIMEOUT", 1.0) if wait_timeout is None else wait_timeout
+        self.reconnect_delay = reconnect_delay
+        self.chunk_size = chunk_size
+        self.frames_decoded = 0
+        self._latest = None
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._stream = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="frame-stream", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        stream = self._stream
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def _publish(self, frame):
+        with self._condition:
+            self._latest = frame
+            self.frames_decoded += 1
+            self._condition.notify_all()
+
+    def _consume(self, stream):
+        buffer = bytearray()
+        while not self._stopped.is_set():
+            chunk = stream.read1(self.chunk_size)
+            if not chunk:
+                return
+            buffer += chunk
+            end = buffer.rfind(JPEG_EOI)
+            if end < 0:
+                continue
+            start = buffer.rfind(JPEG_SOI, 0, end)
+            jpeg = bytes(buffer[start:end + 2]) if start >= 0 else None
+            # Only the newest complete JPEG is decoded; older ones in the buffer are already stale
+            del buffer[:end + 2]
+            if jpeg is None:
+                continue
+            image = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is not None:
+                self._publish(Frame(image))
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self._stream = self.open_stream()
+                self._consume(self._stream)
+            except Exception as e:
+                if not self._stopped.is_set():
+                    logger.warning(f"Screen stream failed: {e}")
+            finally:
+                if self._stream is not None:
+                    try:
+                        self._stream.close()
+                    except Exception:
+                        pass
+                    self._stream = None
+            self._stopped.wait(self.reconnect_delay)
+
+    def latest(self, timeout=None, newer_than=None):
+        """
+        Return the latest decoded frame.
+        If newer_than (a time.monotonic() timestamp) is given, wait up to timeout seconds for a frame
+        captured after it; the latest frame is returned either way, or None if none has arrived yet.
+        """
+        deadline = time.monotonic() + (self.wait_timeout if timeout is None else timeout)
+        with self._condition:
+            while True:
+                frame = self._latest
+                if frame is not None and (newer_than is None or frame.timestamp > newer_than):
+                    return frame
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return frame
+                self._condition.wait(remaining)
+
+    def get_frame(self, prefix, save_dir, newer_than=None):
+        latest = self.latest(newer_than=newer_than)
+        if latest is None:
+            logger.error("No frame received from the screen stream")
+            return "ERROR"
+        # A fresh Frame per caller, so saving one round's copy never renames another's
+        frame = Frame(latest.image, timestamp=latest.timestamp)
+        if configs.get("SAVE_SCREENSHOTS", True):
+            frame.save_async(os.path.join(save_dir, prefix + ".png"))
+        return frame
@@ -0,0 +1,167 @@
+"""
+Client for a persistent on-device UI hierarchy server.
+
+`uiautomator dump` starts a new instrumentation for every call, which takes seconds and
+fails on animated screens. A hierarchy server instead runs continuously on the device
+(an instrumentation or accessibility service) and is reached over an `adb forward` socket.
+
+Wire protocol (one request per line, over a kept-alive TCP connection):
+    request:   DUMP [<known_version>]\n
+    response:  <status> <version> <length>\n<length bytes of XML>
+where status is FULL (payload is the complete hierarchy) or UNCHANGED (the hierarchy still
+matches known_version and no payload follows), and version changes whenever the UI does.
+"""
+import socket
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+from logging_controller import get_logger
+from ui_hierarchy import UIHierarchy
+
+try:
+    logger = get_logger()
+except Exception as e:
+    print(f"ERROR: Failed to load logger configuration: {e}")
+    sys.exit(1)
+
+
+class HierarchyServerError(Exception):
+    """Raised when the hierarchy server cannot be reached or answers with an invalid response."""
+
+
+class HierarchyServerClient:
+    """Fetches UI hierarchies from a hierarchy server, reusing the last tree while the UI is unchanged."""
+
+    def __init__(self, host, port, timeout=5):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+        self.version = None
+        self.hierarchy = None
+
+    def connect(self):
+        try:
+            self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        except OSError as e:
+            raise HierarchyServerError(f"Cannot connect to hierarchy server at {self.host}:{self.port}: {e}")
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+
+    def close(self):
+        for resource in (self.reader, self.sock):
+            if resource is not None:
+                try:
+                    resource.close()
+                except OSError:
+                    pass
+        self.sock = None
+        self.reader = None
+
+    def _request(self, line):
+        if self.sock is None:
+            self.connect()
+        try:
+            self.sock.sendall(line.encode("utf-8") + b"\n")
+            header = self.reader.readline()
+            if not header:
+                raise HierarchyServerError("Hierarchy server closed the connection")
+            status, version, length = header.decode("utf-8").split()
+            payload = self.reader.read(int(length)) if int(length) else b""
+        except (OSError, ValueError) as e:
+            self.close()
+            raise HierarchyServerError(f"Invalid response from hierarchy server: {e}")
+        except HierarchyServerError:
+            self.close()
+            raise
+        return status, version, payload
+
+    def dump(self):
+        """Return the current UIHierarchy."""
+        request = "DUMP" if self.version is None else f"DUMP {self.version}"
+        status, version, payload = self._request(request)
+        if status == "UNCHANGED" and self.hierarchy is not None:
+            # Reuse the parsed tree; a new wrapper keeps per-round save paths apart
+            return UIHierarchy(self.hierarchy.root, xml_bytes=self.hierarchy.xml_bytes)
+        if status not in ("FULL", "UNCHANGED"):
+            raise HierarchyServerError(f"Unexpected hierarchy server status {status}")
+        if status == "UNCHANGED":
+            # We lost our cached copy; ask for the full hierarchy
+            self.version = None
+            return self.dump()
+        try:
+            self.hierarchy = UIHierarchy.from_bytes(payload)
+        except ET.ParseError as e:
+            raise HierarchyServerError(f"Hierarchy server sent invalid XML: {e}")
+        self.version = version
+        return self.hierarchy
+
+
+class AndroidHierarchyServer:
+    """
+    Sets up and talks to a hierarchy server on an Android device.
+    The device port is forwarded once to a free local port, reused across reconnects and removed by close();
+    if the server does not answer, the configured start command is run once on the device and the connection
+    is retried.
+    """
+
+    def __init__(self, controller, device_port, start_command=None, retry_interval=30):
+        self.controller = controller
+        self.device_port = device_port
+        self.start_command = start_command
+        self.retry_interval = retry_interval
+        self.client = None
+        self.local_port = None
+        self._unavailable_until = 0
+
+    @property
+    def available(self):
+        return time.monotonic() >= self._unavailable_until
+
+    def _connect(self):
+        if self.local_port is None:
+            self.local_port = self.controller.forward(self.device_port)
+            if self.local_port is None:
+                raise HierarchyServerError("adb forward for the hierarchy server failed")
+        client = HierarchyServerClient("127.0.0.1", self.local_port)
+        try:
+            client.dump()
+        except HierarchyServerError:
+            if not self.start_command:
+                raise
+            logger.info("Starting the on-device hierarchy server")
+            self.controller.shell(f"nohup {self.start_command} >/dev/null 2>&1 &")
+            time.sleep(2)
+            client.dump()
+        self.client = client
+
+    def dump(self):
+        """Return the current UIHierarchy, or None if the server is unavailable (the caller falls back)."""
+        if not self.available:
+            return None
+        try:
+            if self.client is None:
+                self._connect()
+                return self.client.hierarchy
+            return self.client.dump()
+        except HierarchyServerError as e:
+            logger.warning(f"Hierarchy server unavailable, using uiautomator dump: {e}")
+            if self.client is not None:
+                self.client.close()
+            self.client = None
+            self._unavailable_until = time.monotonic() + self.retry_interval
+            return None
+
+    def reset(self):
+        """Forget a previous failure so the next dump tries the server again (e.g. after a reconnect)."""
+        self._unavailable_until = 0
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+        if self.local_port is not None:
+            self.controller.remove_forward(self.local_port)
+            self.local_port = None
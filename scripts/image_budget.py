@@ -0,0 +1,100 @@
+"""
+Per-provider image budgets.
+
+Both providers bill an image by the tiles it covers at the size they process it: OpenAI fits it into
+2048x2048, shrinks the shortest side to 768 and counts 512 px tiles; Gemini counts 768 px tiles of 258
+tokens (one tile for images up to 384x384). A fixed max_width of 800 usually lands just past a tile
+boundary, or above the size OpenAI keeps anyway. An ImageBudgeter sends a grid image (a Frame with
+grid_label_px set by draw_grid) at the smallest width at which its cell numbers are still IMAGE_MIN_LABEL_PX
+tall, and any other image at the smallest width that costs as many tokens as the default 800 px would.
+"""
+import math
+from abc import abstractmethod
+
+from PIL import Image
+
+from config import load_config
+from frame import Frame
+
+configs = load_config()
+
+# The max_width encode_image uses by default
+DEFAULT_MAX_WIDTH = 800
+
+
+def image_size(image):
+    """(width, height) of a Frame or an image file (only the header is read)."""
+    if isinstance(image, Frame):
+        return image.width, image.height
+    with Image.open(image) as img:
+        return img.size
+
+
+class ImageBudgeter:
+    tile = 512
+
+    def __init__(self, min_label_px=None, quality=None, small_label_quality=None):
+        self.min_label_px = configs.get("IMAGE_MIN_LABEL_PX", 8) if min_label_px is None else min_label_px
+        self.quality = configs.get("IMAGE_JPEG_QUALITY", 75) if quality is None else quality
+        self.small_label_quality = configs.get("IMAGE_SMALL_LABEL_QUALITY", 85) \
+            if small_label_quality is None else small_label_quality
+
+    def max_scale(self, width, height):
+        """Largest useful scale: the provider would shrink anything bigger itself."""
+        return 1.0
+
+    @abstractmethod
+    def tokens(self, width, height) -> int:
+        pass
+
+    def tokens_at(self, width, height, max_width):
+        """Estimated tokens of a width x height image sent at most max_width pixels wide."""
+        max_width = min(width, max_width)
+        return self.tokens(max_width, int(height * max_width / width))
+
+    def plan(self, width, height, label_px=None):
+        """
+        (max_width, quality, estimated tokens) for sending a width x height image.
+        label_px is the height of the cell numbers of a grid image; the width is then the smallest that keeps
+        them IMAGE_MIN_LABEL_PX tall (fidelity is only raised for them). Other images get the smallest width
+        with the token count of DEFAULT_MAX_WIDTH, which only saves bytes.
+        """
+        limit = max(1, int(width * self.max_scale(width, height)))
+        if label_px:
+            max_width = min(limit, math.ceil(width * self.min_label_px / label_px))
+        else:
+            max_width = min(limit, DEFAULT_MAX_WIDTH)
+            target, low = self.tokens_at(width, height, max_width), 1
+            while low < max_width:  # Tokens never decrease with the width
+                middle = (low + max_width) // 2
+                if self.tokens_at(width, height, middle) < target:
+                    low = middle + 1
+                else:
+                    max_width = middle
+        # When the provider's size limit keeps the labels below IMAGE_MIN_LABEL_PX, spare them JPEG ringing instead
+        small = label_px and label_px * min(width, max_width) / width < self.min_label_px
+        return max_width, self.small_label_quality if small else self.quality, self.tokens_at(width, height, max_width)
+
+
+class OpenAIImageBudgeter(ImageBudgeter):
+    def __init__(self, model="", **kwargs):
+        super().__init__(**kwargs)
+        # Base and per-tile tokens of high-detail images
+        self.base_tokens, self.tile_tokens = (70, 140) if model.startswith("gpt-5") else (85, 170)
+
+    def max_scale(self, width, height):
+        return min(1.0, 2048 / max(width, height), 768 / min(width, height))
+
+    def tokens(self, width, height):
+        scale = self.max_scale(width, height)
+        width, height = width * scale, height * scale
+        return self.base_tokens + self.tile_tokens * math.ceil(width / self.tile) * math.ceil(height / self.tile)
+
+
+class GeminiImageBudgeter(ImageBudgeter):
+    tile = 768
+
+    def tokens(self, width, height):
+        if width <= 384 and height <= 384:
+            return 258
+        return 258 * math.ceil(width / self.tile) * math.ceil(height / self.tile)
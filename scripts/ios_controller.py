@@ -5,7 +5,14 @@ import os
 import time
 from appium import webdriver
 from appium.options.ios import XCUITestOptions
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.remote.command import Command
 import sys
+import cv2
+import numpy as np
+from frame import Frame
+from ios_hierarchy import excluded_attributes, ios_source_to_hierarchy
+from ios_session import AttachedRemote, SessionKeepAlive, SessionStore, session_alive
 from logging_controller import get_logger
 
 from config import load_config
@@ -18,6 +25,39 @@ except Exception as e:
     print(f"ERROR: Failed to load logger configuration: {e}")
     sys.exit(1)
 
+# XCUIKeyboardKeyDelete
+IOS_DELETE_KEY = "\b"
+
+# Pause between gestures of a batch, so consecutive touches are not merged
+GESTURE_GAP_MS = 100
+
+
+def w3c_gesture_steps(gesture):
+    """
+    W3C pointer action steps for one gesture:
+    ("tap", x, y), ("long_press", x, y, duration_ms) or ("swipe", (x1, y1), (x2, y2), duration_ms).
+    """
+    kind = gesture[0]
+    if kind == "tap":
+        _, x, y = gesture
+        start, end, hold, move = (x, y), None, 50, 0
+    elif kind == "long_press":
+        _, x, y, duration = gesture
+        start, end, hold, move = (x, y), None, duration, 0
+    elif kind == "swipe":
+        _, start, end, duration = gesture
+        hold, move = 50, duration
+    else:
+        raise ValueError(f"Unknown gesture {kind}")
+    steps = [{"type": "pointerMove", "duration": 0, "x": int(start[0]), "y": int(start[1])},
+             {"type": "pointerDown", "button": 0},
+             {"type": "pause", "duration": hold}]
+    if end is not None:
+        steps.append({"type": "pointerMove", "duration": move, "x": int(end[0]), "y": int(end[1])})
+    steps.append({"type": "pointerUp", "button": 0})
+    return steps
+
+
 class IOSController:
     """iOS device controller using Appium."""
     
@@ -36,19 +76,46 @@ class IOSController:
         self.device = device
         self.width, self.height = 0, 0
         self.driver = None
+        self.persistent = configs.get("IOS_PERSISTENT_SESSION", False)
+        self.session_store = SessionStore(configs.get("IOS_SESSION_FILE", ".ios_sessions.json"))
+        self.keep_alive = None
         self._initialize_driver()
         self.width, self.height = self.get_device_size()
     
     def __del__(self):
-        """Cleanup: close driver connection."""
-        if self.driver:
+        """Cleanup: close driver connection (a persistent session is left running for the next run)."""
+        if self.keep_alive is not None:
+            self.keep_alive.stop()
+        if self.driver and not self.persistent:
             try:
                 self.driver.quit()
             except:
                 pass
-    
+
+    def _attach_driver(self, appium_server, options):
+        """Reattach to the session stored for this device if it is still alive. Returns True on success."""
+        session_id = self.session_store.get(self.device, appium_server)
+        if not session_id:
+            return False
+        if not session_alive(appium_server, session_id):
+            logger.debug(f"Stored iOS session {session_id} is gone, creating a new one")
+            self.session_store.forget(self.device)
+            return False
+        self.driver = AttachedRemote(appium_server, session_id, options=options)
+        logger.debug(f"Reattached to iOS session {session_id}")
+        return True
+
+    def _start_keep_alive(self, appium_server):
+        self.keep_alive = SessionKeepAlive(appium_server, self.driver.session_id,
+                                           interval=configs.get("IOS_KEEPALIVE_INTERVAL", 60),
+                                           on_expired=lambda: self.session_store.forget(self.device)).start()
+
     def _initialize_driver(self):
-        """Initialize Appium WebDriver for iOS device."""
+        """
+        Initialize Appium WebDriver for iOS device.
+        With IOS_PERSISTENT_SESSION the session is reused across runs: a live stored session is reattached,
+        otherwise a new one is created and stored.
+        """
         try:
             options = XCUITestOptions()
             options.platform_name = "iOS"
@@ -56,19 +123,38 @@ class IOSController:
             options.automation_name = "XCUITest"
             options.udid = self.device
             options.platform_version = configs.get("IOS_PLATFORM_VERSION", "17.0")
-            options.new_command_timeout = 300
+            options.new_command_timeout = configs.get("IOS_SESSION_TIMEOUT", 3600) if self.persistent else 300
             
             # Optional bundle ID if needed
             if configs.get("IOS_BUNDLE_ID"):
                 options.bundle_id = configs["IOS_BUNDLE_ID"]
                 options.auto_launch = configs.get("IOS_AUTO_LAUNCH", False)
+
+            if configs.get("FRAME_SOURCE", "capture").lower() == "stream":
+                options.set_capability("mjpegServerPort", configs.get("IOS_MJPEG_PORT", 9100))
             
             appium_server = configs.get("APPIUM_SERVER", "http://localhost:4723")
-            self.driver = webdriver.Remote(appium_server, options=options)
-            time.sleep(2)  # Wait for connection
+            if self.persistent and self._attach_driver(appium_server, options):
+                self._start_keep_alive(appium_server)
+            else:
+                self.driver = webdriver.Remote(appium_server, options=options)
+                time.sleep(2)  # Wait for connection
+                if self.persistent:
+                    self.session_store.put(self.device, appium_server, self.driver.session_id)
+                    self._start_keep_alive(appium_server)
+            self._apply_settings()
         except Exception as e:
             logger.error(f"Failed to initialize iOS driver: {e}")
             raise
+
+    def _apply_settings(self):
+        """Session settings; applied to reattached sessions too so config changes take effect."""
+        settings = {"snapshotMaxDepth": configs.get("IOS_SNAPSHOT_MAX_DEPTH", 50)}
+        if configs.get("FRAME_SOURCE", "capture").lower() == "stream":
+            settings.update(mjpegServerFramerate=configs.get("STREAM_MAX_FPS", 15),
+                            mjpegServerScreenshotQuality=configs.get("IOS_MJPEG_QUALITY", 50),
+                            mjpegScalingFactor=100)
+        self.driver.update_settings(settings)
     
     def get_device_size(self):
         """Get iOS device screen dimensions."""
@@ -78,6 +164,10 @@ class IOSController:
         except Exception as e:
             logger.error(f"Failed to get device size: {e}")
             return 0, 0
+
+    def get_bbox_space_size(self):
+        """Element bounds are in points, not screenshot pixels: (width, height) of the point space."""
+        return self.get_device_size()
     
     def get_screenshot(self, prefix, save_dir):
         """Capture and save screenshot from iOS device."""
@@ -89,18 +179,65 @@ class IOSController:
             logger.error(f"Failed to capture screenshot: {e}")
             return "ERROR"
     
+    def get_frame(self, prefix, save_dir):
+        """
+        Capture a screenshot from iOS device as an in-memory Frame.
+        The PNG is decoded straight from the response; the copy in save_dir is written in the background
+        (or not at all if SAVE_SCREENSHOTS is off).
+        """
+        try:
+            frame = Frame.from_png(self.driver.get_screenshot_as_png())
+        except ValueError as e:
+            logger.error(f"Failed to decode screenshot: {e}")
+            return "ERROR"
+        except Exception as e:
+            logger.error(f"Failed to capture screenshot: {e}")
+            return "ERROR"
+        if configs.get("SAVE_SCREENSHOTS", True):
+            frame.save_async(os.path.join(save_dir, prefix + ".png"))
+        return frame
+
+    def get_probe_image(self):
+        """Grab the screen for settle detection without writing it to disk. None on failure."""
+        try:
+            data = self.driver.get_screenshot_as_png()
+        except Exception as e:
+            logger.error(f"Failed to capture screenshot: {e}")
+            return None
+        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+
+    def get_window_state(self):
+        """Return the bundle id of the foreground app, or None on failure."""
+        try:
+            return self.driver.execute_script("mobile: activeAppInfo").get("bundleId")
+        except Exception as e:
+            logger.error(f"Failed to get active app: {e}")
+            return None
+
     def get_xml(self, prefix, save_dir):
-        """Get UI hierarchy XML dump from iOS device."""
+        """
+        Get the UI hierarchy from iOS device as an in-memory UIHierarchy in the uiautomator schema.
+        Uses `mobile: source` in IOS_SOURCE_FORMAT ("json" or "xml") with only IOS_SOURCE_ATTRIBUTES, limited
+        to IOS_SNAPSHOT_MAX_DEPTH levels. The converted copy in save_dir is written in the background
+        (or not at all if SAVE_XML is off).
+        """
+        attributes = configs.get("IOS_SOURCE_ATTRIBUTES", ["name", "label", "enabled", "visible"])
         try:
-            # Appium provides source as XML-like structure
-            source = self.driver.page_source
-            xml_path = os.path.join(save_dir, prefix + ".xml")
-            with open(xml_path, 'w', encoding='utf-8') as f:
-                f.write(source)
-            return xml_path
+            source = self.driver.execute_script("mobile: source", {
+                "format": configs.get("IOS_SOURCE_FORMAT", "json"),
+                "excludedAttributes": excluded_attributes(attributes),
+            })
         except Exception as e:
             logger.error(f"Failed to get XML: {e}")
             return "ERROR"
+        try:
+            hierarchy = ios_source_to_hierarchy(source, attributes)
+        except Exception as e:
+            logger.error(f"Failed to parse UI hierarchy: {e}")
+            return "ERROR"
+        if configs.get("SAVE_XML", True):
+            hierarchy.save_async(os.path.join(save_dir, prefix + ".xml"))
+        return hierarchy
 
     def tap(self, x, y):
         """Tap at coordinates (x, y) on iOS device."""
@@ -111,14 +248,61 @@ class IOSController:
             logger.error(f"Failed to tap: {e}")
             return "ERROR"
 
+    def perform_gestures(self, gestures):
+        """
+        Perform several gestures (see w3c_gesture_steps) as one W3C action chain, i.e. a single request
+        instead of one round trip per gesture.
+        """
+        try:
+            steps = []
+            for gesture in gestures:
+                if steps:
+                    steps.append({"type": "pause", "duration": GESTURE_GAP_MS})
+                steps.extend(w3c_gesture_steps(gesture))
+            self.driver.execute(Command.W3C_ACTIONS, {"actions": [
+                {"type": "pointer", "id": "finger1", "parameters": {"pointerType": "touch"}, "actions": steps}]})
+            return "OK"
+        except Exception as e:
+            logger.error(f"Failed to perform gestures: {e}")
+            return "ERROR"
+
+    def _type_into_focused(self, keys):
+        """Type keys into the focused element with a single send_keys, or `mobile: keys` when nothing is focused."""
+        try:
+            element = self.driver.switch_to.active_element
+        except NoSuchElementException:
+            logger.debug("No focused element, using mobile: keys")
+            return self.send_keys([keys])
+        except Exception as e:
+            logger.error(f"Failed to find the focused element: {e}")
+            return "ERROR"
+        try:
+            element.send_keys(keys)
+            return "OK"
+        except Exception as e:
+            logger.error(f"Failed to type into the focused element: {e}")
+            return "ERROR"
+
     def text(self, input_str):
-        """Input text on iOS device."""
+        """Input text on iOS device: the whole string in one send_keys to the focused element."""
+        return self._type_into_focused(input_str)
+
+    def send_keys(self, keys):
+        """Send a sequence of keys (characters or XCUIKeyboardKey values) in one `mobile: keys` call."""
         try:
-            self.driver.execute_script("mobile: keys", {"keys": list(input_str)})
+            self.driver.execute_script("mobile: keys", {"keys": list(keys)})
             return "OK"
         except Exception as e:
-            logger.error(f"Failed to input text: {e}")
+            logger.error(f"Failed to send keys: {e}")
             return "ERROR"
+
+    def clear_text_field(self):
+        """Clear the focused text field by typing CLEAR_TEXT_DELETE_COUNT delete keys in one send_keys."""
+        return self._type_into_focused(IOS_DELETE_KEY * configs.get("CLEAR_TEXT_DELETE_COUNT", 20))
+
+    def text_replace(self, input_str):
+        """Replace the text of the focused field: delete keys followed by the new text, in one send_keys."""
+        return self._type_into_focused(IOS_DELETE_KEY * configs.get("CLEAR_TEXT_DELETE_COUNT", 20) + input_str)
     
     def swipe(self, x, y, direction, dist="medium", quick=False):
         """Swipe from (x, y) in direction on iOS device."""
@@ -0,0 +1,101 @@
+"""
+iOS UI hierarchies in the uiautomator schema.
+
+`driver.page_source` serialises the whole XCUITest snapshot with every attribute, which on complex
+apps is several megabytes and takes seconds. IOSController instead fetches `mobile: source` (JSON by
+default) with the snapshot depth capped by IOS_SNAPSHOT_MAX_DEPTH and only the attributes in
+IOS_SOURCE_ATTRIBUTES, and ios_source_to_hierarchy converts the result into uiautomator-style <node>
+elements (bounds, class, resource-id, content-desc, clickable/focusable/scrollable). traverse_tree and
+collect_interactive_elements then produce AndroidElement lists for iOS exactly as they do for Android.
+Bounds are in points, the coordinate space of iOS taps.
+"""
+import json
+import xml.etree.ElementTree as ET
+
+from ui_hierarchy import UIHierarchy
+
+TYPE_PREFIX = "XCUIElementType"
+
+CLICKABLE_TYPES = {"Button", "Cell", "Link", "Switch", "Toggle", "Slider", "Stepper", "SegmentedControl", "Tab",
+                   "Key", "MenuItem", "PickerWheel", "Icon", "PageIndicator"}
+FOCUSABLE_TYPES = {"TextField", "SecureTextField", "SearchField", "TextView"}
+SCROLLABLE_TYPES = {"ScrollView", "Table", "CollectionView", "WebView"}
+
+# Optional XCUITest attributes (XML names) and their keys in the JSON source; type and rect are always sent
+OPTIONAL_ATTRIBUTES = {"name": "name", "label": "label", "value": "value", "enabled": "isEnabled",
+                       "visible": "isVisible", "accessible": "isAccessible", "index": "index"}
+
+
+def excluded_attributes(attributes):
+    """The comma-separated excludedAttributes for `mobile: source` that keeps only `attributes`."""
+    return ",".join(name for name in OPTIONAL_ATTRIBUTES if name not in attributes)
+
+
+def _flag(value, default=True):
+    if value is None:
+        return default
+    return value in (True, 1, "1", "true", "True")
+
+
+def _short_type(element_type):
+    element_type = element_type or "Other"
+    return element_type[len(TYPE_PREFIX):] if element_type.startswith(TYPE_PREFIX) else element_type
+
+
+def _json_fields(node, attributes):
+    rect = node.get("rect") or {}
+    fields = {name: node.get(key) for name, key in OPTIONAL_ATTRIBUTES.items() if name in attributes}
+    return (_short_type(node.get("type")), (rect.get("x", 0), rect.get("y", 0), rect.get("width", 0),
+                                            rect.get("height", 0)), fields, node.get("children") or [])
+
+
+def _xml_fields(elem, attributes):
+    rect = tuple(float(elem.attrib.get(key, 0)) for key in ("x", "y", "width", "height"))
+    fields = {name: elem.attrib.get(name) for name in OPTIONAL_ATTRIBUTES if name in attributes}
+    return _short_type(elem.attrib.get("type", elem.tag)), rect, fields, list(elem)
+
+
+def _node(index, element_type, rect, fields):
+    x, y, width, height = (int(round(v)) for v in rect)
+    enabled = _flag(fields.get("enabled"))
+    visible = _flag(fields.get("visible")) and width > 0 and height > 0
+    usable = enabled and visible
+    return {
+        "index": str(index),
+        "class": element_type,
+        "resource-id": fields.get("name") or "",
+        "content-desc": fields.get("label") or "",
+        "text": str(fields.get("value") or ""),
+        "bounds": f"[{x},{y}][{x + width},{y + height}]",
+        "enabled": str(enabled).lower(),
+        "clickable": str(usable and element_type in CLICKABLE_TYPES).lower(),
+        "focusable": str(usable and element_type in FOCUSABLE_TYPES).lower(),
+        "scrollable": str(usable and element_type in SCROLLABLE_TYPES).lower(),
+        "long-clickable": "false",
+    }
+
+
+def ios_source_to_hierarchy(source, attributes=tuple(OPTIONAL_ATTRIBUTES)):
+    """
+    Convert a `mobile: source` result (JSON dict or string, or XCUITest XML) into a UIHierarchy in the
+    uiautomator schema. Only the given optional attributes are read.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = source.decode("utf-8")
+    if isinstance(source, str):
+        source = json.loads(source) if source.lstrip().startswith("{") else ET.fromstring(source)
+    if isinstance(source, ET.Element):
+        fields = _xml_fields
+        if source.tag == "AppiumAUT" and len(source):
+            source = source[0]
+    else:
+        fields = _json_fields
+    root = ET.Element("hierarchy", rotation="0")
+    stack = [(source, root, 0)]
+    while stack:
+        node, parent, index = stack.pop()
+        element_type, rect, values, children = fields(node, attributes)
+        elem = ET.SubElement(parent, "node", _node(index, element_type, rect, values))
+        for child_index in range(len(children) - 1, -1, -1):
+            stack.append((children[child_index], elem, child_index))
+    return UIHierarchy(root)
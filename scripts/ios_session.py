@@ -0,0 +1,111 @@
+"""
+Persistent Appium sessions for iOS devices.
+
+Creating an XCUITest session on a real iPhone takes 10+ seconds, so instead of creating one per run
+the session id is stored per device UDID and the next run reattaches to it while it is still alive.
+A keep-alive thread pings the session so the server's newCommandTimeout does not expire it while
+the agent is waiting (e.g. for the model).
+"""
+import json
+import os
+import sys
+import threading
+
+import requests
+from appium import webdriver
+
+from logging_controller import get_logger
+
+try:
+    logger = get_logger()
+except Exception as e:
+    print(f"ERROR: Failed to load logger configuration: {e}")
+    sys.exit(1)
+
+
+class SessionStore:
+    """JSON file mapping device UDIDs to the Appium server and session id last used for them."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, sessions):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(sessions, f, indent=2)
+
+    def get(self, udid, server):
+        """Return the stored session id for udid on server, or None."""
+        entry = self._read().get(udid)
+        if entry and entry.get("server") == server:
+            return entry.get("session_id")
+        return None
+
+    def put(self, udid, server, session_id):
+        with self._lock:
+            sessions = self._read()
+            sessions[udid] = {"server": server, "session_id": session_id}
+            self._write(sessions)
+
+    def forget(self, udid):
+        with self._lock:
+            sessions = self._read()
+            if sessions.pop(udid, None) is not None:
+                self._write(sessions)
+
+
+def session_alive(server, session_id, timeout=5):
+    """Check that a session still exists on the server with a cheap command (the window rect)."""
+    try:
+        response = requests.get(f"{server.rstrip('/')}/session/{session_id}/window/rect", timeout=timeout)
+    except requests.RequestException:
+        return False
+    return response.status_code == 200
+
+
+class AttachedRemote(webdriver.Remote):
+    """A Remote driver that attaches to an existing session instead of creating a new one."""
+
+    def __init__(self, command_executor, session_id, options=None):
+        self._attach_session_id = session_id
+        super().__init__(command_executor, options=options)
+
+    def start_session(self, capabilities, browser_profile=None):
+        self.session_id = self._attach_session_id
+        self.caps = capabilities.to_capabilities() if hasattr(capabilities, "to_capabilities") else dict(capabilities)
+
+
+class SessionKeepAlive:
+    """Pings a session every `interval` seconds; calls on_expired once if it is gone."""
+
+    def __init__(self, server, session_id, interval=60, on_expired=None):
+        self.server = server
+        self.session_id = session_id
+        self.interval = interval
+        self.on_expired = on_expired
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ios-session-keepalive", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            if not session_alive(self.server, self.session_id):
+                logger.warning(f"iOS session {self.session_id} expired")
+                if self.on_expired is not None:
+                    self.on_expired()
+                return
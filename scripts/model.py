@@ -5,6 +5,8 @@ import sys
 import time
 import requests
 from utils import encode_image, speak
+from rate_limiter import get_rate_limiter
+from image_budget import GeminiImageBudgeter, OpenAIImageBudgeter, image_size
 
 from logging_controller import get_logger
 from config import load_config
@@ -18,7 +20,32 @@ except Exception as e:
 
 class BaseModel:
     def __init__(self):
-        pass
+        # Shared with the other executors when run by the scheduler
+        self.rate_limiter = get_rate_limiter(configs.get("LLM_REQUESTS_PER_MINUTE", 0),
+                                             configs.get("LLM_REQUEST_BURST", 1))
+        self.image_budgeter = None
+        self.last_image_tokens = 0
+
+    def encode_images(self, images):
+        """
+        Base64 JPEGs of the images at the size and quality picked by the provider's image budgeter.
+        The estimated image tokens of the request are kept in last_image_tokens.
+        """
+        payloads = []
+        self.last_image_tokens = 0
+        for img in images:
+            width, height = image_size(img)
+            max_width, quality, tokens = self.image_budgeter.plan(width, height, getattr(img, "grid_label_px", None))
+            payloads.append(encode_image(img, max_width, quality))
+            self.last_image_tokens += tokens
+        logger.debug(f"Estimated image tokens: {self.last_image_tokens} for {len(images)} image(s)")
+        return payloads
+
+    def wait_for_rate_limit(self):
+        if self.rate_limiter is not None:
+            delay = self.rate_limiter.acquire()
+            if delay > 0:
+                logger.debug(f"Waited {delay * 1000:.0f} ms for the LLM rate limit")
 
     @abstractmethod
     def get_model_response(self, prompt: str, images: List[str]) -> (bool, str):
@@ -33,6 +60,7 @@ class OpenAIModel(BaseModel):
         self.model = model
         self.temperature = temperature
         self.max_completion_tokens = max_completion_tokens
+        self.image_budgeter = OpenAIImageBudgeter(model)
 
     def get_model_response(self, prompt: str, images: List[str]) -> (bool, str):
         content = [
@@ -41,8 +69,7 @@ class OpenAIModel(BaseModel):
                 "text": prompt
             }
         ]
-        for img in images:
-            base64_img = encode_image(img)
+        for base64_img in self.encode_images(images):
             content.append({
                 "type": "image_url",
                 "image_url": {
@@ -64,6 +91,7 @@ class OpenAIModel(BaseModel):
             "temperature": self.temperature,
             "max_completion_tokens": self.max_completion_tokens
         }
+        self.wait_for_rate_limit()
         try:
             start_time = time.perf_counter()
             response = requests.post(self.base_url, headers=headers, json=payload).json()
@@ -79,6 +107,7 @@ class OpenAIModel(BaseModel):
             usage = response["usage"]
             prompt_tokens = usage["prompt_tokens"]
             completion_tokens = usage["completion_tokens"]
+            logger.debug(f"Prompt tokens: {prompt_tokens} (images estimated at {self.last_image_tokens})")
             logger.debug(f"Request cost is "
                              f"${'{0:.2f}'.format(prompt_tokens / 1000 * 0.01 + completion_tokens / 1000 * 0.03)}")
         else:
@@ -94,12 +123,12 @@ class GeminiModel(BaseModel):
         self.model = model
         self.temperature = float(temperature)
         self.max_completion_tokens = int(max_completion_tokens)
+        self.image_budgeter = GeminiImageBudgeter()
 
     def get_model_response(self, prompt: str, images: List[str]) -> (bool, str):
         # Build parts: text + inline images
         parts = [{"text": prompt}]
-        for img in images:
-            base64_img = encode_image(img)
+        for base64_img in self.encode_images(images):
             parts.append({
                 "inline_data": {
                     "mime_type": "image/jpeg",
@@ -121,6 +150,7 @@ class GeminiModel(BaseModel):
             }
         }
 
+        self.wait_for_rate_limit()
         try:
             start_time = time.perf_counter()
             response = requests.post(url, json=payload, timeout=120)
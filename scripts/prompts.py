@@ -1,6 +1,6 @@
 task_template_grid = """You are an agent that is trained to perform some basic tasks on a smartphone. You will be given a smartphone screenshot overlaid by a grid. 
 The grid divides the screenshot into small square areas. Each area is labeled with an integer in the top-left corner.
-
+<image_context>
 <human_override_context>
 <recovery_context>
 
@@ -604,4 +604,8 @@ Documentation: <describe the function of the UI element>
 # - In grid mode → tap the grid cell containing the desired option text. Never tap the grid cell containing "Please select" while options are open.
 # - If the option isn't visible → swipe within the options list (not on "Please select") to reveal it, then tap it.
 
-   # - **If dropdown is not open, open it first. Only reopen if options are clearly not visible.** If the given value already provided by the human, do not reopen the dropdown.
\ No newline at end of file
+   # - **If dropdown is not open, open it first. Only reopen if options are clearly not visible.** If the given value already provided by the human, do not reopen the dropdown.
+crop_to_diff_note = """Only part of the screen changed after your last action, so you are given two images: the first is a
+zoomed-in crop of the grid screenshot around the region that changed, the second is the whole grid screenshot at low
+resolution for context. Area numbers are the same in both images and refer to the whole screen.
+"""
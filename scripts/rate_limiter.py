@@ -0,0 +1,108 @@
+"""
+LLM request rate limiting shared across processes.
+
+A token bucket limits how many model requests are made per minute. When several executors run in
+parallel (see scheduler.py), the scheduler serves one bucket through a multiprocessing manager and
+passes its address to each executor in the environment, so all of them draw from the same budget.
+"""
+import os
+import threading
+import time
+from multiprocessing.managers import BaseManager
+
+RATE_LIMITER_ADDRESS_ENV = "APPAGENT_RATE_LIMITER"
+RATE_LIMITER_AUTHKEY_ENV = "APPAGENT_RATE_LIMITER_KEY"
+
+
+class RateLimiter:
+    """Token bucket allowing `requests_per_minute` requests with bursts of up to `burst`."""
+
+    def __init__(self, requests_per_minute, burst=1):
+        self.interval = 60.0 / requests_per_minute
+        self.burst = burst
+        self._next_free = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Reserve the next request slot and return how many seconds the caller must wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            # Idle time builds up credit for at most `burst` immediate requests
+            self._next_free = max(self._next_free, now - (self.burst - 1) * self.interval)
+            delay = max(0.0, self._next_free - now)
+            self._next_free += self.interval
+            return delay
+
+    def acquire(self):
+        """Block until a request may be made."""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+class _RateLimiterServer(BaseManager):
+    pass
+
+
+class _RateLimiterClient(BaseManager):
+    pass
+
+
+_RateLimiterClient.register("get_rate_limiter")
+
+
+class RemoteRateLimiter:
+    """Client side of a RateLimiter served by RateLimiterService; waits locally so the server never blocks."""
+
+    def __init__(self, address, authkey):
+        host, port = address.rsplit(":", 1)
+        manager = _RateLimiterClient(address=(host, int(port)), authkey=authkey)
+        manager.connect()
+        self._limiter = manager.get_rate_limiter()
+
+    def reserve(self):
+        return self._limiter.reserve()
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+class RateLimiterService:
+    """Serves a RateLimiter to other processes from a background thread of this one."""
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.authkey = os.urandom(16)
+        _RateLimiterServer.register("get_rate_limiter", callable=lambda: limiter)
+        self.server = _RateLimiterServer(address=("127.0.0.1", 0), authkey=self.authkey).get_server()
+        self.thread = threading.Thread(target=self.server.serve_forever, name="rate-limiter", daemon=True)
+
+    @property
+    def environment(self):
+        """Environment variables that let a child process attach with get_rate_limiter()."""
+        host, port = self.server.address
+        return {RATE_LIMITER_ADDRESS_ENV: f"{host}:{port}", RATE_LIMITER_AUTHKEY_ENV: self.authkey.hex()}
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.stop_event.set()
+
+
+def get_rate_limiter(requests_per_minute=0, burst=1):
+    """
+    Return the shared rate limiter advertised in the environment, otherwise a local one for
+    requests_per_minute (None if it is 0, i.e. unlimited).
+    """
+    address = os.environ.get(RATE_LIMITER_ADDRESS_ENV)
+    if address:
+        return RemoteRateLimiter(address, bytes.fromhex(os.environ.get(RATE_LIMITER_AUTHKEY_ENV, "")))
+    if requests_per_minute:
+        return RateLimiter(requests_per_minute, burst)
+    return None
@@ -0,0 +1,199 @@
+"""
+Replay device controller for running the agent without a phone.
+
+Serves the screenshots and UI hierarchy dumps of a recorded run as if they came from a device:
+a task directory under tasks/ (`<task>_<round>.png` / `.xml`) or a demonstration under
+apps/<app>/demos/<demo>/ (raw_screenshots/ and xml/). Actions are accepted with configurable
+injected latencies and move between the recorded states, so the whole pipeline can be profiled
+deterministically on a machine with no device attached.
+
+State transitions follow `transitions.json` in the recording directory (or REPLAY_TRANSITIONS)
+when present: a list of rules such as
+    {"from": 2, "action": "tap", "bbox": [[0, 1800], [1080, 2000]], "to": 5}
+where states are numbered from 1 in recording order, "from" and "action" may be "*", and "bbox"
+(optional) must contain the action's coordinates.
+Without a matching rule every action advances to the next recorded state and back() returns
+to the previous one.
+"""
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import time
+
+from config import load_config
+from frame import Frame
+from logging_controller import get_logger
+
+configs = load_config()
+
+try:
+    logger = get_logger()
+except Exception as e:
+    print(f"ERROR: Failed to load logger configuration: {e}")
+    sys.exit(1)
+
+
+def load_recorded_states(recording_dir):
+    """Return the [(screenshot path, xml path or None), ...] of a recorded task or demonstration, in order."""
+    screenshot_dir = os.path.join(recording_dir, "raw_screenshots")
+    xml_dir = os.path.join(recording_dir, "xml")
+    if not os.path.isdir(screenshot_dir):
+        screenshot_dir = xml_dir = recording_dir
+    states = []
+    for name in os.listdir(screenshot_dir):
+        # Rounds are saved as <prefix>_<n>.png; labeled copies and explorer before/after shots are skipped
+        match = re.fullmatch(r"(.+)_(\d+)\.png", name)
+        if match is None:
+            continue
+        xml_path = os.path.join(xml_dir, name[:-4] + ".xml")
+        states.append((int(match.group(2)), os.path.join(screenshot_dir, name),
+                       xml_path if os.path.exists(xml_path) else None))
+    states.sort()
+    return [(screenshot, xml) for _, screenshot, xml in states]
+
+
+class ReplayController:
+    """Device controller backed by a recorded run."""
+
+    @staticmethod
+    def list_all_devices():
+        """The configured recording directory is the only replay "device"."""
+        recording_dir = configs.get("REPLAY_DIR", "")
+        return [recording_dir] if recording_dir and os.path.isdir(recording_dir) else []
+
+    def __init__(self, device):
+        self.device = device
+        self.states = load_recorded_states(device)
+        if not self.states:
+            raise ValueError(f"No recorded screenshots found in {device}")
+        self.transitions = self._load_transitions()
+        self.latency = configs.get("REPLAY_LATENCY", {})
+        self.jitter = configs.get("REPLAY_LATENCY_JITTER", 0.0)
+        self.random = random.Random(configs.get("REPLAY_SEED", 0))
+        self.state = 0
+        self.actions = []
+        self._frames = {}
+        self.width, self.height = self.get_device_size()
+
+    def _load_transitions(self):
+        path = configs.get("REPLAY_TRANSITIONS") or os.path.join(self.device, "transitions.json")
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _wait(self, kind):
+        """Sleep for the configured latency of this kind of call, with deterministic jitter."""
+        default = 0.0 if kind in ("screenshot", "xml") else self.latency.get("action", 0.0)
+        delay = self.latency.get(kind, default)
+        if delay and self.jitter:
+            delay *= 1 + self.random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _frame(self, state):
+        if state not in self._frames:
+            self._frames[state] = Frame.from_path(self.states[state][0])
+        return self._frames[state]
+
+    def _next_state(self, action, point=None):
+        for rule in self.transitions:
+            if rule.get("from", "*") not in ("*", self.state + 1):
+                continue
+            if rule.get("action", "*") not in ("*", action):
+                continue
+            bbox = rule.get("bbox")
+            if bbox is not None:
+                if point is None:
+                    continue
+                (x1, y1), (x2, y2) = bbox
+                if not (x1 <= point[0] <= x2 and y1 <= point[1] <= y2):
+                    continue
+            return min(max(int(rule["to"]) - 1, 0), len(self.states) - 1)
+        if action == "back":
+            return max(self.state - 1, 0)
+        return min(self.state + 1, len(self.states) - 1)
+
+    def _act(self, action, point=None):
+        self._wait(action)
+        self.actions.append((action, point, self.state))
+        self.state = self._next_state(action, point)
+        return "OK"
+
+    def get_device_size(self):
+        """Size of the recorded screenshots."""
+        frame = self._frame(0)
+        return frame.width, frame.height
+
+    def get_bbox_space_size(self):
+        """Recorded element bounds are in screenshot pixels."""
+        return None
+
+    def get_screenshot(self, prefix, save_dir):
+        """Copy the current recorded screenshot into save_dir."""
+        self._wait("screenshot")
+        path = os.path.join(save_dir, prefix + ".png")
+        shutil.copyfile(self.states[self.state][0], path)
+        return path
+
+    def get_frame(self, prefix, save_dir):
+        """Return the current recorded screenshot as a Frame."""
+        self._wait("screenshot")
+        frame = Frame(self._frame(self.state).image, path=self.states[self.state][0])
+        if configs.get("SAVE_SCREENSHOTS", True):
+            frame.save_async(os.path.join(save_dir, prefix + ".png"))
+        return frame
+
+    def get_probe_image(self):
+        return self._frame(self.state).image
+
+    def get_window_state(self):
+        return str(self.state)
+
+    def get_xml(self, prefix, save_dir):
+        """Copy the current recorded UI hierarchy dump into save_dir."""
+        self._wait("xml")
+        xml_path = self.states[self.state][1]
+        if xml_path is None:
+            logger.error(f"No UI hierarchy was recorded for state {self.state + 1}")
+            return "ERROR"
+        path = os.path.join(save_dir, prefix + ".xml")
+        shutil.copyfile(xml_path, path)
+        return path
+
+    def tap(self, x, y):
+        return self._act("tap", (x, y))
+
+    def text(self, input_str):
+        return self._act("text")
+
+    def text_replace(self, input_str):
+        return self._act("text")
+
+    def send_keys(self, keys):
+        return self._act("keys")
+
+    def clear_text_field(self):
+        return self._act("keys")
+
+    def long_press(self, x, y, duration=1000):
+        return self._act("long_press", (x, y))
+
+    def swipe(self, x, y, direction, dist="medium", quick=False):
+        return self._act("swipe", (x, y))
+
+    def swipe_precise(self, start, end, duration=400):
+        return self._act("swipe", start)
+
+    def perform_gestures(self, gestures):
+        result = "OK"
+        for gesture in gestures:
+            point = gesture[1] if gesture[0] == "swipe" else gesture[1:3]
+            result = self._act(gesture[0], point)
+        return result
+
+    def back(self):
+        return self._act("back")
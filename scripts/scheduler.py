@@ -0,0 +1,243 @@
+"""
+Multi-device task scheduler.
+
+Runs a queue of tasks across every available device in parallel: one worker thread per device
+takes the next task, runs a non-interactive task_executor.py for it in its own task directory,
+and goes back for another. All executors share one LLM rate limiter, and throughput metrics
+(tasks per hour, per-device utilisation) are reported at the end. Devices reported unavailable
+by their health monitor get no new tasks until they are back.
+
+Usage:
+    python scripts/scheduler.py --tasks tasks.jsonl [--devices <serial> <serial> ...]
+
+tasks.jsonl holds one JSON object per line: {"app": "<app name>", "task": "<task description>"}.
+"""
+import argparse
+import datetime
+import json
+import os
+import queue
+import re
+import subprocess
+import sys
+import threading
+import time
+
+from config import load_config
+from device_health import EXTERNAL_MONITOR_ENV, DeviceHealthMonitor
+from logging_controller import get_logger
+from rate_limiter import RateLimiter, RateLimiterService
+
+configs = load_config()
+
+try:
+    logger = get_logger()
+except Exception as e:
+    print(f"ERROR: Failed to load logger configuration: {e}")
+    sys.exit(1)
+
+
+class Task:
+    """One unit of work: a task description for an app."""
+
+    def __init__(self, task_id, app, description):
+        self.task_id = task_id
+        self.app = app
+        self.description = description
+
+
+class TaskResult:
+    """Outcome of one task run on one device."""
+
+    def __init__(self, task, device, task_dir, returncode, start_time, end_time):
+        self.task = task
+        self.device = device
+        self.task_dir = task_dir
+        self.returncode = returncode
+        self.start_time = start_time
+        self.end_time = end_time
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    @property
+    def duration(self):
+        return self.end_time - self.start_time
+
+
+class SchedulerMetrics:
+    """Throughput of a scheduler run: tasks per hour and the fraction of wall time each device was busy."""
+
+    def __init__(self, results, devices, wall_time):
+        self.results = results
+        self.wall_time = wall_time
+        self.completed = sum(1 for result in results if result.ok)
+        self.failed = len(results) - self.completed
+        self.tasks_per_hour = self.completed / wall_time * 3600 if wall_time > 0 else 0.0
+        self.utilisation = {}
+        for device in devices:
+            busy = sum(result.duration for result in results if result.device == device)
+            self.utilisation[device] = busy / wall_time if wall_time > 0 else 0.0
+
+    def summary(self):
+        lines = [f"{len(self.results)} tasks ({self.completed} completed, {self.failed} failed) in "
+                 f"{self.wall_time:.1f} s: {self.tasks_per_hour:.1f} completed tasks/hour"]
+        for device, utilisation in self.utilisation.items():
+            lines.append(f"  {device}: {utilisation * 100:.0f}% busy")
+        return "\n".join(lines)
+
+
+def executor_runner(root_dir="./", environment=None):
+    """
+    Return a runner that executes a task with a non-interactive task_executor.py subprocess.
+    The executor's output goes to executor.log in the task directory.
+    """
+    executor = os.path.join(os.path.dirname(os.path.abspath(__file__)), "task_executor.py")
+
+    def run(task, device, task_dir):
+        env = dict(os.environ, **(environment or {}))
+        command = [sys.executable, executor, "--app", task.app, "--root_dir", root_dir, "--device", device,
+                   "--task", task.description, "--task_dir", task_dir]
+        with open(os.path.join(task_dir, "executor.log"), "w") as log_file:
+            return subprocess.run(command, stdin=subprocess.DEVNULL, stdout=log_file, stderr=subprocess.STDOUT,
+                                  env=env).returncode
+
+    return run
+
+
+class Scheduler:
+    """Assigns queued tasks to free devices, one worker thread per device."""
+
+    def __init__(self, devices, runner, work_dir):
+        """
+        Args:
+            devices: Device identifiers to run tasks on.
+            runner: Callable (task, device, task_dir) -> return code (0 on success).
+            work_dir: Directory under which each task gets its own directory.
+        """
+        self.devices = list(devices)
+        self.runner = runner
+        self.work_dir = work_dir
+        self.results = []
+        self._lock = threading.Lock()
+        self._available = {device: threading.Event() for device in self.devices}
+        for event in self._available.values():
+            event.set()
+
+    def set_available(self, device, available):
+        """Availability listener: an unavailable device is given no new tasks until it is available again."""
+        if available:
+            self._available[device].set()
+        else:
+            self._available[device].clear()
+
+    def _task_dir(self, task, device):
+        safe_device = re.sub(r"[^A-Za-z0-9_.-]", "_", device)
+        task_dir = os.path.join(self.work_dir, f"task_{task.app}_{task.task_id}_{safe_device}")
+        os.makedirs(task_dir, exist_ok=True)
+        return task_dir
+
+    def _worker(self, device, tasks):
+        while True:
+            if not self._available[device].wait(1.0):
+                if tasks.empty():
+                    return
+                continue
+            try:
+                task = tasks.get_nowait()
+            except queue.Empty:
+                return
+            task_dir = self._task_dir(task, device)
+            logger.info(f"Task {task.task_id} ({task.app}) started on {device}")
+            start_time = time.monotonic()
+            try:
+                returncode = self.runner(task, device, task_dir)
+            except Exception as e:
+                logger.error(f"Task {task.task_id} failed on {device}: {e}")
+                returncode = -1
+            result = TaskResult(task, device, task_dir, returncode, start_time, time.monotonic())
+            with self._lock:
+                self.results.append(result)
+            status = "completed" if result.ok else f"failed (exit code {returncode})"
+            logger.info(f"Task {task.task_id} {status} on {device} in {result.duration:.1f} s")
+
+    def run(self, tasks):
+        """Run all tasks and return SchedulerMetrics once the queue is drained."""
+        pending = queue.Queue()
+        for task in tasks:
+            pending.put(task)
+        start_time = time.monotonic()
+        workers = [threading.Thread(target=self._worker, args=(device, pending), name=f"scheduler-{device}",
+                                    daemon=True) for device in self.devices]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return SchedulerMetrics(self.results, self.devices, time.monotonic() - start_time)
+
+
+def load_tasks(path):
+    """Read tasks from a JSON-lines file with "app" and "task" keys."""
+    tasks = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                tasks.append(Task(len(tasks) + 1, item["app"], item["task"]))
+    return tasks
+
+
+if __name__ == "__main__":
+    from device_controller import list_all_devices
+
+    arg_desc = "AppAgent - Multi-device Scheduler"
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=arg_desc)
+    parser.add_argument("--tasks", required=True, help="JSON-lines file of {\"app\": ..., \"task\": ...}")
+    parser.add_argument("--devices", nargs="*", help="Devices to use (default: all connected devices)")
+    parser.add_argument("--root_dir", default="./")
+    args = parser.parse_args()
+
+    devices = args.devices or list_all_devices()
+    if not devices:
+        logger.error("ERROR: No device found!")
+        sys.exit(1)
+    tasks = load_tasks(args.tasks)
+    work_dir = os.path.join(args.root_dir, "tasks",
+                            datetime.datetime.now().strftime("schedule_%Y-%m-%d_%H-%M-%S"))
+    os.makedirs(work_dir, exist_ok=True)
+    logger.info(f"Scheduling {len(tasks)} tasks on {len(devices)} devices: {', '.join(devices)}")
+
+    rate_limiter_service = None
+    environment = {}
+    if configs.get("LLM_REQUESTS_PER_MINUTE", 0):
+        rate_limiter_service = RateLimiterService(RateLimiter(configs["LLM_REQUESTS_PER_MINUTE"],
+                                                              configs.get("LLM_REQUEST_BURST", 1))).start()
+        environment = rate_limiter_service.environment
+
+    monitor_devices = configs.get("DEVICE_HEALTH_MONITOR", True) and \
+        configs.get("PLATFORM", "android").lower() == "android"
+    if monitor_devices:
+        # The executors leave their devices to the scheduler's monitors
+        environment = dict(environment, **{EXTERNAL_MONITOR_ENV: "1"})
+    scheduler = Scheduler(devices, executor_runner(args.root_dir, environment), work_dir)
+    monitors = []
+    if monitor_devices:
+        from android_controller import create_adb_client, get_device_state, reconnect_device
+
+        client = create_adb_client()
+        for device in devices:
+            monitor = DeviceHealthMonitor(device, lambda d=device: get_device_state(d, client),
+                                          lambda d=device: reconnect_device(d),
+                                          interval=configs.get("HEALTH_CHECK_INTERVAL", 2.0),
+                                          backoff_max=configs.get("RECONNECT_BACKOFF_MAX", 30.0))
+            monitor.add_listener(scheduler.set_available)
+            monitors.append(monitor.start())
+    try:
+        metrics = scheduler.run(tasks)
+    finally:
+        for monitor in monitors:
+            monitor.stop()
+        if rate_limiter_service is not None:
+            rate_limiter_service.stop()
+    logger.show(metrics.summary())
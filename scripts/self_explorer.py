@@ -81,6 +81,7 @@ width, height = controller.get_device_size()
 if not width and not height:
     print_with_color("ERROR: Invalid device size!", "red")
     sys.exit()
+bbox_space_size = controller.get_bbox_space_size()
 print_with_color(f"Screen resolution of {device}: {width}x{height}", "yellow")
 
 print_with_color("Please enter the description of the task you want me to complete:", "blue")
@@ -179,9 +180,8 @@ while round_count < configs["MAX_ROUNDS"]:
 
 
     dir_name = datetime.datetime.fromtimestamp(int(time.time())).strftime(f"task_{app}_%Y-%m-%d_%H-%M-%S")
-    screenshot_before = controller.get_screenshot(f"{dir_name}_{round_count}_before", task_dir)
-    # xml_path = controller.get_xml(f"{round_count}", task_dir)
-    xml_path = controller.get_xml(f"{dir_name}_{round_count}", task_dir)
+    observation = controller.capture_observation(f"{dir_name}_{round_count}_before", task_dir)
+    screenshot_before, xml_path = observation.frame, observation.xml
 
     # xml_path = controller.get_xml(f"{dir_name}_{round_count}", task_dir)
     if screenshot_before == "ERROR" or xml_path == "ERROR":
@@ -192,11 +192,11 @@ while round_count < configs["MAX_ROUNDS"]:
     print_with_color(f"Detected {len(elem_list)} interactive elements", "green")
 
     draw_bbox_multi(screenshot_before, os.path.join(task_dir, f"{dir_name}_{round_count}_before_labeled.png"), elem_list,
-                    dark_mode=configs["DARK_MODE"])
+                    dark_mode=configs["DARK_MODE"], device_size=bbox_space_size)
 
     prompt = re.sub(r"<task_description>", task_desc, prompts.self_explore_task_template)
     prompt = re.sub(r"<last_act>", last_act, prompt)
-    base64_img_before = os.path.join(task_dir, f"{dir_name}_{round_count}_before_labeled.png")
+    base64_img_before = screenshot_before.annotated or os.path.join(task_dir, f"{dir_name}_{round_count}_before_labeled.png")
     print_with_color("Thinking about what to do in the next step...", "yellow")
     status, rsp = mllm.get_model_response(prompt, [base64_img_before])
 
@@ -259,17 +259,17 @@ while round_count < configs["MAX_ROUNDS"]:
                 break
         else:
             break
-        time.sleep(configs["REQUEST_INTERVAL"])
+        controller.wait_for_settle()
     else:
         print_with_color(rsp, "red")
         break
 
-    screenshot_after = controller.get_screenshot(f"{dir_name}_{round_count}_after", task_dir)
+    screenshot_after = controller.get_frame(f"{dir_name}_{round_count}_after", task_dir)
     if screenshot_after == "ERROR":
         break
     draw_bbox_multi(screenshot_after, os.path.join(task_dir, f"{dir_name}_{round_count}_after_labeled.png"), elem_list,
-                    dark_mode=configs["DARK_MODE"])
-    base64_img_after = os.path.join(task_dir, f"{dir_name}_{round_count}_after_labeled.png")
+                    dark_mode=configs["DARK_MODE"], device_size=bbox_space_size)
+    base64_img_after = screenshot_after.annotated or os.path.join(task_dir, f"{dir_name}_{round_count}_after_labeled.png")
 
     if act_name == "tap":
         prompt = re.sub(r"<action>", "tapping", prompts.self_explore_reflect_template)
@@ -351,3 +351,5 @@ elif round_count == configs["MAX_ROUNDS"]:
                      "yellow")
 else:
     print_with_color(f"Autonomous exploration finished unexpectedly. {doc_count} docs generated.", "red")
+
+controller.close()
@@ -0,0 +1,87 @@
+"""
+Adaptive UI-settle detection.
+
+Instead of sleeping a fixed REQUEST_INTERVAL after every action, the settle detector polls a
+cheap probe of the screen until it stops changing (or a deadline passes), so fast screens are
+observed right away and slow ones are not captured half-rendered.
+
+Probes:
+- "frame": a small grayscale thumbnail of the screen; consecutive thumbnails are compared by
+  mean absolute difference, so a blinking caret or clock does not count as a change.
+- "window": the focused window/activity as reported by the platform; useful when the screen
+  content itself never stops moving (video, live feeds).
+"""
+import time
+
+import cv2
+import numpy as np
+
+
+def frame_signature(image, width=64):
+    """Downscale a BGR or grayscale image to a small grayscale thumbnail used to compare consecutive frames."""
+    height = max(1, round(image.shape[0] * width / image.shape[1]))
+    gray = np.ascontiguousarray(image)
+    if gray.ndim == 3:
+        gray = cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def signature_distance(a, b):
+    """Mean absolute pixel difference (0-255) between two thumbnails; infinite if their shapes differ."""
+    if a.shape != b.shape:
+        return float("inf")
+    return float(np.mean(cv2.absdiff(a, b)))
+
+
+class SettleResult:
+    """Outcome of one settle wait."""
+
+    def __init__(self, settled, elapsed_ms, probes):
+        self.settled = settled
+        self.elapsed_ms = elapsed_ms
+        self.probes = probes
+
+    def __repr__(self):
+        state = "settled" if self.settled else "timed out"
+        return f"SettleResult({state} after {self.elapsed_ms:.0f} ms, {self.probes} probes)"
+
+
+class SettleDetector:
+    """Polls a probe until `stable_probes` consecutive readings match or `timeout` seconds have passed."""
+
+    def __init__(self, probe, same=None, timeout=3.0, interval=0.15, stable_probes=2, min_delay=0.1):
+        """
+        Args:
+            probe: Callable returning a reading of the current UI state, or None if it could not be read.
+            same: Callable deciding whether two readings match (defaults to ==).
+            min_delay: Seconds to wait before the first reading, so the action has time to start.
+        """
+        self.probe = probe
+        self.same = same or (lambda a, b: a == b)
+        self.timeout = timeout
+        self.interval = interval
+        self.stable_probes = stable_probes
+        self.min_delay = min_delay
+
+    def wait(self):
+        """Block until the UI is stable. Returns a SettleResult; a failed probe ends the wait unsettled."""
+        start_time = time.monotonic()
+        deadline = start_time + self.timeout
+        time.sleep(self.min_delay)
+        previous = self.probe()
+        probes = 1
+        stable = 0
+        while previous is not None and time.monotonic() < deadline:
+            time.sleep(max(0.0, min(self.interval, deadline - time.monotonic())))
+            current = self.probe()
+            probes += 1
+            if current is None:
+                break
+            if self.same(previous, current):
+                stable += 1
+                if stable >= self.stable_probes:
+                    return SettleResult(True, (time.monotonic() - start_time) * 1000, probes)
+            else:
+                stable = 0
+            previous = current
+        return SettleResult(False, (time.monotonic() - start_time) * 1000, probes)
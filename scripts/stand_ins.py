@@ -0,0 +1,460 @@
+"""
+Local stand-ins for device-side services.
+
+These run on localhost and speak just enough of the real protocols to exercise the
+device pipeline (and benchmark it) without a phone attached.
+"""
+import base64
+import http.server
+import json
+import os
+import socketserver
+import struct
+import subprocess
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+import cv2
+import numpy as np
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class StandInServer:
+    """Base class running a TCP server on a background thread."""
+
+    handler = None
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.server = _ThreadingServer((host, port), self.handler)
+        self.server.stand_in = self
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _MjpegHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        producer = self.server.stand_in
+        interval = 1.0 / producer.fps
+        index = 0
+        try:
+            if producer.multipart:
+                self.request.sendall(b"HTTP/1.0 200 OK\r\nContent-Type: multipart/x-mixed-replace; "
+                                     b"boundary=--BoundaryString\r\n\r\n")
+            while True:
+                frame = producer.frames[index % len(producer.frames)]
+                if producer.multipart:
+                    frame = (b"--BoundaryString\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n" %
+                             len(frame)) + frame + b"\r\n"
+                self.request.sendall(frame)
+                index += 1
+                time.sleep(interval)
+        except OSError:
+            pass
+
+
+class FakeMjpegProducer(StandInServer):
+    """
+    Streams synthetic JPEG frames back to back, like a screen-stream transcoder would.
+    With multipart=True the frames are sent as an HTTP multipart response, like WebDriverAgent's MJPEG server.
+    """
+
+    handler = _MjpegHandler
+
+    def __init__(self, width=1080, height=2400, fps=30, distinct_frames=8, multipart=False, **kwargs):
+        super().__init__(**kwargs)
+        self.fps = fps
+        self.multipart = multipart
+        self.frames = []
+        for i in range(distinct_frames):
+            image = np.full((height, width, 3), 255, dtype=np.uint8)
+            cv2.rectangle(image, (0, i * height // distinct_frames), (width, (i + 1) * height // distinct_frames),
+                          (40 * i % 255, 120, 200), -1)
+            cv2.putText(image, str(i), (width // 3, height // 2), 0, 10, (0, 0, 0), 20)
+            self.frames.append(cv2.imencode(".jpg", image)[1].tobytes())
+
+
+class _HierarchyHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server.stand_in
+        for line in self.rfile:
+            parts = line.decode("utf-8").split()
+            if not parts or parts[0] != "DUMP":
+                return
+            version, xml = server.current()
+            if len(parts) > 1 and parts[1] == str(version):
+                self.wfile.write(f"UNCHANGED {version} 0\n".encode("utf-8"))
+            else:
+                self.wfile.write(f"FULL {version} {len(xml)}\n".encode("utf-8") + xml)
+            self.wfile.flush()
+            server.requests += 1
+
+
+class FakeHierarchyServer(StandInServer):
+    """Serves canned UI hierarchies over the hierarchy server protocol; advance() moves to the next one."""
+
+    handler = _HierarchyHandler
+
+    def __init__(self, hierarchies, **kwargs):
+        super().__init__(**kwargs)
+        self.hierarchies = [h if isinstance(h, bytes) else h.encode("utf-8") for h in hierarchies]
+        self.index = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def current(self):
+        with self._lock:
+            return self.index, self.hierarchies[self.index % len(self.hierarchies)]
+
+    def advance(self):
+        with self._lock:
+            self.index += 1
+
+
+def write_synthetic_recording(directory, states=5, width=1080, height=2400, prefix="task_Synthetic"):
+    """Write a recorded-task directory (screenshots and UI dumps) for the replay platform to serve."""
+    os.makedirs(directory, exist_ok=True)
+    rows = 12
+    for state in range(1, states + 1):
+        image = np.full((height, width, 3), 250, dtype=np.uint8)
+        nodes = []
+        for row in range(rows):
+            top, bottom = row * height // rows + 10, (row + 1) * height // rows - 10
+            cv2.rectangle(image, (40, top), (width - 40, bottom), ((state * 50) % 255, 90 + row * 10, 160), -1)
+            cv2.putText(image, f"Item {state}.{row}", (80, bottom - 40), 0, 2, (255, 255, 255), 4)
+            nodes.append(f'<node index="{row}" text="Item {state}.{row}" resource-id="app:id/item{row}" '
+                         f'class="android.widget.Button" clickable="true" focusable="true" '
+                         f'bounds="[40,{top}][{width - 40},{bottom}]"/>')
+        cv2.imwrite(os.path.join(directory, f"{prefix}_{state}.png"), image)
+        with open(os.path.join(directory, f"{prefix}_{state}.xml"), "w", encoding="utf-8") as f:
+            f.write(f'<?xml version="1.0" encoding="UTF-8"?><hierarchy rotation="0">{"".join(nodes)}</hierarchy>')
+    return directory
+
+
+class _AdbHandler(socketserver.BaseRequestHandler):
+    def _read(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("client closed the connection")
+            data += chunk
+        return data
+
+    def _read_request(self):
+        length = int(self._read(4), 16)
+        return self._read(length).decode("utf-8")
+
+    def _okay(self, payload=None):
+        self.request.sendall(b"OKAY" + (b"" if payload is None else b"%04x" % len(payload) + payload))
+
+    def _fail(self, message):
+        message = message.encode("utf-8")
+        self.request.sendall(b"FAIL" + b"%04x" % len(message) + message)
+
+    def handle(self):
+        server = self.server.stand_in
+        serial = None
+        try:
+            while True:
+                request = self._read_request()
+                server.requests += 1
+                if request == "host:devices":
+                    listing = "".join(f"{s}\t{state}\n" for s, state in server.devices.items())
+                    self._okay(listing.encode("utf-8"))
+                    return
+                if request.startswith("host:transport:"):
+                    serial = request[len("host:transport:"):]
+                    if server.devices.get(serial) != "device":
+                        self._fail(f"device '{serial}' not found")
+                        return
+                    self._okay()
+                    continue
+                if request.startswith("host-serial:") and request.endswith(":features"):
+                    if server.devices.get(request.split(":")[1]) != "device":
+                        self._fail("device not found")
+                        return
+                    self._okay(b"shell_v2,cmd,stat_v2")
+                    return
+                if request.startswith("host-serial:") and ":killforward:" in request:
+                    self._okay()
+                    return
+                if request.startswith("host-serial:") and ":forward:" in request:
+                    local = request.split(":forward:")[1].split(";")[0]
+                    self._okay()
+                    self._okay(b"27183" if local == "tcp:0" else None)
+                    return
+                if serial is None:
+                    self._fail(f"unknown host service {request}")
+                    return
+                if request.startswith("shell,v2,raw:"):
+                    returncode, output = server.run(request[len("shell,v2,raw:"):])
+                    self._okay()
+                    self.request.sendall(struct.pack("<BI", 1, len(output)) + output +
+                                         struct.pack("<BI", 3, 1) + bytes([returncode]))
+                    return
+                if request.startswith("shell:"):
+                    returncode, output = server.run(request[len("shell:"):])
+                    self._okay()
+                    self.request.sendall(output)
+                    return
+                if request.startswith("exec:"):
+                    _, output = server.run(request[len("exec:"):])
+                    self._okay()
+                    self.request.sendall(output)
+                    return
+                if request == "sync:":
+                    self._okay()
+                    self._sync(server)
+                    return
+                self._fail(f"unknown service {request}")
+                return
+        except (ConnectionError, OSError, ValueError):
+            pass
+
+    def _sync(self, server):
+        while True:
+            command, length = self._read(4), struct.unpack("<I", self._read(4))[0]
+            if command != b"RECV":
+                return
+            path = self._read(length).decode("utf-8")
+            if path not in server.files:
+                message = b"No such file or directory"
+                self.request.sendall(b"FAIL" + struct.pack("<I", len(message)) + message)
+                continue
+            data = server.files[path]
+            for start in range(0, len(data), 64 * 1024):
+                chunk = data[start:start + 64 * 1024]
+                self.request.sendall(b"DATA" + struct.pack("<I", len(chunk)) + chunk)
+            self.request.sendall(b"DONE" + struct.pack("<I", 0))
+
+
+class FakeAdbServer(StandInServer):
+    """
+    Speaks the adb host protocol for a set of fake devices.
+    Shell and exec commands are answered by `responder(command) -> (returncode, output bytes)`; by default
+    they run in the local shell. Files for sync pulls are served from the `files` dict.
+    """
+
+    handler = _AdbHandler
+
+    def __init__(self, devices=("emulator-5554",), responder=None, files=None, **kwargs):
+        super().__init__(**kwargs)
+        self.devices = {serial: "device" for serial in devices}
+        self.responder = responder
+        self.files = dict(files or {})
+        self.requests = 0
+
+    def run(self, command):
+        if self.responder is not None:
+            return self.responder(command)
+        result = subprocess.run(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        return result.returncode, result.stdout
+
+
+class _AppiumHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, value):
+        body = json.dumps({"value": value}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method):
+        server = self.server.stand_in
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}") if length else {}
+        server.requests.append((method, self.path, payload))
+        if server.latency:
+            time.sleep(server.latency)
+        parts = [part for part in self.path.split("/") if part]
+        if method == "POST" and parts == ["session"]:
+            session_id = server.create_session()
+            self._reply(200, {"sessionId": session_id, "capabilities": {"platformName": "iOS"}})
+            return
+        if len(parts) < 2 or parts[0] != "session" or parts[1] not in server.sessions:
+            self._reply(404, {"error": "invalid session id", "message": "A session is either terminated or not started"})
+            return
+        session_id, command = parts[1], "/".join(parts[2:])
+        if method == "DELETE" and not command:
+            server.sessions.discard(session_id)
+            self._reply(200, None)
+            return
+        status, value = server.respond(method, command, payload)
+        self._reply(status, value)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+def fake_ios_source_tree(width, height, rows=40, nesting=6):
+    """
+    A JSON `mobile: source` tree of a scrolling list: each row is a Cell with a label and a button,
+    wrapped in `nesting` Other containers the way SwiftUI and React Native apps nest views.
+    """
+    def node(element_type, x, y, w, h, name=None, label=None, children=()):
+        return {"type": element_type, "name": name, "label": label, "value": None, "rawIdentifier": name,
+                "rect": {"x": x, "y": y, "width": w, "height": h}, "isEnabled": True,
+                "isVisible": y < height, "isAccessible": element_type != "Other", "children": list(children)}
+
+    row_height = 80
+    cells = []
+    for row in range(rows):
+        top = 100 + row * row_height
+        cell = node("Cell", 0, top, width, row_height, name=f"row_{row}", children=[
+            node("StaticText", 16, top + 10, width - 120, 30, label=f"Item {row}"),
+            node("Button", width - 96, top + 20, 80, 40, name=f"row_{row}_action", label="Open"),
+        ])
+        for _ in range(nesting):
+            cell = node("Other", 0, top, width, row_height, children=[cell])
+        cells.append(cell)
+    table = node("Table", 0, 100, width, height - 100, name="list", children=cells)
+    window = node("Window", 0, 0, width, height, children=[
+        node("SearchField", 16, 50, width - 32, 40, name="search", label="Search"), table])
+    return node("Application", 0, 0, width, height, name="Fake", label="Fake", children=[window])
+
+
+class FakeAppiumServer(StandInServer):
+    """
+    Answers the WebDriver endpoints IOSController uses, for a fake iPhone of the given size.
+    Every request is recorded in `requests` as (method, path, payload); `latency` adds a delay per request.
+    Page sources come from fake_ios_source_tree; building one costs `node_latency` per node in the snapshot
+    plus `attribute_latency` per node for each of the visible and accessible attributes (WebDriverAgent
+    queries the accessibility service for those), honouring snapshotMaxDepth and excludedAttributes.
+    """
+
+    handler = _AppiumHandler
+
+    def __init__(self, width=390, height=844, scale=3, latency=0.0, node_latency=0.0, attribute_latency=0.0,
+                 **kwargs):
+        super().__init__(**kwargs)
+        self.width = width
+        self.height = height
+        self.latency = latency
+        self.node_latency = node_latency
+        self.attribute_latency = attribute_latency
+        self.source_tree = fake_ios_source_tree(width, height)
+        self.settings = {}
+        image = np.full((height * scale, width * scale, 3), 245, dtype=np.uint8)
+        for row in range(12):
+            top = row * height * scale // 12
+            cv2.rectangle(image, (30, top + 20), (width * scale - 30, top + height * scale // 12 - 20),
+                          (180, 120 + row * 8, 60), -1)
+        self.screenshot = base64.b64encode(cv2.imencode(".png", image)[1].tobytes()).decode("ascii")
+        self.sessions = set()
+        self.sessions_created = 0
+        self.requests = []
+
+    @property
+    def url(self):
+        host, port = self.address
+        return f"http://{host}:{port}"
+
+    def create_session(self):
+        self.sessions_created += 1
+        session_id = f"fake-session-{self.sessions_created}"
+        self.sessions.add(session_id)
+        return session_id
+
+    def snapshot(self, max_depth=None, excluded=()):
+        """Return (tree, nodes) for the source tree cut at max_depth with the excluded attributes dropped."""
+        keys = {"visible": "isVisible", "accessible": "isAccessible", "name": "name", "label": "label",
+                "value": "value", "enabled": "isEnabled"}
+        dropped = {keys[name] for name in excluded if name in keys}
+        count = 0
+
+        def copy(node, depth):
+            nonlocal count
+            count += 1
+            result = {key: value for key, value in node.items() if key != "children" and key not in dropped}
+            result["children"] = [copy(child, depth + 1) for child in node["children"]] \
+                if max_depth is None or depth < max_depth else []
+            return result
+
+        tree = copy(self.source_tree, 0)
+        time.sleep(count * (self.node_latency + self.attribute_latency * len({"isVisible", "isAccessible"} - dropped)))
+        return tree, count
+
+    @staticmethod
+    def source_xml(tree):
+        """Serialise a JSON source tree as XCUITest XML."""
+        def build(node, parent, index):
+            element_type = "XCUIElementType" + node["type"]
+            attrib = {"type": element_type, "index": str(index)}
+            for name, key in (("name", "name"), ("label", "label"), ("value", "value"), ("enabled", "isEnabled"),
+                              ("visible", "isVisible"), ("accessible", "isAccessible")):
+                if key in node and node[key] is not None:
+                    value = node[key]
+                    attrib[name] = str(value).lower() if isinstance(value, bool) else str(value)
+            attrib.update({key: str(value) for key, value in node["rect"].items()})
+            elem = ET.Element(element_type, attrib) if parent is None else ET.SubElement(parent, element_type, attrib)
+            for child_index, child in enumerate(node["children"]):
+                build(child, elem, child_index)
+            return elem
+
+        root = ET.Element("AppiumAUT")
+        root.append(build(tree, None, 0))
+        return '<?xml version="1.0" encoding="UTF-8"?>' + ET.tostring(root, encoding="unicode")
+
+    def respond(self, method, command, payload):
+        """Return (status, value) for a command on a live session."""
+        if command == "window/rect":
+            return 200, {"x": 0, "y": 0, "width": self.width, "height": self.height}
+        if command == "screenshot":
+            return 200, self.screenshot
+        if command == "appium/settings":
+            if method == "POST":
+                self.settings.update(payload.get("settings", {}))
+            return 200, self.settings
+        if command == "source":
+            # page_source: the full snapshot with every attribute (WebDriverAgent's own depth limit applies)
+            return 200, self.source_xml(self.snapshot(self.settings.get("snapshotMaxDepth", 50))[0])
+        if command in ("actions", "element/fake-element-1/value", "element/fake-element-1/clear"):
+            return 200, None
+        if command == "element/active":
+            return 200, {"element-6066-11e4-a52e-4f735466cecf": "fake-element-1", "ELEMENT": "fake-element-1"}
+        if command == "execute/sync":
+            script = payload.get("script", "")
+            if script == "mobile: activeAppInfo":
+                return 200, {"bundleId": "com.example.fake"}
+            if script == "mobile: source":
+                args = (payload.get("args") or [{}])[0]
+                excluded = [name for name in args.get("excludedAttributes", "").split(",") if name]
+                tree, _ = self.snapshot(self.settings.get("snapshotMaxDepth", 50), excluded)
+                return 200, tree if args.get("format", "xml") == "json" else self.source_xml(tree)
+            return 200, None
+        return 404, {"error": "unknown command", "message": f"Unhandled command {method} {command}"}
@@ -9,6 +9,7 @@ import time
 
 from device_controller import list_all_devices, DeviceController
 from utils import traverse_tree
+from ui_hierarchy import load_ui_tree
 from config import load_config
 from utils import draw_bbox_multi
 from logging_controller import print_with_color
@@ -93,8 +94,9 @@ while True:
         break
     clickable_list = []
     focusable_list = []
-    traverse_tree(xml_path, clickable_list, "clickable", True)
-    traverse_tree(xml_path, focusable_list, "focusable", True)
+    ui_tree = load_ui_tree(xml_path)  # Parse the dump once for both traversals
+    traverse_tree(ui_tree, clickable_list, "clickable", True)
+    traverse_tree(ui_tree, focusable_list, "focusable", True)
     elem_list = clickable_list.copy()
     for elem in focusable_list:
         bbox = elem.bbox
@@ -12,14 +12,20 @@ import prompts
 from config import load_config
 from device_controller import list_all_devices, DeviceController
 from utils import traverse_tree
+from ui_hierarchy import load_ui_tree
 from model import parse_explore_rsp, parse_grid_rsp, OpenAIModel, GeminiModel
-from utils import draw_bbox_multi, draw_grid, area_to_xy, calculate_image_similarity, speak
+from diff_regions import grid_crop_images
+from utils import draw_bbox_multi, draw_grid, area_to_xy, calculate_image_similarity, encode_cache, speak
 from logging_controller import get_logger
 
 arg_desc = "AppAgent Executor"
 parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=arg_desc)
 parser.add_argument("--app")
 parser.add_argument("--root_dir", default="./")
+# Non-interactive runs (used by scheduler.py): run one task on one device in a given directory, then exit
+parser.add_argument("--device")
+parser.add_argument("--task")
+parser.add_argument("--task_dir")
 args = vars(parser.parse_args())
 
 try:
@@ -71,7 +77,11 @@ except Exception as e:
 
 app = args["app"]
 root_dir = args["root_dir"]
+non_interactive = bool(args["task"])
 
+if not app and non_interactive:
+    logger.error("ERROR: --app is required with --task")
+    sys.exit(1)
 if not app:
     logger.show("What is the name of the app you want me to operate?")
     app = input()
@@ -84,10 +94,15 @@ try:
         os.mkdir(work_dir)
     auto_docs_dir = os.path.join(app_dir, "auto_docs")
     demo_docs_dir = os.path.join(app_dir, "demo_docs")
-    task_timestamp = int(time.time())
-    dir_name = datetime.datetime.fromtimestamp(task_timestamp).strftime(f"task_{app}_%Y-%m-%d_%H-%M-%S")
-    task_dir = os.path.join(work_dir, dir_name)
-    os.mkdir(task_dir)
+    if args["task_dir"]:
+        task_dir = args["task_dir"]
+        dir_name = os.path.basename(os.path.normpath(task_dir))
+        os.makedirs(task_dir, exist_ok=True)
+    else:
+        task_timestamp = int(time.time())
+        dir_name = datetime.datetime.fromtimestamp(task_timestamp).strftime(f"task_{app}_%Y-%m-%d_%H-%M-%S")
+        task_dir = os.path.join(work_dir, dir_name)
+        os.mkdir(task_dir)
     log_path = os.path.join(task_dir, f"log_{app}_{dir_name}.txt")
 except OSError as e:
     logger.error(f"ERROR: Failed to create directories: {e}")
@@ -97,7 +112,10 @@ except Exception as e:
     sys.exit(1)
 
 no_doc = False
-if not os.path.exists(auto_docs_dir) and not os.path.exists(demo_docs_dir):
+if not os.path.exists(auto_docs_dir) and not os.path.exists(demo_docs_dir) and non_interactive:
+    logger.info(f"No documentations found for the app {app}. Proceeding with no docs.")
+    no_doc = True
+elif not os.path.exists(auto_docs_dir) and not os.path.exists(demo_docs_dir):
     logger.show(f"No documentations found for the app {app}. Do you want to proceed with no docs? Enter y or n")
     user_input = ""
     while user_input != "y" and user_input != "n":
@@ -134,7 +152,9 @@ try:
         sys.exit(1)
     # logger.debug(f"List of devices attached:\n{str(device_list)}")
     
-    if len(device_list) == 1:
+    if args["device"]:
+        device = args["device"]
+    elif len(device_list) == 1:
         device = device_list[0]
     elif len(device_list) > 1:
         device_list = configs.get("ANDROID_DEVICES", ["10BE8N1N5200203"])
@@ -149,12 +169,15 @@ try:
     if not width and not height:
         logger.error("ERROR: Invalid device size!")
         sys.exit(1)
+    bbox_space_size = controller.get_bbox_space_size()
     # logger.debug(f"Screen resolution of {device}: {width}x{height}")
 except Exception as e:
     logger.error(f"ERROR: Device initialization failed: {e}")
     sys.exit(1)
 
-if configs.get("ENABLE_VOICE", False):
+if non_interactive:
+    task_desc = args["task"]
+elif configs.get("ENABLE_VOICE", False):
     from utils import voice_ask
     try:
         task_desc = voice_ask(
@@ -188,13 +211,16 @@ special_action_context = ""
 # This variable will hold the user's answer from the previous round
 human_answer_context = ""
 
-previous_screenshot_path = None
+previous_screenshot = None
 current_screenshot_path = None
 
 human_override_triggered = False
 human_override_context = ""
 
-human_override = configs.get("ENABLE_HUMAN_OVERRIDE", False)
+device_retries = 0
+
+# Nobody is at the keyboard of a non-interactive run
+human_override = configs.get("ENABLE_HUMAN_OVERRIDE", False) and not non_interactive
 if human_override:
     import threading
     from pynput import keyboard
@@ -222,16 +248,22 @@ while round_count < configs["MAX_ROUNDS"]:
     logger.info(f"Round {round_count} ************************************************************************************************")
 
     try:
-        screenshot_path = controller.get_screenshot(f"{dir_name}_{round_count}", task_dir)
-        if screenshot_path == "ERROR":
+        observation = controller.capture_observation(f"{dir_name}_{round_count}", task_dir, include_xml=not disable_xml)
+        if not observation.ok:
+            # Resume the same round once the device is back instead of abandoning the task
+            if device_retries < configs.get("DEVICE_ROUND_RETRIES", 3) and \
+                    controller.wait_for_device(configs.get("DEVICE_RECONNECT_TIMEOUT", 120)):
+                device_retries += 1
+                logger.info("Retrying this round...")
+                round_count -= 1
+                continue
             break
-
-        if not disable_xml:
-            xml_path = controller.get_xml(f"{dir_name}_{round_count}", task_dir)
-            if xml_path == "ERROR":
-                break
+        device_retries = 0
+        screenshot, xml_path = observation.frame, observation.xml
+        logger.debug("Observation captured in " + ", ".join(f"{name}: {ms:.0f} ms" for name, ms in observation.timings.items()))
     except Exception as e:
         logger.error(f"ERROR: Screenshot or XML generation failed: {e}")
+        controller.close()
         sys.exit(1)
 
     if pending_human_input:
@@ -245,9 +277,17 @@ while round_count < configs["MAX_ROUNDS"]:
         human_override_triggered = False
 
     if grid_on:
-        rows, cols = draw_grid(screenshot_path, os.path.join(task_dir, f"{dir_name}_{round_count}_grid.png"))
-        image = os.path.join(task_dir, f"{dir_name}_{round_count}_grid.png")
-        prompt = prompts.task_template_grid
+        rows, cols = draw_grid(screenshot, os.path.join(task_dir, f"{dir_name}_{round_count}_grid.png"))
+        image = screenshot.annotated or os.path.join(task_dir, f"{dir_name}_{round_count}_grid.png")
+        images = [image]
+        image_context = ""
+        if configs.get("CROP_TO_DIFF", False):
+            crop = grid_crop_images(previous_screenshot, screenshot, rows, cols)
+            if crop:
+                logger.debug(f"Sending a {crop[0].width}x{crop[0].height} crop of the changed region and a thumbnail")
+                images = list(crop)
+                image_context = prompts.crop_to_diff_note
+        prompt = re.sub(r"<image_context>", image_context, prompts.task_template_grid)
     else:
         clickable_list = []
         focusable_list = []
@@ -255,8 +295,9 @@ while round_count < configs["MAX_ROUNDS"]:
             logger.error("ERROR: XML generation is disabled")
             break
 
-        traverse_tree(xml_path, clickable_list, "clickable", True)
-        traverse_tree(xml_path, focusable_list, "focusable", True)
+        ui_tree = load_ui_tree(xml_path)  # Parse the dump once for both traversals
+        traverse_tree(ui_tree, clickable_list, "clickable", True)
+        traverse_tree(ui_tree, focusable_list, "focusable", True)
         elem_list = clickable_list.copy()
         for elem in focusable_list:
             bbox = elem.bbox
@@ -272,9 +313,10 @@ while round_count < configs["MAX_ROUNDS"]:
             if not close:
                 elem_list.append(elem)
     
-        draw_bbox_multi(screenshot_path, os.path.join(task_dir, f"{dir_name}_{round_count}_labeled.png"), elem_list,
-                        dark_mode=configs["DARK_MODE"])
-        image = os.path.join(task_dir, f"{dir_name}_{round_count}_labeled.png")
+        draw_bbox_multi(screenshot, os.path.join(task_dir, f"{dir_name}_{round_count}_labeled.png"), elem_list,
+                        dark_mode=configs["DARK_MODE"], device_size=bbox_space_size)
+        image = screenshot.annotated or os.path.join(task_dir, f"{dir_name}_{round_count}_labeled.png")
+        images = [image]
 
         if no_doc:
             prompt = re.sub(r"<ui_document>", "", prompts.task_template)
@@ -313,8 +355,8 @@ while round_count < configs["MAX_ROUNDS"]:
 
     use_similarity = configs.get("USE_SIMILARITY_COMPARISION", True)
     if use_similarity:
-        current_screenshot_path = image
-        similarity_score = calculate_image_similarity(previous_screenshot_path, current_screenshot_path)
+        # Compare the raw screenshots: the grid or labels drawn on the annotated image would inflate the score
+        similarity_score = calculate_image_similarity(previous_screenshot, screenshot)
         if similarity_score > 0.99:
             if not special_action_used:
                 logger.debug(f"Screen unchanged; taking special recovery action (swipe up). Score is: {(similarity_score * 100):.2f}%")
@@ -326,7 +368,7 @@ while round_count < configs["MAX_ROUNDS"]:
             logger.debug(f"Similarity score low and resetting special_action_used. Score is: {(similarity_score * 100):.2f}%")
             special_action_used = False
             special_action_context = ""
-        previous_screenshot_path = current_screenshot_path
+    previous_screenshot = screenshot  # Also the reference frame of the crop-to-diff mode
 
     prompt = re.sub(r"<task_description>", task_desc, prompt)
 
@@ -343,7 +385,7 @@ while round_count < configs["MAX_ROUNDS"]:
 
     try:
         logger.info("Thinking about what to do in the next step...")
-        status, rsp = mllm.get_model_response(prompt, [image])
+        status, rsp = mllm.get_model_response(prompt, images)
     except Exception as e:
         logger.error(f"ERROR: Model request failed: {e}")
         logger.info("Retrying this round...")
@@ -379,6 +421,9 @@ while round_count < configs["MAX_ROUNDS"]:
             continue
 
         act_name = res[0]
+        if act_name == "FINISH" and non_interactive:
+            task_complete = True
+            break
         if act_name == "FINISH":
             if configs.get("ENABLE_VOICE", False):
                 from utils import voice_ask
@@ -445,11 +490,12 @@ while round_count < configs["MAX_ROUNDS"]:
                     logger.error("ERROR: text execution failed")
                     continue
 
-                ret = controller.tap(width // 2, height // 10)
-                # Tapping to close the keyboard
-                if ret == "ERROR":
-                    logger.error("ERROR: tap execution failed for keyboard dismissal")
-                    continue
+                if controller.needs_keyboard_dismissal():
+                    ret = controller.tap(width // 2, height // 10)
+                    # Tapping to close the keyboard
+                    if ret == "ERROR":
+                        logger.error("ERROR: tap execution failed for keyboard dismissal")
+                        continue
             except (ValueError, TypeError) as e:
                 logger.error(f"ERROR: Invalid text parameters: {e}")
                 continue
@@ -476,11 +522,12 @@ while round_count < configs["MAX_ROUNDS"]:
                     logger.error("ERROR: text execution failed")
                     continue
 
-                ret = controller.tap(width // 2, height // 10)
-                # Tapping to close the keyboard
-                if ret == "ERROR":
-                    logger.error("ERROR: tap execution failed for keyboard dismissal")
-                    continue
+                if controller.needs_keyboard_dismissal():
+                    ret = controller.tap(width // 2, height // 10)
+                    # Tapping to close the keyboard
+                    if ret == "ERROR":
+                        logger.error("ERROR: tap execution failed for keyboard dismissal")
+                        continue
             except (ValueError, TypeError) as e:
                 logger.error(f"ERROR: Invalid text parameters: {e}")
                 continue
@@ -614,6 +661,10 @@ while round_count < configs["MAX_ROUNDS"]:
         elif act_name == "ask_human":
             # res = ["ask_human", question, last_act]
             _, question = res
+            if non_interactive:
+                # stdin is not a terminal under the scheduler, so the question cannot be answered
+                logger.error(f"ERROR: Human input needed but the task runs non-interactively: {question}")
+                break
             try:
                 if configs.get("ENABLE_VOICE", False):
                     from utils import voice_ask
@@ -638,7 +689,9 @@ while round_count < configs["MAX_ROUNDS"]:
             else:
                 grid_on = False
 
-        time.sleep(configs["REQUEST_INTERVAL"])
+        settle = controller.wait_for_settle()
+        logger.debug(f"Round {round_count}: UI {'settled' if settle.settled else 'not settled'} "
+                     f"after {settle.elapsed_ms:.0f} ms ({settle.probes} probes)")
     else:
         logger.error(rsp)
         break
@@ -649,3 +702,8 @@ elif round_count == configs["MAX_ROUNDS"]:
     logger.info("Task finished due to reaching max rounds")
 else:
     logger.error("Task finished unexpectedly")
+logger.debug(f"Image encode cache: {encode_cache.stats()}")
+
+controller.close()
+if non_interactive:
+    sys.exit(0 if task_complete else 1)
@@ -0,0 +1,82 @@
+"""
+In-memory UI hierarchy dumps.
+
+A UIHierarchy holds a parsed `uiautomator dump` (or any compatible XML) so that
+traverse_tree and collect_interactive_elements can work on it without reading the
+dump back from disk. Writing the XML to the task directory is optional and happens
+on the shared background writer.
+"""
+import os
+import xml.etree.ElementTree as ET
+
+from frame import background_writer
+
+HIERARCHY_END = b"</hierarchy>"
+
+
+class UIHierarchy:
+    """A parsed UI hierarchy plus the raw XML it came from."""
+
+    def __init__(self, root, xml_bytes=None, path=None):
+        self.root = root
+        self.xml_bytes = xml_bytes
+        self.path = path
+        self._save_future = None
+
+    @classmethod
+    def from_bytes(cls, data, path=None):
+        """
+        Parse an XML dump held in memory.
+        Anything after the closing </hierarchy> tag (uiautomator appends a status line when dumping to
+        /dev/tty) is dropped.
+        """
+        end = data.rfind(HIERARCHY_END)
+        if end >= 0:
+            data = data[:end + len(HIERARCHY_END)]
+        return cls(ET.fromstring(data), xml_bytes=data, path=path)
+
+    @classmethod
+    def from_path(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        return cls.from_bytes(data, path=path)
+
+    def save(self, path):
+        """Write the XML to disk and remember the path."""
+        with open(path, "wb") as f:
+            f.write(self.xml_bytes if self.xml_bytes is not None else ET.tostring(self.root))
+        self.path = path
+        return path
+
+    def save_async(self, path):
+        """Write the XML to disk on the background writer thread."""
+        self.path = path
+        self._save_future = background_writer.submit(self.save, path)
+        return self._save_future
+
+    def wait_saved(self, timeout=None):
+        """Block until a pending background save has finished. Returns the saved path."""
+        if self._save_future is not None:
+            self._save_future.result(timeout)
+        return self.path if self.path and os.path.exists(self.path) else None
+
+
+def load_ui_tree(source):
+    """Return the root element for a UIHierarchy, an Element, raw XML bytes or a path to an XML file."""
+    if isinstance(source, UIHierarchy):
+        return source.root
+    if isinstance(source, ET.Element):
+        return source
+    if isinstance(source, (bytes, bytearray)):
+        return UIHierarchy.from_bytes(bytes(source)).root
+    return ET.parse(source).getroot()
+
+
+def iter_with_parent(root):
+    """Yield (element, parent) for every element in document order; the root's parent is None."""
+    stack = [(root, None)]
+    while stack:
+        elem, parent = stack.pop()
+        yield elem, parent
+        for child in reversed(list(elem)):
+            stack.append((child, elem))
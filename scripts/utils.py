@@ -8,6 +8,7 @@ import io
 import base64
 import threading
 import time
+from functools import lru_cache
 
 import os
 import subprocess
@@ -20,7 +21,10 @@ import soundfile as sf
 from skimage.metrics import structural_similarity as ssim
 import numpy as np
 
+from encode_cache import EncodeCache
+from frame import Frame
 from logging_controller import get_logger
+from ui_hierarchy import iter_with_parent, load_ui_tree
 
 from config import load_config
 configs = load_config()
@@ -31,6 +35,8 @@ except Exception as e:
     print(f"ERROR: Failed to load logger configuration: {e}")
     sys.exit(1)
 
+encode_cache = EncodeCache(configs.get("ENCODE_CACHE_SIZE", 64), configs.get("ENCODE_CACHE_DIR") or None)
+
 class AndroidElement:
     def __init__(self, uid, bbox, attrib):
         self.uid = uid
@@ -61,101 +67,210 @@ def area_to_xy(area, subarea, height, width, rows, cols):
         x, y = x_0 + (width // cols) // 2, y_0 + (height // rows) // 2
     return x, y
 
+def read_image(image):
+    """
+    Return a BGR pixel array for a Frame or an image path.
+    Frames are copied so that drawing on the result does not alter the captured screenshot.
+    """
+    if isinstance(image, Frame):
+        return image.image.copy()
+    return cv2.imread(image)
+
+def open_image(image):
+    """Return a PIL image for a Frame or an image path. Frames are wrapped without a PNG round trip."""
+    if isinstance(image, Frame):
+        return Image.fromarray(image.rgb)
+    return Image.open(image)
+
+def grid_shape(width, height, min_cell_px):
+    """Rows and columns of the grid for an image size and minimum cell size."""
+    def clamp(n, lo, hi):
+        return max(lo, min(hi, n))
+
+    return clamp(height // min_cell_px, 1, 100), clamp(width // min_cell_px, 1, 100)
+
+def grid_label_font(unit_width, unit_height):
+    """(font scale, thickness) of the cell numbers for a grid cell size."""
+    return max(0.5, 0.01 * unit_width), max(1, int(max(unit_width, unit_height) // 50))
+
+def grid_label_height(width, height, rows, cols):
+    """Pixel height of the cell numbers render_grid_overlay draws on a width x height image."""
+    font_scale, thick = grid_label_font(max(1, width // cols), max(1, height // rows))
+    return cv2.getTextSize(str(rows * cols), 0, font_scale, thick)[0][1]
+
+def render_grid_overlay(width, height, rows, cols, skip_left_cols=0, skip_right_cols=0):
+    """
+    Draw the grid lines and cell numbers as a coverage mask (text is anti-aliased).
+    Returns (inverse alpha, premultiplied BGR) layers of the image size, ready for blend_overlay.
+    """
+    mask = np.zeros((height, width), dtype=np.uint8)
+    color = (255, 116, 113)
+
+    unit_height = max(1, height // rows)
+    unit_width = max(1, width // cols)
+    font_scale, thick = grid_label_font(unit_width, unit_height)
+
+    for i in range(rows):
+        for j in range(cols):
+            label = i * cols + j + 1
+            left = int(j * unit_width)
+            top = int(i * unit_height)
+            right = int((j + 1) * unit_width)
+            bottom = int((i + 1) * unit_height)
+
+            cv2.rectangle(mask, (left, top), (right, bottom), 255, thick // 2)
+
+            # Skip numbering of the leftmost and rightmost columns
+            if j >= skip_left_cols and j < cols - skip_right_cols:
+                cv2.putText(
+                    mask,
+                    str(label),
+                    (left + int(unit_width * 0.05), top + int(unit_height * 0.3)),
+                    0,
+                    font_scale,
+                    255,
+                    thick,
+                )
+
+    inverse_alpha = cv2.merge([255 - mask] * 3)
+    premultiplied = cv2.merge([cv2.multiply(mask, channel / 255.0, dtype=cv2.CV_8U) for channel in color])
+    inverse_alpha.setflags(write=False)
+    premultiplied.setflags(write=False)
+    return inverse_alpha, premultiplied
+
+def blend_overlay(image, overlay):
+    """Alpha-blend an overlay from render_grid_overlay onto a BGR image in place: two saturating SIMD passes."""
+    inverse_alpha, premultiplied = overlay
+    cv2.multiply(image, inverse_alpha, dst=image, scale=1 / 255.0)
+    cv2.add(image, premultiplied, dst=image)
+    return image
+
+# The overlay depends only on the resolution and grid parameters, so it is drawn once per combination
+grid_overlay = lru_cache(maxsize=4)(render_grid_overlay)
+
+def save_annotated(source, image, output_path):
+    """
+    Write an annotated copy of source to output_path. For a Frame the copy becomes source.annotated and is
+    written in the background, so the round can keep working on the pixels.
+    """
+    if isinstance(source, Frame):
+        source.annotated = Frame(image)
+        source.annotated.save_async(output_path)
+        return source.annotated
+    cv2.imwrite(output_path, image)
+    return image
+
 def draw_grid(img_path, output_path, rows=None, cols=None, min_cell_px=40):
     """
-    Draw a grid on the image.
-    - Dynamically skips numbering of leftmost 2 and rightmost 1 grid columns (device independent).
+    Draw a grid on the image (a path or an in-memory Frame); a Frame's grid image is kept as its `annotated`.
+    - Dynamically skips numbering of the leftmost SKIP_LEFT_COLS and rightmost SKIP_RIGHT_COLS grid columns.
+    The overlay is cached per resolution and grid parameters and blended onto the image in one operation.
     """
     try:
-        def clamp(n, lo, hi):
-            return max(lo, min(hi, n))
-
         min_cell_px = configs.get("GRID_SIZE", 40)
-        image = cv2.imread(img_path)
+        image = read_image(img_path)
         height, width, _ = image.shape
-        color = (255, 116, 113)
 
         if rows is None or cols is None:
-            rows = clamp(height // min_cell_px, 1, 100)
-            cols = clamp(width // min_cell_px, 1, 100)
-
-        unit_height = max(1, height // rows)
-        unit_width = max(1, width // cols)
-        thick = max(1, int(max(unit_width, unit_height) // 50))
-
-        for i in range(rows):
-            for j in range(cols):
-                label = i * cols + j + 1
-                left = int(j * unit_width)
-                top = int(i * unit_height)
-                right = int((j + 1) * unit_width)
-                bottom = int((i + 1) * unit_height)
-                center_x = (left + right) // 2
-
-                cv2.rectangle(image, (left, top), (right, bottom), color, thick // 2)
-
-                skip_left_cols = configs.get("SKIP_LEFT_COLS", 0)
-                skip_right_cols = configs.get("SKIP_RIGHT_COLS", 0)
-
-                # Skip first 2 left columns, last 1 right column
-                if j >= skip_left_cols and j < cols - skip_right_cols:
-                    cv2.putText(
-                        image,
-                        str(label),
-                        (left + int(unit_width * 0.05), top + int(unit_height * 0.3)),
-                        0,
-                        max(0.5, 0.01 * unit_width),
-                        color,
-                        thick,
-                    )
-
-        cv2.imwrite(output_path, image)
+            rows, cols = grid_shape(width, height, min_cell_px)
+
+        blend_overlay(image, grid_overlay(width, height, rows, cols,
+                                          configs.get("SKIP_LEFT_COLS", 0), configs.get("SKIP_RIGHT_COLS", 0)))
+
+        annotated = save_annotated(img_path, image, output_path)
+        if isinstance(annotated, Frame):
+            annotated.grid_label_px = grid_label_height(width, height, rows, cols)
         return rows, cols
     except Exception as e:
         logger.error(f"ERROR in draw_grid: {e}")
         return 0, 0
 
 def encode_image(image_path, max_width=800, quality=75):
+    """
+    Base64 JPEG of an image path or a Frame.
+    A Frame memoizes its own encoding; files are looked up in encode_cache by the hash of their bytes.
+    """
     try:
-        with Image.open(image_path) as img:
-            # Resize proportionally if width is larger than max_width
-            if img.width > max_width:
-                ratio = max_width / float(img.width)
-                new_height = int(float(img.height) * ratio)
-                try:
-                    resample = Image.Resampling.LANCZOS
-                except AttributeError:
-                    # Fallback for older Pillow versions
-                    resample = Image.LANCZOS if hasattr(Image, 'LANCZOS') else Image.ANTIALIAS
-                img = img.resize((max_width, new_height), resample)
-                # img = img.resize((max_width, new_height), Image.ANTIALIAS)
-            # Save to bytes buffer with lower quality
-            # Convert to RGB if necessary (some PNGs have RGBA which JPEG doesn't support)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                # Create a white background
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-
-            buffered = io.BytesIO()
-            img.save(buffered, format="JPEG", quality=quality)
-            # Encode base64 string
-            img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-            return img_str
+        if isinstance(image_path, Frame):
+            return image_path.jpeg_base64(max_width, quality)
+        with open(image_path, "rb") as f:
+            data = f.read()
+        return encode_cache.get_or_encode(data, max_width, quality,
+                                          lambda: _encode_image_bytes(data, max_width, quality))
     except Exception as e:
         logger.error(f"ERROR in encode_image: {e}")
         return ""
 
+def _encode_image_bytes(data, max_width, quality):
+    with Image.open(io.BytesIO(data)) as img:
+        # Resize proportionally if width is larger than max_width
+        if img.width > max_width:
+            ratio = max_width / float(img.width)
+            new_height = int(float(img.height) * ratio)
+            try:
+                resample = Image.Resampling.LANCZOS
+            except AttributeError:
+                # Fallback for older Pillow versions
+                resample = Image.LANCZOS if hasattr(Image, 'LANCZOS') else Image.ANTIALIAS
+            img = img.resize((max_width, new_height), resample)
+            # img = img.resize((max_width, new_height), Image.ANTIALIAS)
+        # Save to bytes buffer with lower quality
+        # Convert to RGB if necessary (some PNGs have RGBA which JPEG doesn't support)
+        if img.mode in ('RGBA', 'LA', 'P'):
+            # Create a white background
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            if img.mode == 'P':
+                img = img.convert('RGBA')
+            background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+            img = background
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        buffered = io.BytesIO()
+        img.save(buffered, format="JPEG", quality=quality)
+        # Encode base64 string
+        img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
+        return img_str
+
+def similarity_features(image):
+    """
+    dHash and average hash (64 bits each) of an 8x8 grayscale thumbnail, as 16 packed bytes.
+    Frames memoize them, so the previous round's features are never recomputed.
+    """
+    if isinstance(image, Frame):
+        return image.derived("similarity_features", lambda: similarity_features(image.image))
+    if isinstance(image, str):
+        image = cv2.imread(image)
+    # Subsample before the area resize so the cost does not grow with the resolution
+    step = max(1, min(image.shape[0], image.shape[1]) // 64)
+    small = cv2.cvtColor(np.ascontiguousarray(image[::step, ::step]), cv2.COLOR_BGR2GRAY)
+    thumbnail = cv2.resize(small, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    difference_hash = np.packbits(thumbnail[:, 1:] > thumbnail[:, :-1])
+    average = thumbnail[:, :8]
+    average_hash = np.packbits(average > average.mean())
+    return np.concatenate([difference_hash, average_hash])
+
+def hash_distance(features1, features2):
+    """Number of differing bits (0-128) between two similarity_features."""
+    return int(np.unpackbits(np.bitwise_xor(features1, features2)).sum())
+
+# Returned by calculate_image_similarity when the hash prefilter finds two screens clearly different
+CLEARLY_DIFFERENT = 0.0
+
 def calculate_image_similarity(img_path1, img_path2):
+    """
+    Structural similarity (SSIM, 0-1) of two images (paths or Frames).
+    For two Frames perceptual hashes are compared first: screens whose hashes differ by more than
+    SIMILARITY_HASH_DISTANCE bits are clearly different and get CLEARLY_DIFFERENT (0.0) without running SSIM,
+    so only close calls pay for SSIM and any score above 0 is a real SSIM value.
+    """
     def load_image_as_gray(image_path, max_width=800):
-        if not image_path:
+        if image_path is None or isinstance(image_path, str) and not image_path:
             return None
         try:
-            with Image.open(image_path) as img:
+            if isinstance(image_path, Frame):
+                return image_path.gray(max_width)
+            with open_image(image_path) as img:
                 if img.width > max_width:
                     ratio = max_width / float(img.width)
                     new_height = int(float(img.height) * ratio)
@@ -167,6 +282,11 @@ def calculate_image_similarity(img_path1, img_path2):
             return None
 
     try:
+        if isinstance(img_path1, Frame) and isinstance(img_path2, Frame):
+            distance = hash_distance(similarity_features(img_path1), similarity_features(img_path2))
+            if distance > configs.get("SIMILARITY_HASH_DISTANCE", 6):
+                return CLEARLY_DIFFERENT
+
         img1 = load_image_as_gray(img_path1)
         img2 = load_image_as_gray(img_path2)
 
@@ -176,17 +296,20 @@ def calculate_image_similarity(img_path1, img_path2):
         if img1 is None or img2 is None:
             return 0.0  # One missing, dissimilar
 
-        # Resize for dimension compatibility
-        min_height = min(img1.shape[0], img2.shape[0])
-        min_width = min(img1.shape[1], img2.shape[1])
-        _resample = getattr(getattr(Image, "Resampling", Image), "LANCZOS", Image.LANCZOS if hasattr(Image, "LANCZOS") else Image.BICUBIC)
-        img1_resized = Image.fromarray(img1).resize((min_width, min_height), _resample)
-        img2_resized = Image.fromarray(img2).resize((min_width, min_height), _resample)
+        if img1.shape == img2.shape:
+            img1_array, img2_array = img1, img2
+        else:
+            # Resize for dimension compatibility
+            min_height = min(img1.shape[0], img2.shape[0])
+            min_width = min(img1.shape[1], img2.shape[1])
+            _resample = getattr(getattr(Image, "Resampling", Image), "LANCZOS", Image.LANCZOS if hasattr(Image, "LANCZOS") else Image.BICUBIC)
+            img1_resized = Image.fromarray(img1).resize((min_width, min_height), _resample)
+            img2_resized = Image.fromarray(img2).resize((min_width, min_height), _resample)
 
-        img1_array = np.array(img1_resized)
-        img2_array = np.array(img2_resized)
+            img1_array = np.array(img1_resized)
+            img2_array = np.array(img2_resized)
 
-        score, _ = ssim(img1_array, img2_array, full=True)
+        score = ssim(img1_array, img2_array)
         return score
     except Exception as e:
         logger.error(f"ERROR computing similarity: {e}")
@@ -207,86 +330,79 @@ def get_id_from_element(elem):
     return elem_id
 
 def traverse_tree(xml_path, elem_list, attrib, add_index=False):
-    path = []
-    for event, elem in ET.iterparse(xml_path, ['start', 'end']):
-        if event == 'start':
-            path.append(elem)
-            if attrib in elem.attrib and elem.attrib[attrib] == "true":
-                parent_prefix = ""
-                if len(path) > 1:
-                    parent_prefix = get_id_from_element(path[-2])
-                bounds = elem.attrib["bounds"][1:-1].split("][")
-                x1, y1 = map(int, bounds[0].split(","))
-                x2, y2 = map(int, bounds[1].split(","))
-                center = (x1 + x2) // 2, (y1 + y2) // 2
-                elem_id = get_id_from_element(elem)
-                if parent_prefix:
-                    elem_id = parent_prefix + "_" + elem_id
-                if add_index:
-                    elem_id += f"_{elem.attrib['index']}"
-                close = False
-                for e in elem_list:
-                    bbox = e.bbox
-                    center_ = (bbox[0][0] + bbox[1][0]) // 2, (bbox[0][1] + bbox[1][1]) // 2
-                    dist = (abs(center[0] - center_[0]) ** 2 + abs(center[1] - center_[1]) ** 2) ** 0.5
-                    if dist <= configs["MIN_DIST"]:
-                        close = True
-                        break
-                if not close:
-                    elem_list.append(AndroidElement(elem_id, ((x1, y1), (x2, y2)), attrib))
-
-        if event == 'end':
-            path.pop()
+    """
+    Collect elements whose `attrib` is "true" into elem_list.
+    xml_path may be a path, raw XML bytes, a UIHierarchy or a parsed root element.
+    """
+    for elem, parent in iter_with_parent(load_ui_tree(xml_path)):
+        if attrib in elem.attrib and elem.attrib[attrib] == "true":
+            parent_prefix = ""
+            if parent is not None:
+                parent_prefix = get_id_from_element(parent)
+            bounds = elem.attrib["bounds"][1:-1].split("][")
+            x1, y1 = map(int, bounds[0].split(","))
+            x2, y2 = map(int, bounds[1].split(","))
+            center = (x1 + x2) // 2, (y1 + y2) // 2
+            elem_id = get_id_from_element(elem)
+            if parent_prefix:
+                elem_id = parent_prefix + "_" + elem_id
+            if add_index:
+                elem_id += f"_{elem.attrib['index']}"
+            close = False
+            for e in elem_list:
+                bbox = e.bbox
+                center_ = (bbox[0][0] + bbox[1][0]) // 2, (bbox[0][1] + bbox[1][1]) // 2
+                dist = (abs(center[0] - center_[0]) ** 2 + abs(center[1] - center_[1]) ** 2) ** 0.5
+                if dist <= configs["MIN_DIST"]:
+                    close = True
+                    break
+            if not close:
+                elem_list.append(AndroidElement(elem_id, ((x1, y1), (x2, y2)), attrib))
 
 def collect_interactive_elements(xml_path, min_area=2000, iou_thresh=0.6):
+    """xml_path may be a path, raw XML bytes, a UIHierarchy or a parsed root element."""
     elems = []
-    path = []
     # Gather all nodes first so we can apply heuristics after traversal
-    for event, elem in ET.iterparse(xml_path, ['start', 'end']):
-        if event == 'start':
-            path.append(elem)
-            try:
-                bounds = elem.attrib.get("bounds")
-                if not bounds:
-                    continue
-                b = bounds[1:-1].split("][")
-                x1, y1 = map(int, b[0].split(","))
-                x2, y2 = map(int, b[1].split(","))
-                w, h = x2 - x1, y2 - y1
-                area = w * h
-                if area < min_area:
-                    continue
-
-                # Heuristics for “interactive”
-                clickable = elem.attrib.get("clickable") == "true"
-                focusable = elem.attrib.get("focusable") == "true"
-                long_clickable = elem.attrib.get("long-clickable") == "true"
-                scrollable = elem.attrib.get("scrollable") == "true"
-                has_id = bool(elem.attrib.get("resource-id"))
-                has_desc = bool(elem.attrib.get("content-desc"))
-
-                is_interactive = clickable or focusable or long_clickable or scrollable or has_id or has_desc
-                if not is_interactive:
-                    continue
-
-                # Prefer labeling by parent context when available
-                parent_prefix = ""
-                if len(path) > 1:
-                    parent_prefix = get_id_from_element(path[-2])
-
-                elem_id = get_id_from_element(elem)
-                if parent_prefix:
-                    elem_id = parent_prefix + "_" + elem_id
-
-                # attribute tag for coloring in draw
-                attrib_tag = "clickable" if clickable else ("focusable" if focusable else ("scrollable" if scrollable else "long_clickable"))
-
-                elems.append(AndroidElement(elem_id, ((x1, y1), (x2, y2)), attrib_tag))
-            except Exception:
-                pass
-
-        elif event == 'end':
-            path.pop()
+    for elem, parent in iter_with_parent(load_ui_tree(xml_path)):
+        try:
+            bounds = elem.attrib.get("bounds")
+            if not bounds:
+                continue
+            b = bounds[1:-1].split("][")
+            x1, y1 = map(int, b[0].split(","))
+            x2, y2 = map(int, b[1].split(","))
+            w, h = x2 - x1, y2 - y1
+            area = w * h
+            if area < min_area:
+                continue
+
+            # Heuristics for “interactive”
+            clickable = elem.attrib.get("clickable") == "true"
+            focusable = elem.attrib.get("focusable") == "true"
+            long_clickable = elem.attrib.get("long-clickable") == "true"
+            scrollable = elem.attrib.get("scrollable") == "true"
+            has_id = bool(elem.attrib.get("resource-id"))
+            has_desc = bool(elem.attrib.get("content-desc"))
+
+            is_interactive = clickable or focusable or long_clickable or scrollable or has_id or has_desc
+            if not is_interactive:
+                continue
+
+            # Prefer labeling by parent context when available
+            parent_prefix = ""
+            if parent is not None:
+                parent_prefix = get_id_from_element(parent)
+
+            elem_id = get_id_from_element(elem)
+            if parent_prefix:
+                elem_id = parent_prefix + "_" + elem_id
+
+            # attribute tag for coloring in draw
+            attrib_tag = "clickable" if clickable else ("focusable" if focusable else ("scrollable" if scrollable else "long_clickable"))
+
+            elems.append(AndroidElement(elem_id, ((x1, y1), (x2, y2)), attrib_tag))
+        except Exception:
+            pass
 
     # De-duplicate by IoU to keep distinct tiles
     def iou(a, b):
@@ -312,15 +428,24 @@ def collect_interactive_elements(xml_path, min_area=2000, iou_thresh=0.6):
             merged.append(e)
     return merged
 
-def draw_bbox_multi(img_path, output_path, elem_list, record_mode=False, dark_mode=False):
-    imgcv = cv2.imread(img_path)
+def draw_bbox_multi(img_path, output_path, elem_list, record_mode=False, dark_mode=False, device_size=None):
+    """
+    device_size: (width, height) of the coordinate space of the bounding boxes when it differs from the
+    screenshot's pixels (iOS points, see get_bbox_space_size); the boxes are scaled onto the image.
+    None for pixel bounds, which are drawn as they are.
+    A Frame's labeled image is kept as its `annotated`.
+    """
+    imgcv = read_image(img_path)
+    scale_x = scale_y = 1
+    if device_size and device_size[0] and device_size[1]:
+        scale_x, scale_y = imgcv.shape[1] / device_size[0], imgcv.shape[0] / device_size[1]
     count = 1
     for elem in elem_list:
         try:
             top_left = elem.bbox[0]
             bottom_right = elem.bbox[1]
-            left, top = top_left[0], top_left[1]
-            right, bottom = bottom_right[0], bottom_right[1]
+            left, top = int(top_left[0] * scale_x), int(top_left[1] * scale_y)
+            right, bottom = int(bottom_right[0] * scale_x), int(bottom_right[1] * scale_y)
             label = str(count)
             if record_mode:
                 if elem.attrib == "clickable":
@@ -341,7 +466,7 @@ def draw_bbox_multi(img_path, output_path, elem_list, record_mode=False, dark_mo
         except Exception as e:
             logger.error(f"ERROR: An exception occurs while labeling the image\n{e}")
         count += 1
-    cv2.imwrite(output_path, imgcv)
+    save_annotated(img_path, imgcv, output_path)
     return imgcv
 
 _speak_lock = threading.Lock()